@@ -0,0 +1,88 @@
+"""
+Compares the two ways GET /model can produce its JSON body for a large synthetic model:
+
+- pydantic: ShopModel built from serialize_model_object_attribute, FastAPI response_model validation, jsonable_encoder and json.dumps (the old path)
+- fast: interface.get_model_dict and fastjson.dumps (the path used by GET /model)
+
+Run from the root of the repo:
+
+    python -m benchmarks.json_response --objects 200 --hours 8760
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import core.interface as interface
+from core import fastjson
+from core.workers import create_shop_session
+from core.schemas import ShopModel, ObjectTypeModel, TimeResolution, TimeSeries, Curve, ObjectInstance, serialize_model_object_attribute
+
+
+def build_model(shop, objects: int, hours: int):
+    start = pd.Timestamp('2021-01-01T00:00:00Z')
+    interface.set_time_resolution(shop, TimeResolution(start_time=start, end_time=start + pd.Timedelta(hours=hours), time_unit='hour'))
+    rng = np.random.default_rng(42)
+    for i in range(objects):
+        interface.set_model_object_instance(shop, 'reservoir', f'Reservoir{i}', ObjectInstance(attributes={
+            'max_vol': 100.0,
+            'vol_head': Curve(x_values=[0.0, 50.0, 100.0], y_values=[90.0, 95.0, 100.0]),
+            'inflow': TimeSeries(start=start, step=3600, values=[rng.random(hours).tolist()]),
+        }))
+
+
+def pydantic_model(shop) -> ShopModel:
+    # the pydantic models GET /model used to build before get_model_dict
+    selection = interface.select_model_attributes(shop, isInput=True)
+    return ShopModel(model=ObjectTypeModel(**{
+        ot: {on: {attr: serialize_model_object_attribute(shop, ot, on, attr, False) for attr in attributes} for on, attributes in objects.items()}
+        for ot, objects in selection.items()
+    }))
+
+
+def pydantic_path(shop) -> bytes:
+    model = pydantic_model(shop)
+    field = create_response_field(name='bench', type_=ShopModel)
+    content = asyncio.run(serialize_response(field=field, response_content=model, exclude_unset=True, exclude_none=True))
+    return json.dumps(content, ensure_ascii=False, allow_nan=True, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(shop) -> bytes:
+    return fastjson.dumps(interface.get_model_dict(shop, isInput=True))
+
+
+def measure(func, shop, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = func(shop)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, default=200, help='number of reservoirs in the model')
+    parser.add_argument('--hours', type=int, default=8760, help='length of the time series')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    shop = create_shop_session(1, 'benchmark')
+    build_model(shop, args.objects, args.hours)
+
+    print(f'{args.objects} reservoirs, {args.hours} hours, orjson {"enabled" if fastjson.orjson is not None else "not installed"}')
+    results = {name: measure(func, shop, args.repeat) for name, func in [('pydantic', pydantic_path), ('fast', fast_path)]}
+    for name, (seconds, size) in results.items():
+        print(f'{name:>10}: {seconds * 1000:9.1f} ms  {size / 1e6:8.1f} MB')
+    print(f'   speedup: {results["pydantic"][0] / results["fast"][0]:9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
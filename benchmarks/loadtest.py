@@ -0,0 +1,219 @@
+"""
+Load test of the ASGI app (main.app) with many concurrent clients, reporting requests/s and latency percentiles per endpoint.
+
+Every client repeats the session lifecycle of examples/basic_rest.py on a generated watercourse
+(see benchmarks/watercourse.py): create a session, set the time resolution, upload the objects and connections,
+run start_sim / set_code incremental / start_sim, read the market and plant results and delete the session.
+
+Requests are sent to the app in the same process and event loop, without sockets, so the numbers show what one
+restshop process can serve. By default sessions use the stand-in ShopSession (benchmarks/standin.py), so the test
+runs offline, --solve-seconds emulates the time of a solve. Use --shop to run against SHOP.
+
+Run from the root of the repo:
+
+    python -m benchmarks.loadtest --clients 50 --iterations 4
+    RESTSHOP_SESSION_BACKEND=process python -m benchmarks.loadtest --clients 50 --solve-seconds 0.5
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from urllib.parse import urlencode
+
+STANDIN = 'benchmarks.standin:ShopSession'
+
+
+class AsgiClient:
+
+    """
+        Sends one request at a time to an ASGI app and returns (status, body), which is all the load test needs.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, params: Dict[str, Any] = None, json_body: Any = None, headers: Dict[str, str] = None) -> Tuple[int, bytes]:
+        body = json.dumps(json_body).encode() if json_body is not None else b''
+        raw_headers = [(b'host', b'restshop')] + [(k.lower().encode(), str(v).encode()) for k, v in (headers or {}).items()]
+        if json_body is not None:
+            raw_headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': urlencode(params or {}).encode(),
+            'root_path': '',
+            'headers': raw_headers,
+            'client': ('127.0.0.1', 50000),
+            'server': ('restshop', 80),
+        }
+
+        request_sent = False
+        response_complete = asyncio.Event()
+        status = [500]
+        chunks: List[bytes] = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await response_complete.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body', False):
+                    response_complete.set()
+
+        await self.app(scope, receive, send)
+        return status[0], b''.join(chunks)
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.first_error: Dict[str, str] = {}
+
+    async def call(self, client: AsgiClient, endpoint: str, method: str, path: str, **kwargs) -> Optional[bytes]:
+        start = time.perf_counter()
+        try:
+            status, body = await client.request(method, path, **kwargs)
+        except Exception as e:
+            status, body = 599, str(e).encode()
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        if status >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            self.first_error.setdefault(endpoint, f'{status} {body[:300].decode(errors="replace")}')
+            return None
+        return body
+
+
+async def session_lifecycle(client: AsgiClient, recorder: Recorder, watercourse: Dict[str, Any]):
+    body = await recorder.call(client, 'POST /session', 'POST', '/session')
+    if body is None:
+        return
+    session_id = json.loads(body)['session_id']
+    headers = {'session-id': session_id}
+
+    await recorder.call(client, 'PUT /time_resolution', 'PUT', '/time_resolution', json_body=watercourse['time'], headers=headers)
+    for object_type, objects in watercourse['model'].items():
+        for object_name, attributes in objects.items():
+            await recorder.call(client, 'PUT /model/{object_type}', 'PUT', f'/model/{object_type}',
+                params={'object_name': object_name}, json_body={'attributes': attributes}, headers=headers)
+    await recorder.call(client, 'PUT /connections', 'PUT', '/connections', json_body=watercourse['connections'], headers=headers)
+
+    for command, args in [('start_sim', {'options': [], 'values': ['3']}), ('set_code', {'options': ['incremental'], 'values': []}), ('start_sim', {'options': [], 'values': ['3']})]:
+        await recorder.call(client, 'POST /simulation/{command}', 'POST', f'/simulation/{command}', json_body=args, headers=headers)
+
+    await recorder.call(client, 'GET /model/{object_type}', 'GET', '/model/market', params={'object_name': 'Day_ahead'}, headers=headers)
+    for plant in watercourse['model']['plant']:
+        await recorder.call(client, 'GET /model/{object_type}', 'GET', '/model/plant', params={'object_name': plant}, headers=headers)
+
+    await recorder.call(client, 'DELETE /session', 'DELETE', '/session', params={'session_id': session_id})
+
+
+async def run_clients(app, clients: int, iterations: int, watercourse: Dict[str, Any]) -> Tuple[Recorder, float]:
+    client = AsgiClient(app)
+    recorder = Recorder()
+
+    async def run_client():
+        for _ in range(iterations):
+            await session_lifecycle(client, recorder, watercourse)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    return recorder, time.perf_counter() - start
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    # nearest rank
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder, seconds: float) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    everything = []
+    for endpoint, latencies in recorder.latencies.items():
+        everything += latencies
+        summary[endpoint] = _stats(sorted(latencies), recorder.errors.get(endpoint, 0), seconds)
+    summary['total'] = _stats(sorted(everything), sum(recorder.errors.values()), seconds)
+    return summary
+
+
+def _stats(latencies: List[float], errors: int, seconds: float) -> Dict[str, float]:
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': len(latencies) / seconds,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def print_summary(summary: Dict[str, Dict[str, float]]):
+    print(f'{"endpoint":<28} {"requests":>8} {"errors":>6} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for endpoint, stats in summary.items():
+        print(
+            f'{endpoint:<28} {stats["requests"]:>8} {stats["errors"]:>6} {stats["requests_per_second"]:>9.1f} '
+            f'{stats["p50_ms"]:>9.1f} {stats["p95_ms"]:>9.1f} {stats["p99_ms"]:>9.1f} {stats["max_ms"]:>9.1f}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=50, help='concurrent clients')
+    parser.add_argument('--iterations', type=int, default=2, help='session lifecycles per client')
+    parser.add_argument('--reservoirs', type=int, default=2, help='reservoirs in the watercourse of every session')
+    parser.add_argument('--steps', type=int, default=24, help='hourly time steps')
+    parser.add_argument('--solve-seconds', type=float, default=0.0, help='time of start_sim in the stand-in')
+    parser.add_argument('--shop', action='store_true', help='use pyshop.ShopSession instead of the stand-in')
+    parser.add_argument('--output', help='write the summary to this JSON file')
+    args = parser.parse_args()
+
+    if not args.shop:
+        os.environ['RESTSHOP_SHOP_SESSION_CLASS'] = STANDIN
+        os.environ['STANDIN_SOLVE_SECONDS'] = str(args.solve_seconds)
+
+    # imported here, so that the environment above is read by restshop
+    import main as restshop
+    from core import config
+    from benchmarks.watercourse import generate_watercourse
+
+    watercourse = generate_watercourse(args.reservoirs, args.steps)
+    print(
+        f'{args.clients} clients x {args.iterations} sessions, {args.reservoirs} reservoirs, {args.steps} steps, '
+        f'{config.SESSION_BACKEND} sessions ({os.environ.get("RESTSHOP_SHOP_SESSION_CLASS") or "pyshop.ShopSession"})'
+    )
+
+    recorder, seconds = asyncio.run(run_clients(restshop.app, args.clients, args.iterations, watercourse))
+    summary = summarize(recorder, seconds)
+    print(f'{summary["total"]["requests"]} requests in {seconds:.2f} s\n')
+    print_summary(summary)
+    for endpoint, error in recorder.first_error.items():
+        print(f'\nfirst error of {endpoint}: {error}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'clients': args.clients, 'iterations': args.iterations, 'seconds': seconds, 'endpoints': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares the two ways time series and curves are written into and read from a session:
+
+- pyshop: pandas objects that pyshop takes apart again for the shop_api setters (RESTSHOP_RAW_ARRAY_WRITES=0),
+  and builds from the shop_api getters (RESTSHOP_RAW_ARRAY_READS=0)
+- raw: numpy arrays handed straight to shop_api.SetTxySeries / SetXyCurve / SetXyCurveArray, and read from
+  GetTxySeries* / GetXyCurve* / GetXyCurveArray* (the default)
+
+The values are parsed into pydantic models first, like PUT /model does, and only the setters are timed.
+Reads are timed up to the JSON ready data of GET /model (encode_model_object_attribute), without the JSON encoding.
+Runs against the stand-in ShopSession unless --shop is given. Run from the root of the repo:
+
+    python -m benchmarks.raw_writes --objects 200 --steps 8760
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+STANDIN = 'benchmarks.standin:ShopSession'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, default=200, help='number of reservoirs written')
+    parser.add_argument('--steps', type=int, default=8760, help='hourly time steps of every time series')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--shop', action='store_true', help='use pyshop.ShopSession instead of the stand-in')
+    args = parser.parse_args()
+
+    if not args.shop:
+        os.environ['RESTSHOP_SHOP_SESSION_CLASS'] = STANDIN
+
+    # imported here, so that the environment above is read by restshop
+    import core.interface as interface
+    from core import config
+    from core.schemas import TimeResolution, TimeSeries, Curve, encode_model_object_attribute
+    from core.workers import create_shop_session
+    from benchmarks.watercourse import generate_watercourse, START_TIME
+
+    body = generate_watercourse(args.objects, args.steps)
+    reservoirs = body['model']['reservoir']
+    values = {
+        'txy': [TimeSeries(**attributes['inflow']) for attributes in reservoirs.values()],
+        'xy': [Curve(**attributes['vol_head']) for attributes in reservoirs.values()],
+        'xy_array': [{float(ref): Curve(**curve) for ref, curve in attributes['water_value_input'].items()} for attributes in reservoirs.values()],
+    }
+    attribute_names = {'txy': 'inflow', 'xy': 'vol_head', 'xy_array': 'water_value_input'}
+
+    shop = create_shop_session(1, 'benchmark')
+    interface.set_time_resolution(shop, TimeResolution(**body['time']))
+    for object_name in reservoirs:
+        shop.model.reservoir.add_object(object_name)
+
+    print(f'{args.objects} reservoirs, {args.steps} time steps, {os.environ.get("RESTSHOP_SHOP_SESSION_CLASS") or "pyshop.ShopSession"}')
+    print(f'{"datatype":>10} {"":>6} {"pyshop us":>12} {"raw us":>12} {"speedup":>8}')
+    for datatype, datatype_values in values.items():
+        setter = interface.set_datatype(datatype)
+        attribute_name = attribute_names[datatype]
+
+        def write():
+            for object_name, value in zip(reservoirs, datatype_values):
+                setter(shop, 'reservoir', object_name, attribute_name, value)
+
+        def read():
+            for object_name in reservoirs:
+                encode_model_object_attribute(shop, 'reservoir', object_name, attribute_name, False)
+
+        for operation, flag, func in [('write', 'RAW_ARRAY_WRITES', write), ('read', 'RAW_ARRAY_READS', read)]:
+            per_attribute = {}
+            for raw in (False, True):
+                setattr(config, flag, raw)
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    func()
+                    timings.append((time.perf_counter() - start) / len(datatype_values))
+                per_attribute[raw] = statistics.median(timings)
+            print(f'{datatype:>10} {operation:>6} {per_attribute[False] * 1e6:12.1f} {per_attribute[True] * 1e6:12.1f} {per_attribute[False] / per_attribute[True]:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""
+In-process stand-in for pyshop.ShopSession, for benchmarks and load tests on machines without SHOP binaries.
+
+It implements the subset of the pyshop API that restshop uses (model objects and attributes, connections,
+time resolution, commands and the shop_api metadata calls) for reservoirs, plants, generators and markets.
+Values are stored as pandas objects, so reads and writes cost about what the pandas conversions in pyshop cost,
+but nothing is optimized: `start sim` only writes flat results.
+
+Select it with
+
+    RESTSHOP_SHOP_SESSION_CLASS=benchmarks.standin:ShopSession
+
+pyshop itself still has to be installed, restshop imports its helpers.
+"""
+
+from typing import Any, Dict, List, Tuple
+from datetime import datetime
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# object type -> attribute -> (datatype, is_input, is_output, x_unit, y_unit)
+CATALOG: Dict[str, Dict[str, Tuple[str, bool, bool, str, str]]] = {
+    'reservoir': {
+        'max_vol': ('double', True, False, 'NO_UNIT', 'MM3'),
+        'lrl': ('double', True, False, 'NO_UNIT', 'METER'),
+        'hrl': ('double', True, False, 'NO_UNIT', 'METER'),
+        'start_head': ('double', True, False, 'NO_UNIT', 'METER'),
+        'energy_value_input': ('double', True, False, 'NO_UNIT', 'NOK/MWH'),
+        'vol_head': ('xy', True, False, 'MM3', 'METER'),
+        'flow_descr': ('xy', True, False, 'METER', 'M3/S'),
+        'water_value_input': ('xy_array', True, False, 'MM3', 'NOK/MM3'),
+        'inflow': ('txy', True, False, 'NO_UNIT', 'M3/S'),
+        'storage': ('txy', False, True, 'NO_UNIT', 'MM3'),
+        'head': ('txy', False, True, 'NO_UNIT', 'METER'),
+    },
+    'plant': {
+        'outlet_line': ('double', True, False, 'NO_UNIT', 'METER'),
+        'main_loss': ('double_array', True, False, 'NO_UNIT', 'S2/M5'),
+        'penstock_loss': ('double_array', True, False, 'NO_UNIT', 'S2/M5'),
+        'production': ('txy', False, True, 'NO_UNIT', 'MW'),
+        'discharge': ('txy', False, True, 'NO_UNIT', 'M3/S'),
+    },
+    'generator': {
+        'penstock': ('int', True, False, 'NO_UNIT', 'NO_UNIT'),
+        'p_min': ('double', True, False, 'NO_UNIT', 'MW'),
+        'p_max': ('double', True, False, 'NO_UNIT', 'MW'),
+        'p_nom': ('double', True, False, 'NO_UNIT', 'MW'),
+        'startcost': ('txy', True, False, 'NO_UNIT', 'NOK'),
+        'gen_eff_curve': ('xy', True, False, 'MW', '%'),
+        'turb_eff_curves': ('xy_array', True, False, 'M3/S', '%'),
+        'production': ('txy', False, True, 'NO_UNIT', 'MW'),
+    },
+    'market': {
+        'sale_price': ('txy', True, False, 'NO_UNIT', 'NOK/MWH'),
+        'buy_price': ('txy', True, False, 'NO_UNIT', 'NOK/MWH'),
+        'max_buy': ('txy', True, False, 'NO_UNIT', 'MW'),
+        'max_sale': ('txy', True, False, 'NO_UNIT', 'MW'),
+        'sale': ('txy', False, True, 'NO_UNIT', 'MW'),
+    },
+    'scenario': {
+        'probability': ('txy', True, False, 'NO_UNIT', 'NO_UNIT'),
+    },
+    'objective': {
+        'grand_total': ('double', False, True, 'NO_UNIT', 'NOK'),
+    },
+}
+
+INFO_KEYS = [
+    'datatype', 'isInput', 'isOutput', 'xUnit', 'yUnit', 'licenseName', 'fullName', 'dataFuncName',
+    'description', 'documentationUrl', 'exampleUrlPrefix', 'example'
+]
+
+RELATION_TYPES = ['connection_standard', 'connection_bypass', 'connection_spill']
+
+COMMANDS = {
+    'start_sim': 'start sim',
+    'set_code': 'set code',
+    'set_time_delay_unit': 'set time_delay_unit',
+    'print_model': 'print model',
+}
+
+# seconds `start sim` sleeps, to emulate a solver in load tests
+SOLVE_SECONDS = float(os.environ.get('STANDIN_SOLVE_SECONDS', '0'))
+
+_TIME_UNITS = {'hour': 'h', 'minute': 'min', 'second': 's'}
+
+
+class ShopApi:
+
+    """
+        The shop_api of a session: holds all values, plus the metadata calls restshop reads at startup.
+    """
+
+    def __init__(self):
+        self._objects: Dict[str, Dict[str, Dict[str, Any]]] = {object_type: {} for object_type in CATALOG}
+        self._objects['objective']['average_objective'] = {}
+        self._objects['scenario']['S1'] = {}
+        self._relations: List[Tuple[str, str, str, str, str]] = [] # (from type, from name, to type, to name, relation type)
+        self._start: pd.Timestamp = None
+        self._end: pd.Timestamp = None
+        self._unit: str = 'hour'
+        self._executed: List[str] = []
+        self._callback = None
+
+    # metadata
+
+    def GetObjectTypeNames(self) -> List[str]:
+        return list(CATALOG)
+
+    def GetObjectTypeAttributeNames(self, object_type: str) -> List[str]:
+        return list(CATALOG[object_type])
+
+    def GetObjectTypeAttributeDatatypes(self, object_type: str) -> List[str]:
+        return [info[0] for info in CATALOG[object_type].values()]
+
+    def GetValidAttributeInfoKeys(self) -> List[str]:
+        return list(INFO_KEYS)
+
+    def GetValidRelationTypes(self, object_type: str) -> List[str]:
+        return list(RELATION_TYPES)
+
+    def GetAttributeInfo(self, object_type: str, attribute_name: str, key: str) -> Any:
+        datatype, is_input, is_output, x_unit, y_unit = CATALOG[object_type][attribute_name]
+        info = {'datatype': datatype, 'isInput': is_input, 'isOutput': is_output, 'xUnit': x_unit, 'yUnit': y_unit}
+        return info.get(key, f'{key} of {attribute_name}')
+
+    def GetVersionString(self) -> str:
+        return 'standin'
+
+    # session
+
+    def RegisterCallback(self, callback, callback_id):
+        self._callback = (callback, callback_id)
+
+    def GetStartTime(self) -> str:
+        return self._start.strftime('%Y%m%d%H%M%S')
+
+    def GetEndTime(self) -> str:
+        return self._end.strftime('%Y%m%d%H%M%S')
+
+    def GetTimeUnit(self) -> str:
+        return self._unit
+
+    def GetTimeZone(self) -> str:
+        # pyshop sets the time zone of a tz-aware start time, times are wall-clock times in it
+        return str(self._start.tz) if self._start is not None and self._start.tz is not None else ''
+
+    def GetTimeResolutionT(self) -> np.ndarray:
+        return np.zeros(1, dtype=np.int64)
+
+    def GetTimeResolutionY(self) -> np.ndarray:
+        return np.ones(1, dtype=float)
+
+    def ExecuteCommand(self, command: str, options: List[str], values: List[str]) -> bool:
+        self._executed.append(' '.join([command] + [f'/{option}' for option in options] + list(values)))
+        if self._callback:
+            self._callback[0](f'executing {command}', 'INFO', self._callback[1])
+        if command == 'start sim':
+            time.sleep(SOLVE_SECONDS)
+            self._solve()
+        return True
+
+    # raw setters, offsets are time units from start_time (YYYYMMDDHHMMSS), values are time steps x scenarios
+
+    def SetTxySeries(self, object_type: str, object_name: str, attribute_name: str, start_time: str, offsets, values):
+        start = pd.Timestamp(datetime.strptime(start_time, '%Y%m%d%H%M%S'))
+        if self._start is not None and self._start.tz is not None:
+            start = start.tz_localize(self._start.tz)
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        index = pd.DatetimeIndex(start.value + np.asarray(offsets, dtype=np.int64) * self._delta().value, tz=start.tz)
+        self._objects[object_type][object_name][attribute_name] = pd.DataFrame(values, index=index)
+
+    def SetXyCurve(self, object_type: str, object_name: str, attribute_name: str, reference: float, x, y):
+        self._objects[object_type][object_name][attribute_name] = pd.Series(np.asarray(y, dtype=float), index=np.asarray(x, dtype=float), name=float(reference))
+
+    def SetXyCurveArray(self, object_type: str, object_name: str, attribute_name: str, references, points, x, y):
+        curves, offset = [], 0
+        for reference, n in zip(references, points):
+            n = int(n)
+            curves.append(pd.Series(np.asarray(y[offset:offset + n], dtype=float), index=np.asarray(x[offset:offset + n], dtype=float), name=float(reference)))
+            offset += n
+        self._objects[object_type][object_name][attribute_name] = curves
+
+    # raw getters, time series are returned on the whole horizon, like SHOP does
+
+    def GetTxySeriesStartTime(self, object_type: str, object_name: str, attribute_name: str) -> str:
+        return '' if self._objects[object_type][object_name].get(attribute_name) is None else self.GetStartTime()
+
+    def GetTxySeriesT(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        return np.arange(len(self._horizon()), dtype=np.int64)
+
+    def GetTxySeriesY(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        return self._expanded(self._objects[object_type][object_name][attribute_name]).to_numpy(dtype=float)
+
+    def GetXyCurveReference(self, object_type: str, object_name: str, attribute_name: str) -> float:
+        curve = self._objects[object_type][object_name].get(attribute_name)
+        return 0.0 if curve is None else float(curve.name or 0.0)
+
+    def GetXyCurveX(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        curve = self._objects[object_type][object_name].get(attribute_name)
+        return np.empty(0) if curve is None else curve.index.to_numpy(dtype=float)
+
+    def GetXyCurveY(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        curve = self._objects[object_type][object_name].get(attribute_name)
+        return np.empty(0) if curve is None else curve.to_numpy(dtype=float)
+
+    def GetXyCurveArrayReferences(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        return np.array([curve.name or 0.0 for curve in self._objects[object_type][object_name].get(attribute_name) or []], dtype=float)
+
+    def GetXyCurveArrayNPoints(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        return np.array([len(curve) for curve in self._objects[object_type][object_name].get(attribute_name) or []], dtype=np.int64)
+
+    def GetXyCurveArrayX(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        curves = self._objects[object_type][object_name].get(attribute_name) or []
+        return np.concatenate([curve.index.to_numpy(dtype=float) for curve in curves]) if curves else np.empty(0)
+
+    def GetXyCurveArrayY(self, object_type: str, object_name: str, attribute_name: str) -> np.ndarray:
+        curves = self._objects[object_type][object_name].get(attribute_name) or []
+        return np.concatenate([curve.to_numpy(dtype=float) for curve in curves]) if curves else np.empty(0)
+
+    # values
+
+    def _delta(self) -> pd.Timedelta:
+        return pd.Timedelta(1, unit=_TIME_UNITS[self._unit])
+
+    def _horizon(self) -> pd.DatetimeIndex:
+        return pd.date_range(self._start, self._end, freq=self._delta(), inclusive='left')
+
+    def _expanded(self, value: pd.DataFrame) -> pd.DataFrame:
+        # pyshop returns time series on the whole horizon, with the values held between breakpoints
+        horizon = self._horizon()
+        return value.reindex(value.index.union(horizon)).ffill().loc[horizon]
+
+    def _solve(self):
+        horizon = self._horizon()
+        for attributes in self._objects['reservoir'].values():
+            attributes['storage'] = pd.DataFrame(np.linspace(1, 2, len(horizon)).reshape(-1, 1), index=horizon)
+            attributes['head'] = pd.DataFrame(np.full((len(horizon), 1), 95.0), index=horizon)
+        for object_type in ('plant', 'generator'):
+            for attributes in self._objects[object_type].values():
+                attributes['production'] = pd.DataFrame(np.full((len(horizon), 1), 50.0), index=horizon)
+        for attributes in self._objects['plant'].values():
+            attributes['discharge'] = pd.DataFrame(np.full((len(horizon), 1), 20.0), index=horizon)
+        for attributes in self._objects['market'].values():
+            attributes['sale'] = pd.DataFrame(np.full((len(horizon), 1), 10.0), index=horizon)
+        self._objects['objective']['average_objective']['grand_total'] = -1234.5
+
+
+class Attribute:
+
+    def __init__(self, api: ShopApi, object_type: str, object_name: str, attribute_name: str):
+        self._api = api
+        self._object_type = object_type
+        self._object_name = object_name
+        self._attribute_name = attribute_name
+        self._datatype = CATALOG[object_type][attribute_name][0]
+
+    @property
+    def _values(self) -> Dict[str, Any]:
+        return self._api._objects[self._object_type][self._object_name]
+
+    def info(self) -> Dict[str, Any]:
+        return {key: self._api.GetAttributeInfo(self._object_type, self._attribute_name, key) for key in INFO_KEYS}
+
+    def get(self) -> Any:
+        # like pyshop: time series and curves are built into pandas objects from the raw shop_api getters
+        api, names = self._api, (self._object_type, self._object_name, self._attribute_name)
+        value = self._values.get(self._attribute_name)
+        if self._datatype == 'txy':
+            start_time = api.GetTxySeriesStartTime(*names)
+            if not start_time:
+                return None
+            start = pd.Timestamp(datetime.strptime(start_time, '%Y%m%d%H%M%S'), tz=api._start.tz)
+            index = pd.DatetimeIndex(start.value + api.GetTxySeriesT(*names) * api._delta().value, tz=start.tz)
+            values = api.GetTxySeriesY(*names)
+            if values.shape[1] == 1:
+                return pd.Series(values[:, 0], index=index, name=self._attribute_name)
+            return pd.DataFrame(values, index=index)
+        if self._datatype == 'xy':
+            if value is None:
+                return None
+            return pd.Series(api.GetXyCurveY(*names), index=api.GetXyCurveX(*names), name=api.GetXyCurveReference(*names))
+        if self._datatype == 'xy_array':
+            if value is None:
+                return None
+            bounds = np.cumsum(api.GetXyCurveArrayNPoints(*names))[:-1]
+            return [
+                pd.Series(y, index=x, name=float(reference)) for reference, x, y in
+                zip(api.GetXyCurveArrayReferences(*names), np.split(api.GetXyCurveArrayX(*names), bounds), np.split(api.GetXyCurveArrayY(*names), bounds))
+            ]
+        if self._datatype == 'double':
+            return 0.0 if value is None else float(value)
+        if self._datatype == 'int':
+            return 0 if value is None else int(value)
+        return value
+
+    def set(self, value: Any):
+        # like pyshop: pandas objects are taken apart and handed to the raw shop_api setters
+        api, names = self._api, (self._object_type, self._object_name, self._attribute_name)
+        if self._datatype == 'txy':
+            if isinstance(value, (int, float)):
+                value = pd.Series([float(value)], index=[api._start])
+            if isinstance(value, pd.Series):
+                value = value.to_frame()
+            index = pd.DatetimeIndex(value.index)
+            if index.tz is None and api._start.tz is not None:
+                index = index.tz_localize(api._start.tz)
+            offsets = ((index - index[0]) / api._delta()).astype(np.int64)
+            api.SetTxySeries(*names, index[0].strftime('%Y%m%d%H%M%S'), offsets.tolist(), value.values.tolist())
+        elif self._datatype == 'xy':
+            api.SetXyCurve(*names, value.name or 0.0, value.index.values.tolist(), value.values.tolist())
+        elif self._datatype == 'xy_array':
+            api.SetXyCurveArray(
+                *names, [curve.name or 0.0 for curve in value], [len(curve) for curve in value],
+                [x for curve in value for x in curve.index.values.tolist()], [y for curve in value for y in curve.values.tolist()]
+            )
+        elif self._datatype == 'double':
+            self._values[self._attribute_name] = float(value)
+        elif self._datatype == 'int':
+            self._values[self._attribute_name] = int(value)
+        elif self._datatype == 'double_array':
+            self._values[self._attribute_name] = [float(v) for v in value]
+        else:
+            self._values[self._attribute_name] = value
+
+
+class ModelObject:
+
+    def __init__(self, api: ShopApi, object_type: str, object_name: str):
+        self._api = api
+        self._type = object_type
+        self._name = object_name
+        self._attr_names = list(CATALOG[object_type])
+
+    def __getitem__(self, attribute_name: str) -> Attribute:
+        if attribute_name not in CATALOG[self._type]:
+            raise KeyError(attribute_name)
+        return Attribute(self._api, self._type, self._name, attribute_name)
+
+    def __getattr__(self, attribute_name: str) -> Attribute:
+        if attribute_name.startswith('_'):
+            raise AttributeError(attribute_name)
+        return self[attribute_name]
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_type(self) -> str:
+        return self._type
+
+    def connect_to(self, other: 'ModelObject', connection_type: str = ''):
+        self._api._relations.append((self._type, self._name, other._type, other._name, connection_type or 'default'))
+
+    def get_relations(self, direction: str = 'both', relation_type: str = 'default') -> List['ModelObject']:
+        relations = []
+        for from_type, from_name, to_type, to_name, relation in self._api._relations:
+            if relation != relation_type:
+                continue
+            if (from_type, from_name) == (self._type, self._name) and direction in ('both', 'output'):
+                relations.append(ModelObject(self._api, to_type, to_name))
+            elif (to_type, to_name) == (self._type, self._name) and direction in ('both', 'input'):
+                relations.append(ModelObject(self._api, from_type, from_name))
+        return relations
+
+
+class ObjectGenerator:
+
+    def __init__(self, api: ShopApi, object_type: str):
+        self._api = api
+        self._type = object_type
+
+    @property
+    def _names(self) -> List[str]:
+        return list(self._api._objects[self._type])
+
+    def get_object_names(self) -> List[str]:
+        return self._names
+
+    def add_object(self, object_name: str) -> ModelObject:
+        if object_name in self._api._objects[self._type]:
+            raise ValueError(f'{self._type} {object_name} already exists')
+        self._api._objects[self._type][object_name] = {}
+        return ModelObject(self._api, self._type, object_name)
+
+    def __getitem__(self, object_name: str) -> ModelObject:
+        if object_name not in self._api._objects[self._type]:
+            raise KeyError(object_name)
+        return ModelObject(self._api, self._type, object_name)
+
+
+class _Graph:
+
+    def __init__(self, source: str):
+        self.source = source
+
+
+class Model:
+
+    def __init__(self, api: ShopApi):
+        self._api = api
+        self._all_types = list(CATALOG)
+
+    def __getitem__(self, object_type: str) -> ObjectGenerator:
+        if object_type not in CATALOG:
+            raise KeyError(object_type)
+        return ObjectGenerator(self._api, object_type)
+
+    def __getattr__(self, object_type: str) -> ObjectGenerator:
+        if object_type.startswith('_'):
+            raise AttributeError(object_type)
+        return self[object_type]
+
+    def build_connection_tree(self) -> _Graph:
+        edges = [f'"{from_name}" -> "{to_name}";' for _, from_name, _, to_name, _ in self._api._relations]
+        return _Graph('digraph {\n' + '\n'.join(edges) + '\n}')
+
+
+class ShopSession:
+
+    def __init__(self, license_path: str = '', silent: bool = True, log_file: str = '', name: str = 'unnamed', id: int = 1, **kwargs):
+        self.shop_api = ShopApi()
+        self.model = Model(self.shop_api)
+        self._name = name
+        self._id = id
+        self._log_file = log_file
+        self._commands = dict(COMMANDS)
+        self._command = None
+        self._sim_has_started = False
+
+    def set_time_resolution(self, starttime, endtime, timeunit, timeresolution=None):
+        self.shop_api._start = pd.Timestamp(starttime)
+        self.shop_api._end = pd.Timestamp(endtime)
+        self.shop_api._unit = timeunit
+        self._time_resolution = timeresolution
+
+    def get_time_resolution(self) -> Dict[str, Any]:
+        api = self.shop_api
+        if api._start is None:
+            raise ValueError('The time resolution is not set')
+        return {
+            'starttime': api._start,
+            'endtime': api._end,
+            'timeunit': api._unit,
+            'timeresolution': pd.Series([1.0], index=[api._start]),
+        }
+
+    def _execute_command(self, options: List[str], values: List[str]) -> bool:
+        return self.shop_api.ExecuteCommand(self._commands[self._command], list(options), list(values))
+
+    def execute_full_command(self, full_command: str) -> bool:
+        parts = full_command.split()
+        options = [part[1:] for part in parts if part.startswith('/')]
+        words = [part for part in parts if not part.startswith('/')]
+        return self.shop_api.ExecuteCommand(' '.join(words[:2]), options, words[2:])
+
+    def get_executed_commands(self) -> List[str]:
+        return list(self.shop_api._executed)
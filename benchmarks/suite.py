@@ -0,0 +1,223 @@
+"""
+Times the main endpoints on synthetic watercourses (see benchmarks/watercourse.py) and stores the results,
+so that a change can be compared with earlier runs and versions.
+
+By default the benchmarks run against the in-process stand-in ShopSession (benchmarks/standin.py), so that they
+measure restshop itself: request parsing, conversion between JSON, pandas and pyshop, and encoding. Use --shop to
+run them against SHOP instead.
+
+Run from the root of the repo:
+
+    python -m benchmarks.suite --sizes 10x168,100x8760
+    python -m benchmarks.suite --sizes 10x168,100x8760 --compare latest
+
+Results are written to benchmarks/results/<time>-<version>.json.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import datetime as dt
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+STANDIN = 'benchmarks.standin:ShopSession'
+
+Size = Tuple[int, int] # (reservoirs, time steps)
+
+
+def parse_sizes(sizes: str) -> List[Size]:
+    return [tuple(int(n) for n in size.lower().split('x')) for size in sizes.split(',')]
+
+
+def measure(func: Callable[[], Any], repeat: int, setup: Callable[[], Any] = None) -> Dict[str, float]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        result = func(argument) if setup else func()
+        timings.append(time.perf_counter() - start)
+        size = len(result) if isinstance(result, (bytes, str)) else size
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'max_ms': max(timings) * 1000,
+        'bytes': size,
+    }
+
+
+class Benchmark:
+
+    def __init__(self, repeat: int):
+        # imported here, so that RESTSHOP_SHOP_SESSION_CLASS is set before restshop reads its config
+        from fastapi.testclient import TestClient
+        import main
+        self.main = main
+        self.client = TestClient(main.app)
+        self.repeat = repeat
+
+    def _check(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f'{response.request.method} {response.request.url} returned {response.status_code}: {response.text[:500]}')
+        return response
+
+    def new_session(self) -> Dict[str, str]:
+        session_id = self._check(self.client.post('/session')).json()['session_id']
+        return {'session-id': str(session_id)}
+
+    def delete_session(self, headers: Dict[str, str]):
+        self.client.delete('/session', params={'session_id': headers['session-id']})
+
+    def run(self, reservoirs: int, steps: int) -> Dict[str, Dict[str, float]]:
+        from benchmarks.watercourse import generate_watercourse
+        from core import columnar, fastjson, interface
+        from core.sessions import SessionManager
+
+        body = json.dumps(generate_watercourse(reservoirs, steps)).encode()
+        post = {'content-type': 'application/json'}
+        results = {}
+
+        # PUT /model into a new session every time
+        sessions = []
+        def put_model(headers):
+            sessions.append(headers)
+            return self._check(self.client.put('/model', data=body, headers=dict(headers, **post))).content
+        results['put_model'] = measure(put_model, self.repeat, setup=self.new_session)
+        headers = sessions.pop()
+        for other in sessions:
+            self.delete_session(other)
+        results['put_model']['request_bytes'] = len(body)
+
+        inputs = {'isInput': True, 'isOutput': False}
+        results['get_model'] = measure(lambda: self._check(self.client.get('/model', params=inputs, headers=headers)).content, self.repeat)
+        results['get_model_npz'] = measure(
+            lambda: self._check(self.client.get('/model', params=inputs, headers=dict(headers, accept=columnar.NPZ_MEDIA_TYPE))).content, self.repeat
+        )
+        results['get_connections'] = measure(lambda: self._check(self.client.get('/connections', headers=headers)).content, self.repeat)
+
+        reservoir = json.dumps({'attributes': json.loads(body)['model']['reservoir']['Reservoir0']}).encode()
+        results['put_object'] = measure(
+            lambda: self._check(self.client.put('/model/reservoir', params={'object_name': 'Reservoir0'}, data=reservoir, headers=dict(headers, **post))).content,
+            self.repeat
+        )
+        generators = json.dumps({name: {'attributes': attributes} for name, attributes in json.loads(body)['model']['generator'].items()}).encode()
+        results['put_instances'] = measure(
+            lambda: self._check(self.client.put('/model/generator/instances', params={'return': 'minimal'}, data=generators, headers=dict(headers, **post))).content,
+            self.repeat
+        )
+        results['get_object'] = measure(
+            lambda: self._check(self.client.get('/model/reservoir', params={'object_name': 'Reservoir0'}, headers=headers)).content, self.repeat
+        )
+
+        # serialization alone, without HTTP
+        worker = SessionManager.get_shop_session(self.main.test_user, int(headers['session-id']))
+        content = worker.execute(interface.get_model_dict, **inputs)
+        results['serialize_json'] = measure(lambda: fastjson.dumps(content), self.repeat)
+        columns = worker.execute(columnar.get_model_columns, **inputs)
+        results['serialize_npz'] = measure(lambda: columnar.encode_columns(columns, columnar.NPZ_MEDIA_TYPE), self.repeat)
+
+        self.delete_session(headers)
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def find_previous(results_dir: str, compare: str) -> Optional[str]:
+    if compare != 'latest':
+        return compare
+    files = sorted(glob.glob(os.path.join(results_dir, '*.json')))
+    return files[-1] if files else None
+
+
+def compare_results(current: Dict[str, Any], previous: Dict[str, Any], threshold: float) -> List[str]:
+
+    """
+        Prints the change of every median against the previous run, returns the cases that are slower than threshold.
+    """
+
+    regressions = []
+    print(f"\ncompared with {previous['version']} ({previous.get('commit')}, {previous['time']})")
+    for size, cases in current['results'].items():
+        for case, result in cases.items():
+            before = previous['results'].get(size, {}).get(case)
+            if before is None:
+                continue
+            ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+            flag = ''
+            if ratio > threshold:
+                flag = '  REGRESSION'
+                regressions.append(f'{size} {case}')
+            print(f'{size:>12} {case:<16} {before["median_ms"]:10.2f} ms -> {result["median_ms"]:10.2f} ms  {ratio:6.2f}x{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10x168,100x168,100x8760', help='comma separated watercourse sizes, reservoirs x time steps')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--shop', action='store_true', help='use pyshop.ShopSession instead of the stand-in')
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--no-save', action='store_true', help='do not store the results')
+    parser.add_argument('--compare', help='result file to compare with, or latest')
+    parser.add_argument('--threshold', type=float, default=1.2, help='a median this many times slower than before is a regression')
+    args = parser.parse_args()
+
+    if not args.shop:
+        os.environ['RESTSHOP_SHOP_SESSION_CLASS'] = STANDIN
+    os.environ.setdefault('RESTSHOP_SERVER_TIMING_ENABLED', '0')
+
+    previous_file = find_previous(args.output_dir, args.compare) if args.compare else None
+
+    import core
+    from core import config, fastjson
+    benchmark = Benchmark(args.repeat)
+
+    current = {
+        'version': core.__version__,
+        'commit': git_commit(),
+        'time': dt.datetime.now(dt.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'session_backend': config.SESSION_BACKEND,
+        'session_class': os.environ.get('RESTSHOP_SHOP_SESSION_CLASS') or 'pyshop.ShopSession',
+        'orjson': fastjson.orjson is not None,
+        'repeat': args.repeat,
+        'results': {},
+    }
+
+    for reservoirs, steps in parse_sizes(args.sizes):
+        size = f'{reservoirs}x{steps}'
+        print(f'\n{reservoirs} reservoirs, {steps} time steps')
+        current['results'][size] = benchmark.run(reservoirs, steps)
+        for case, result in current['results'][size].items():
+            print(f'{case:>16}: {result["median_ms"]:10.2f} ms  (min {result["min_ms"]:.2f})  {result["bytes"] / 1e6:8.2f} MB')
+
+    if not args.no_save:
+        os.makedirs(args.output_dir, exist_ok=True)
+        name = f"{dt.datetime.now(dt.timezone.utc).strftime('%Y%m%dT%H%M%S')}-{current['version']}.json"
+        path = os.path.join(args.output_dir, name)
+        with open(path, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'\nresults written to {path}')
+
+    if previous_file:
+        with open(previous_file) as f:
+            previous = json.load(f)
+        if compare_results(current, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
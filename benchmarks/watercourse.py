@@ -0,0 +1,93 @@
+"""
+Synthetic watercourses of any size, as the JSON body of PUT /model.
+
+A watercourse is a cascade of reservoirs: every reservoir has a plant that discharges into the next reservoir,
+every plant has a number of generators, and one market sells the production. Input time series have one value
+per time step, so the size of a model is set by the number of reservoirs and time steps:
+
+    body = generate_watercourse(reservoirs=100, steps=8760)
+"""
+
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+START_TIME = pd.Timestamp('2021-01-01T00:00:00Z')
+
+
+def _curve(x: List[float], y: List[float]) -> Dict[str, List[float]]:
+    return {'x_values': x, 'y_values': y}
+
+
+def generate_watercourse(reservoirs: int, steps: int, generators_per_plant: int = 2, seed: int = 42, start_time: pd.Timestamp = START_TIME) -> Dict[str, Any]:
+
+    """
+        Returns {'time', 'model', 'connections'} for PUT /model. Time series are written with start and step,
+        so that the body is cheap to build for long horizons. The same arguments always give the same model.
+    """
+
+    rng = np.random.default_rng(seed)
+    end_time = start_time + pd.Timedelta(hours=steps)
+
+    def series(level: float, spread: float) -> Dict[str, Any]:
+        return {'start': start_time.isoformat(), 'step': 3600, 'values': [np.round(level + spread * rng.random(steps), 3).tolist()]}
+
+    model = {'reservoir': {}, 'plant': {}, 'generator': {}, 'market': {}}
+    connections = []
+
+    for r in range(reservoirs):
+        hrl = 100.0 + 10.0 * (reservoirs - r)
+        model['reservoir'][f'Reservoir{r}'] = {
+            'max_vol': 10.0 + 5.0 * rng.random(),
+            'lrl': hrl - 10.0,
+            'hrl': hrl,
+            'start_head': hrl - 5.0,
+            'energy_value_input': 30.0 + 10.0 * rng.random(),
+            'vol_head': _curve([0.0, 5.0, 10.0, 15.0], [hrl - 10.0, hrl - 4.0, hrl, hrl + 1.0]),
+            'flow_descr': _curve([hrl, hrl + 1.0], [0.0, 1000.0]),
+            'water_value_input': {'0': _curve([0.0, 5.0, 10.0], [50.0, 35.0, 20.0])},
+            'inflow': series(50.0, 50.0),
+        }
+
+        model['plant'][f'Plant{r}'] = {
+            'outlet_line': hrl - 20.0,
+            'main_loss': [0.0002],
+            'penstock_loss': [0.0001] * generators_per_plant,
+        }
+        connections.append({'from': f'Reservoir{r}', 'from_type': 'reservoir', 'to': f'Plant{r}', 'to_type': 'plant'})
+        if r + 1 < reservoirs:
+            connections.append({'from': f'Plant{r}', 'from_type': 'plant', 'to': f'Reservoir{r + 1}', 'to_type': 'reservoir'})
+
+        for g in range(generators_per_plant):
+            name = f'Plant{r}_G{g}'
+            model['generator'][name] = {
+                'penstock': g + 1,
+                'p_min': 10.0,
+                'p_max': 100.0,
+                'p_nom': 100.0,
+                'startcost': 500.0,
+                'gen_eff_curve': _curve([0.0, 100.0], [95.0, 98.0]),
+                'turb_eff_curves': {
+                    '90': _curve([25.0, 90.0, 100.0], [80.0, 95.0, 90.0]),
+                    '100': _curve([25.0, 90.0, 100.0], [82.0, 98.0, 92.0]),
+                },
+            }
+            connections.append({'from': f'Plant{r}', 'from_type': 'plant', 'to': name, 'to_type': 'generator'})
+
+    model['market']['Day_ahead'] = {
+        'sale_price': series(35.0, 10.0),
+        'buy_price': series(35.1, 10.0),
+        'max_sale': series(9999.0, 0.0),
+        'max_buy': series(9999.0, 0.0),
+    }
+
+    return {
+        'time': {'start_time': start_time.isoformat(), 'end_time': end_time.isoformat(), 'time_unit': 'hour'},
+        'model': model,
+        'connections': connections,
+    }
+
+
+def object_count(body: Dict[str, Any]) -> int:
+    return sum(len(objects) for objects in body['model'].values())
@@ -0,0 +1,205 @@
+from typing import Dict, List, Optional, Tuple
+import io
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from pyshop import ShopSession
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from . import metrics, timing
+from .schemas import registry, get_txy_raw, get_xy_raw, get_xy_array_raw
+from .interface import select_model_attributes
+
+#
+# Columnar (binary) representation of model attributes
+# - txy attributes become one float64 column each, on a shared timestamp column
+# - xy and xy_array curves are packed into flat x/y arrays, curve i is x[offset[i]:offset[i+1]]
+#
+
+NPZ_MEDIA_TYPE = 'application/x-npz'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+COLUMNAR_MEDIA_TYPES = [NPZ_MEDIA_TYPE, ARROW_MEDIA_TYPE]
+
+Columns = Dict[str, Dict[str, np.ndarray]]
+
+
+def negotiate_media_type(accept: Optional[str], media_types: List[str] = COLUMNAR_MEDIA_TYPES) -> Optional[str]:
+
+    """
+        Returns the media type in media_types preferred by the Accept header, or None if JSON should be returned.
+    """
+
+    if not accept:
+        return None
+
+    ranges = []
+    for position, media_range in enumerate(accept.split(',')):
+        media_type, *params = [p.strip() for p in media_range.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        ranges.append((-quality, position, media_type.lower()))
+
+    for _, _, media_type in sorted(ranges):
+        if media_type in media_types:
+            return media_type
+        if media_type in ('application/json', 'application/*', '*/*'):
+            return None
+    return None
+
+
+def _reference(curve: pd.Series) -> float:
+    # pyshop keeps the reference value of a curve in series.name
+    try:
+        return float(curve.name)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _read_txy(shop: ShopSession, ot: str, on: str, attr: str) -> Optional[pd.DataFrame]:
+    raw = get_txy_raw(shop, ot, on, attr)
+    if raw is not None:
+        nanoseconds, values = raw
+        return pd.DataFrame(values, index=pd.DatetimeIndex(nanoseconds.view('datetime64[ns]'))) if len(nanoseconds) else None
+    value = shop.model[ot][on][attr].get()
+    if isinstance(value, pd.Series):
+        return value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    return None
+
+
+def _read_curves(shop: ShopSession, ot: str, on: str, attr: str, datatype: str) -> List[Tuple[float, np.ndarray, np.ndarray]]:
+    raw = get_xy_raw(shop, ot, on, attr) if datatype == 'xy' else get_xy_array_raw(shop, ot, on, attr) if datatype == 'xy_array' else None
+    if raw is not None:
+        raw = [raw] if datatype == 'xy' else raw
+        return [curve for curve in raw if len(curve[1]) > 0]
+    value = shop.model[ot][on][attr].get()
+    if datatype == 'xy':
+        value = [value] if isinstance(value, pd.Series) else []
+    elif not isinstance(value, list):
+        value = []
+    return [(_reference(curve), curve.index.to_numpy(dtype=np.float64), curve.to_numpy(dtype=np.float64)) for curve in value]
+
+
+def get_model_columns(
+        shop: ShopSession,
+        objectType: str = None,
+        objectName: str = None,
+        attributeName: str = None,
+        datatype: str = None,
+        isInput: bool = False,
+        isOutput: bool = True
+    ) -> Columns:
+
+    """
+        Reads the txy and curve attributes of a GET /model query into numpy columns, other datatypes are left out.
+        Stochastic txy attributes get one column per scenario, named {object_type}/{object_name}/{attribute}/{scenario}.
+    """
+
+    selection = select_model_attributes(shop, objectType, objectName, attributeName, datatype, isInput, isOutput)
+
+    frames: List[pd.DataFrame] = []
+    curve_keys: List[tuple] = []
+    curves: List[Tuple[float, np.ndarray, np.ndarray]] = [] # (reference, x, y)
+
+    for ot, objects in selection.items():
+        for on, attribute_list in objects.items():
+            for attr in attribute_list:
+                attribute_datatype = registry.attributes[ot][attr].datatype
+                if attribute_datatype not in ('txy', 'xy', 'xy_array', 'xyn'):
+                    continue
+
+                if attribute_datatype == 'txy':
+                    frame = _read_txy(shop, ot, on, attr)
+                    if frame is not None:
+                        frame.columns = [f'{ot}/{on}/{attr}'] if frame.shape[1] == 1 else [f'{ot}/{on}/{attr}/{scenario}' for scenario in range(frame.shape[1])]
+                        frames.append(frame)
+                else:
+                    for curve in _read_curves(shop, ot, on, attr, attribute_datatype):
+                        curve_keys.append((ot, on, attr))
+                        curves.append(curve)
+
+    # txy values are step functions, so a series that is missing a timestamp keeps its previous value
+    if frames:
+        table = pd.concat(frames, axis=1).sort_index().ffill()
+        txy = {'timestamp': table.index.values}
+        txy.update({name: table[name].to_numpy(dtype=np.float64) for name in table.columns})
+    else:
+        txy = {'timestamp': np.array([], dtype='datetime64[ns]')}
+
+    lengths = np.array([len(x) for _, x, _ in curves], dtype=np.int64)
+    packed = {
+        'object_type': np.array([key[0] for key in curve_keys], dtype=str),
+        'object_name': np.array([key[1] for key in curve_keys], dtype=str),
+        'attribute': np.array([key[2] for key in curve_keys], dtype=str),
+        'reference': np.array([reference for reference, _, _ in curves], dtype=np.float64),
+        'offset': np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        'x': np.concatenate([x for _, x, _ in curves]) if curves else np.array([], dtype=np.float64),
+        'y': np.concatenate([y for _, _, y in curves]) if curves else np.array([], dtype=np.float64),
+    }
+
+    return {'txy': txy, 'curves': packed}
+
+
+def to_npz(columns: Columns) -> bytes:
+
+    """
+        Every column is stored as {table}/{column}, e.g. txy/timestamp, txy/reservoir/Reservoir1/storage, curves/x.
+    """
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **{f'{table}/{name}': array for table, table_columns in columns.items() for name, array in table_columns.items()})
+    return buffer.getvalue()
+
+
+def to_arrow(columns: Columns) -> bytes:
+
+    """
+        An Arrow IPC stream holds a single table: the txy table, or the curve table if the query matched no txy attributes.
+        Curves are returned as one row per curve with list<double> x and y columns.
+        A query that matches both is refused (406), narrow it with datatype or use npz, which holds both.
+    """
+
+    if pa is None:
+        raise HTTPException(406, f'{{{ARROW_MEDIA_TYPE}}} requires pyarrow to be installed on the server, use {{{NPZ_MEDIA_TYPE}}} instead')
+
+    txy, curves = columns['txy'], columns['curves']
+    if len(txy) > 1 and len(curves['object_type']) > 0:
+        raise HTTPException(406, f'{{{ARROW_MEDIA_TYPE}}} holds a single table, but the query matched both time series and curves, narrow it with datatype or use {{{NPZ_MEDIA_TYPE}}} instead')
+    if len(txy) > 1 or len(curves['object_type']) == 0:
+        table = pa.table({name: pa.array(array) for name, array in txy.items()})
+    else:
+        offsets = pa.array(curves['offset'], type=pa.int32())
+        table = pa.table({
+            'object_type': pa.array(curves['object_type']),
+            'object_name': pa.array(curves['object_name']),
+            'attribute': pa.array(curves['attribute']),
+            'reference': pa.array(curves['reference']),
+            'x': pa.ListArray.from_arrays(offsets, pa.array(curves['x'])),
+            'y': pa.ListArray.from_arrays(offsets, pa.array(curves['y'])),
+        })
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_columns(columns: Columns, media_type: str) -> bytes:
+    if media_type == NPZ_MEDIA_TYPE:
+        with metrics.SERIALIZE_DURATION.time('npz'), timing.phase('encode'):
+            return to_npz(columns)
+    if media_type == ARROW_MEDIA_TYPE:
+        with metrics.SERIALIZE_DURATION.time('arrow'), timing.phase('encode'):
+            return to_arrow(columns)
+    raise HTTPException(406, f'Media type {{{media_type}}} is not supported')
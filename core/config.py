@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+
+# Server configuration, read once from the environment at startup
+
+# 'thread' keeps every ShopSession inside the api process, 'process' gives every session its own supervised worker process
+SESSION_BACKEND: str = os.environ.get('RESTSHOP_SESSION_BACKEND', 'thread')
+
+# ShopSession class used for new sessions as 'module:Class', empty for pyshop.ShopSession.
+# benchmarks.standin:ShopSession runs restshop without SHOP binaries, see the Benchmarks section of README.md
+SHOP_SESSION_CLASS: str = os.environ.get('RESTSHOP_SHOP_SESSION_CLASS', '')
+
+# multiprocessing start method for worker processes, 'forkserver' avoids re-importing SHOP for every new worker
+WORKER_START_METHOD: str = os.environ.get('RESTSHOP_WORKER_START_METHOD', 'spawn' if sys.platform == 'win32' else 'forkserver')
+
+# number of finished jobs that are kept around for status polling
+JOB_HISTORY_SIZE: int = int(os.environ.get('RESTSHOP_JOB_HISTORY_SIZE', '1000'))
+
+# log messages waiting to be forwarded to the logging endpoint, messages beyond this are dropped
+LOG_QUEUE_SIZE: int = int(os.environ.get('RESTSHOP_LOG_QUEUE_SIZE', '10000'))
+
+# maximum number of log messages sent in one request to a batch logging endpoint
+LOG_BATCH_SIZE: int = int(os.environ.get('RESTSHOP_LOG_BATCH_SIZE', '500'))
+
+# seconds the log forwarder waits to fill up a batch before sending it
+LOG_FLUSH_INTERVAL: float = float(os.environ.get('RESTSHOP_LOG_FLUSH_INTERVAL', '0.5'))
+
+# retries (with exponential backoff) before a log batch is given up
+LOG_MAX_RETRIES: int = int(os.environ.get('RESTSHOP_LOG_MAX_RETRIES', '3'))
+
+# when the log queue is more than half full only every n'th info message is kept, warnings and errors are always kept
+LOG_SAMPLE_RATE: int = int(os.environ.get('RESTSHOP_LOG_SAMPLE_RATE', '10'))
+
+# directory where SHOP metadata (object types, attribute info, commands) is cached between restarts, empty disables the cache
+METADATA_CACHE_DIR: str = os.environ.get('RESTSHOP_METADATA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'restshop'))
+
+# number of ShopSessions started ahead of time, so that POST /session does not have to wait for SHOP to start, 0 disables the pool
+SESSION_POOL_SIZE: int = int(os.environ.get('RESTSHOP_SESSION_POOL_SIZE', '0'))
+
+# log file of the pooled sessions, sessions created with another log file are started on request
+SESSION_POOL_LOG_FILE: str = os.environ.get('RESTSHOP_SESSION_POOL_LOG_FILE', 'pyshop_log.py')
+
+# seconds the pool waits before it tries again after a ShopSession failed to start
+SESSION_POOL_RETRY_INTERVAL: float = float(os.environ.get('RESTSHOP_SESSION_POOL_RETRY_INTERVAL', '10'))
+
+# directory where model templates are stored, empty keeps templates in memory only
+TEMPLATE_DIR: str = os.environ.get('RESTSHOP_TEMPLATE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'restshop', 'templates'))
+
+# sessions that are idle for this many seconds are written to disk and released from SHOP until they are used again, 0 disables spilling
+SESSION_SPILL_IDLE_SECONDS: float = float(os.environ.get('RESTSHOP_SESSION_SPILL_IDLE_SECONDS', '0'))
+
+# directory for spilled sessions
+SESSION_SPILL_DIR: str = os.environ.get('RESTSHOP_SESSION_SPILL_DIR', os.path.join(tempfile.gettempdir(), 'restshop-spill'))
+
+# seconds between checks for idle sessions
+SESSION_SPILL_CHECK_INTERVAL: float = float(os.environ.get('RESTSHOP_SESSION_SPILL_CHECK_INTERVAL', '60'))
+
+# sessions that are not used for this many seconds are deleted, 0 keeps them until DELETE /session
+SESSION_TTL_SECONDS: float = float(os.environ.get('RESTSHOP_SESSION_TTL_SECONDS', '0'))
+
+# maximum number of sessions on the server, the least recently used sessions are deleted beyond this, 0 is unlimited
+MAX_SESSIONS: int = int(os.environ.get('RESTSHOP_MAX_SESSIONS', '0'))
+
+# memory budget in MB for the server including worker processes, the least recently used sessions are deleted above it, 0 is unlimited
+RSS_BUDGET_MB: float = float(os.environ.get('RESTSHOP_RSS_BUDGET_MB', '0'))
+
+# seconds between checks of the limits above
+REAPER_CHECK_INTERVAL: float = float(os.environ.get('RESTSHOP_REAPER_CHECK_INTERVAL', '30'))
+
+# minimum seconds between two inspections of the objects of a session for GET /sessions/info
+SESSION_INSPECT_INTERVAL: float = float(os.environ.get('RESTSHOP_SESSION_INSPECT_INTERVAL', '30'))
+
+# record request, SHOP call and serializer metrics for GET /metrics
+METRICS_ENABLED: bool = os.environ.get('RESTSHOP_METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+
+# allow profiling single requests with the header x-restshop-profile: 1 or ?profile=true, profiles are read from GET /profiles
+PROFILING_ENABLED: bool = os.environ.get('RESTSHOP_PROFILING_ENABLED', '0').lower() in ('1', 'true', 'yes')
+
+# where request profiles are written as pstats files
+PROFILE_DIR: str = os.environ.get('RESTSHOP_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'restshop-profiles'))
+
+# number of profiles kept, older profiles are deleted
+PROFILE_KEEP: int = int(os.environ.get('RESTSHOP_PROFILE_KEEP', '100'))
+
+# add a Server-Timing header (parse, shop, convert, validate, encode, total) to every response and log it as a record of core.timing
+SERVER_TIMING_ENABLED: bool = os.environ.get('RESTSHOP_SERVER_TIMING_ENABLED', '1').lower() in ('1', 'true', 'yes')
+
+# write time series and curves by handing numpy arrays to the raw shop_api setters, instead of through pandas objects and pyshop
+RAW_ARRAY_WRITES: bool = os.environ.get('RESTSHOP_RAW_ARRAY_WRITES', '1').lower() in ('1', 'true', 'yes')
+
+# read time series and curves as numpy arrays from the raw shop_api getters, instead of through the pandas objects pyshop builds
+RAW_ARRAY_READS: bool = os.environ.get('RESTSHOP_RAW_ARRAY_READS', '1').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,78 @@
+from typing import Any
+from datetime import date, datetime
+import json
+import math
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from . import metrics, timing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+#
+# JSON encoding for large responses that are built on the server (see interface.get_model_dict)
+# - numpy arrays are written directly, with orjson (optional dependency) without converting them to lists first
+# - NaN and inf are written as null, with and without orjson
+# - the content is not validated against a response_model again
+#
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.dict(exclude_none=True)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _nan_to_none(obj: Any) -> Any:
+    # json writes NaN and inf as is, which is not valid JSON and differs from orjson
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _nan_to_none(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_nan_to_none(value) for value in obj]
+    return obj
+
+
+def _default_nan_to_none(obj: Any) -> Any:
+    return _nan_to_none(_default(obj))
+
+
+def dumps(content: Any) -> bytes:
+    with metrics.SERIALIZE_DURATION.time('json'), timing.phase('encode'):
+        if orjson is not None:
+            # orjson writes NaN and inf as null
+            return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            _nan_to_none(content),
+            default=_default_nan_to_none,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def dumps_line(content: Any) -> bytes:
+    return dumps(content) + b'\n'
@@ -1,10 +1,139 @@
 from typing import *
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
 import pandas as pd
 import numpy as np
 from fastapi import HTTPException
 from pyshop import ShopSession
-from .schemas import TimeSeries, Curve, Connection, RelationDirectionEnum, RelationTypeEnum
+from .schemas import TimeSeries, Curve, Connection, RelationDirectionEnum, RelationTypeEnum, TimeResolution, ShopModel, \
+    ObjectInstance, CommandStatus, CommandArguments, Command, \
+    TimeSeries_from_pd, TimeSeries_index, TimeFormatEnum, session_time_index, shop_time_zone, serialize_model_object_instance, \
+    registry, attribute_readers, TIME_UNIT_SECONDS
+from . import config, timing
+
+#
+# Notice
+# - every function in this module takes the ShopSession as its first argument and talks to pyshop directly
+# - the rest API never calls these directly, but through SessionManager.call(...) which runs them off the event loop
+#
+
+def http_raise_internal(msg: str, e: Exception):
+    raise HTTPException(500, f'{msg} -- Internal Exception: {e}')
+
+
+# ------ raw array writes
+# numpy arrays are handed straight to the shop_api setters that pyshop would call after taking its pandas objects apart,
+# the setters below fall back to pyshop when the shop_api does not have them (or config.RAW_ARRAY_WRITES is off)
+
+def _raw_setter(shop: ShopSession, name: str) -> Optional[Callable]:
+    if not config.RAW_ARRAY_WRITES:
+        return None
+    return getattr(shop.shop_api, name, None)
+
+def _epoch_seconds(t: datetime) -> float:
+    # naive timestamps are UTC, like the times of the session
+    return (t if t.tzinfo is not None else t.replace(tzinfo=timezone.utc)).timestamp()
+
+def _shop_seconds(time_string: str) -> float:
+    # a time of the session (YYYYMMDDHHMMSS), only read when the session has no time zone or UTC
+    return datetime.strptime(time_string[:14], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc).timestamp()
+
+def _utc_kind(times: Iterable[datetime]) -> Optional[str]:
+    # 'naive' or 'utc' if all times are, None for other or mixed offsets
+    offsets = {t.utcoffset() for t in times}
+    if offsets == {None}:
+        return 'naive'
+    if offsets == {timedelta(0)}:
+        return 'utc'
+    return None
+
+def _txy_seconds(shop: ShopSession, time_series: TimeSeries, n: int) -> Tuple[np.ndarray, Optional[str]]:
+    if time_series.timestamps is not None:
+        seconds = np.fromiter((_epoch_seconds(t) for t in time_series.timestamps), dtype=np.float64, count=len(time_series.timestamps))
+        return seconds, _utc_kind(time_series.timestamps)
+    if time_series.epoch_timestamps is not None:
+        return np.asarray(time_series.epoch_timestamps, dtype=np.float64), 'utc'
+    if time_series.start is not None:
+        return _epoch_seconds(time_series.start) + np.arange(n, dtype=np.float64) * time_series.step, _utc_kind([time_series.start])
+    index = TimeSeries_index(time_series, session_time_index(shop))
+    seconds = index.values.astype('datetime64[ns]').view(np.int64) / 1e9
+    return seconds, 'naive' if index.tz is None else _utc_kind(index[:1])
+
+def _constant_time_resolution(shop: ShopSession) -> bool:
+    get_t = getattr(shop.shop_api, 'GetTimeResolutionT', None)
+    if get_t is not None:
+        return len(get_t()) <= 1
+    return shop.get_time_resolution()['timeresolution'].shape[0] <= 1
+
+def set_txy_raw(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, time_series: TimeSeries) -> bool:
+
+    """
+        Writes a time series with shop_api.SetTxySeries(start, offsets, values): start is the first timestamp as
+        YYYYMMDDHHMMSS, offsets are int64 time units of the session from start and values are float64 (time steps x scenarios).
+        Returns False, without writing, where pyshop does more than take the series apart: the session has a time zone
+        other than UTC (or the timestamps do not match it), the time resolution is not constant (pyshop resamples),
+        the series does not start at the start of the session (pyshop fills in the start) or runs past its end (pyshop clips),
+        or the timestamps are not whole time units apart.
+    """
+
+    setter = _raw_setter(shop, 'SetTxySeries')
+    api = shop.shop_api
+    if setter is None or not all(hasattr(api, name) for name in ('GetTimeUnit', 'GetStartTime', 'GetEndTime')):
+        return False
+    if not time_series.values or not time_series.values[0]:
+        return False
+    with timing.phase('shop'):
+        time_zone = shop_time_zone(shop)
+        if time_zone not in ('', 'UTC') or not _constant_time_resolution(shop):
+            return False
+        start_time, end_time, time_unit = api.GetStartTime(), api.GetEndTime(), api.GetTimeUnit()
+    with timing.phase('convert'):
+        values = np.asarray(time_series.values, dtype=np.float64)
+        n = values.shape[1]
+        seconds, kind = _txy_seconds(shop, time_series, n)
+        if len(seconds) != n:
+            raise HTTPException(400, f'TimeSeries {{{time_series.name}}} has {len(seconds)} timestamps and {n} values')
+        if kind != ('utc' if time_zone else 'naive'):
+            return False
+        if seconds[0] != _shop_seconds(start_time) or seconds[-1] > _shop_seconds(end_time) or np.any(np.diff(seconds) <= 0):
+            return False
+        units = (seconds - seconds[0]) / TIME_UNIT_SECONDS.get(time_unit, 3600)
+        offsets = np.rint(units).astype(np.int64)
+        if not np.allclose(units, offsets, rtol=0, atol=1e-6):
+            return False
+        values = np.ascontiguousarray(values.T)
+    with timing.phase('shop'):
+        setter(object_type, object_name, attribute_name, start_time[:14], offsets, values)
+    return True
+
+def set_xy_raw(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, curve: Curve) -> bool:
+    setter = _raw_setter(shop, 'SetXyCurve')
+    if setter is None:
+        return False
+    with timing.phase('convert'):
+        x = np.asarray(curve.x_values, dtype=np.float64)
+        y = np.asarray(curve.y_values, dtype=np.float64)
+    with timing.phase('shop'):
+        setter(object_type, object_name, attribute_name, 0.0, x, y)
+    return True
+
+def set_xy_array_raw(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, curves: OrderedDict[float, Curve]) -> bool:
+
+    """
+        Writes all curves with one shop_api.SetXyCurveArray(references, points per curve, x, y) call, x and y are concatenated.
+    """
+
+    setter = _raw_setter(shop, 'SetXyCurveArray')
+    if setter is None:
+        return False
+    with timing.phase('convert'):
+        references = np.fromiter((float(ref) for ref in curves.keys()), dtype=np.float64, count=len(curves))
+        points = np.fromiter((len(curve.x_values) for curve in curves.values()), dtype=np.int64, count=len(curves))
+        x = np.fromiter((v for curve in curves.values() for v in curve.x_values), dtype=np.float64, count=int(points.sum()))
+        y = np.fromiter((v for curve in curves.values() for v in curve.y_values), dtype=np.float64, count=int(points.sum()))
+    with timing.phase('shop'):
+        setter(object_type, object_name, attribute_name, references, points, x, y)
+    return True
 
 
 def set_txy(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, value: Union[TimeSeries, int, float]):
@@ -14,29 +143,42 @@ def set_txy(shop: ShopSession, object_type: str, object_name: str, attribute_nam
             timestamps=[start_time],
             values=[[value]]
         )
+    time_series: TimeSeries = value
     try:
-        time_series: TimeSeries = value
-        index, values = time_series.timestamps, np.transpose(time_series.values)
-        df = pd.DataFrame(index=index, data=values)
-        shop.model[object_type][object_name][attribute_name].set(df)
+        if set_txy_raw(shop, object_type, object_name, attribute_name, time_series):
+            return
+        with timing.phase('convert'):
+            index = TimeSeries_index(time_series, session_time_index(shop) if time_series.is_implicit else None)
+            values = np.transpose(time_series.values)
+            df = pd.DataFrame(index=index, data=values)
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(df)
     except Exception as e:
         raise HTTPException(500, f'trouble setting txy {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
 def set_xy(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, value: Curve):
     try:
         curve: Curve = value
-        ser = pd.Series(index=curve.x_values, data=curve.y_values)
-        shop.model[object_type][object_name][attribute_name].set(ser)
+        if set_xy_raw(shop, object_type, object_name, attribute_name, curve):
+            return
+        with timing.phase('convert'):
+            ser = pd.Series(index=curve.x_values, data=curve.y_values)
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(ser)
     except Exception as e:
         raise HTTPException(500, f'trouble setting xy {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
 def set_xy_array(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, value: OrderedDict[float, Curve]):
     try:
         curves: OrderedDict[float, Curve] = value
+        if set_xy_array_raw(shop, object_type, object_name, attribute_name, curves):
+            return
         ser_list = []
-        for ref, curve in curves.items():
-            ser_list += [pd.Series(index=curve.x_values, data=curve.y_values, name=ref)]
-        shop.model[object_type][object_name][attribute_name].set(ser_list)
+        with timing.phase('convert'):
+            for ref, curve in curves.items():
+                ser_list += [pd.Series(index=curve.x_values, data=curve.y_values, name=ref)]
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(ser_list)
     except Exception as e:
         raise HTTPException(500, f'trouble setting xy_array {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
@@ -44,34 +186,53 @@ def set_xyt(shop: ShopSession, object_type: str, object_name: str, attribute_nam
     try:
         curves: OrderedDict[datetime, Curve] = value
         ser_list = []
-        for ref, curve in curves.items():
-            ser_list += [pd.Series(index=curve.x_values, data=curve.y_values, name=ref)]
-        shop.model[object_type][object_name][attribute_name].set(ser_list)
+        with timing.phase('convert'):
+            for ref, curve in curves.items():
+                ser_list += [pd.Series(index=curve.x_values, data=curve.y_values, name=ref)]
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(ser_list)
     except Exception as e:
         raise HTTPException(500, f'trouble setting xyt {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
 def set_int(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, value: Union[TimeSeries, int, float]):
-    shop.model[object_type][object_name][attribute_name].set(int(value))
+    try:
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(int(value))
+    except Exception as e:
+        raise HTTPException(500, f'trouble setting int {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
 def set_double(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, value: Union[TimeSeries, int, float]):
-    shop.model[object_type][object_name][attribute_name].set(float(value))
+    try:
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(float(value))
+    except Exception as e:
+        raise HTTPException(500, f'trouble setting double {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
 def set_default(shop: ShopSession, object_type: str, object_name: str, attribute_name: str, value: Union[TimeSeries, int, float]):
     try:
-        shop.model[object_type][object_name][attribute_name].set(value)
+        with timing.phase('shop'):
+            shop.model[object_type][object_name][attribute_name].set(value)
     except Exception as e:
         raise HTTPException(500, f'trouble setting xyt {str(type(value))} {object_type} {object_name} {attribute_name} -- Internal Exception: {e}')
 
+_setters: Dict[str, Callable] = {
+    'txy': set_txy,
+    'xy': set_xy,
+    'xy_array': set_xy_array,
+    'xyn': set_xy_array,
+    'int': set_int,
+    'double': set_double
+}
+
 def set_datatype(datatype: str) -> Callable:
-    switcher = {
-        'txy': set_txy,
-        'xy': set_xy,
-        'xy_array': set_xy_array,
-        'xyn': set_xy_array,
-        'int': set_int,
-        'double': set_double
-    }
-    return switcher.get(datatype, set_default)
+    return _setters.get(datatype, set_default)
+
+# attribute_writers[object_type][attribute_name](shop, object_type, object_name, attribute_name, value), the setter of every attribute looked up once
+attribute_writers: Mapping[str, Mapping[str, Callable]] = MappingProxyType({
+    object_type: MappingProxyType({
+        attribute_name: set_datatype(attribute.datatype) for attribute_name, attribute in attributes.items()
+    }) for object_type, attributes in registry.attributes.items()
+})
 
 def get_model_connections(shop: ShopSession) -> List[Connection]:
     connections = []
@@ -97,4 +258,347 @@ def get_model_connections(shop: ShopSession) -> List[Connection]:
                             )
                         )
 
-    return connections
\ No newline at end of file
+    return connections
+
+def get_object_generator(shop: ShopSession, object_type: str):
+    if object_type not in shop.model._all_types:
+        raise HTTPException(400, f'object_type {{{object_type}}} is not implemented.')
+    return shop.model[object_type]
+
+def get_object(shop: ShopSession, object_type: str, object_name: str):
+    object_generator = get_object_generator(shop, object_type)
+    if object_name not in object_generator._names:
+        raise HTTPException(400, f'object_name {{{object_name}}} is not an instance of object_type {{{object_type}}}.')
+    return object_generator[object_name]
+
+# ------ time resolution
+
+def is_time_resolution_set(shop: ShopSession) -> bool:
+    try:
+        shop.get_time_resolution()
+        return True
+    except:
+        return False
+
+def set_time_resolution(shop: ShopSession, time_resolution: TimeResolution):
+
+    start = pd.Timestamp(time_resolution.start_time)
+    end = pd.Timestamp(time_resolution.end_time)
+
+    if (end <= start):
+        raise HTTPException(400, 'end_time must be strictly greater than start_time')
+
+    if (time_resolution.time_resolution):
+        tr: TimeSeries = time_resolution.time_resolution
+        shop.set_time_resolution(
+            starttime=start,
+            endtime=end,
+            timeunit=time_resolution.time_unit,
+            timeresolution=pd.Series(index=TimeSeries_index(tr), data=tr.values[0])
+        )
+    else:
+        shop.set_time_resolution(
+            starttime=start,
+            endtime=end,
+            timeunit=time_resolution.time_unit
+        )
+
+def get_time_resolution(shop: ShopSession) -> dict:
+    return shop.get_time_resolution()
+
+def get_time_resolution_model(shop: ShopSession) -> TimeResolution:
+    time_res = shop.get_time_resolution()
+    return TimeResolution(
+        start_time=time_res['starttime'],
+        end_time=time_res['endtime'],
+        time_unit=time_res['timeunit'],
+        time_resolution=TimeSeries_from_pd(time_res['timeresolution'])
+    )
+
+# ------ model
+
+def select_model_attributes(
+        shop: ShopSession,
+        objectType: str = None,
+        objectName: str = None,
+        attributeName: str = None,
+        datatype: str = None,
+        isInput: bool = False,
+        isOutput: bool = True
+    ) -> Dict[str, Dict[str, List[str]]]:
+
+    """
+        Returns {object_type: {object_name: [attribute_name, ...]}} for the attributes matched by a GET /model query.
+    """
+
+    object_types = shop.model._all_types if objectType is None else [objectType]
+    selection = dict()
+    for ot in object_types:
+        if objectName is None:
+            object_list = shop.model[ot].get_object_names()
+            if len(object_list) == 0:
+                continue
+        else:
+            object_list = [objectName]
+        selection[ot] = dict()
+        for on in object_list:
+            attributes = registry.attributes[ot]
+            attribute_list = registry.attribute_names[ot] if attributeName is None else [attributeName]
+            selection[ot][on] = [
+                attr for attr in attribute_list
+                if ((attributes[attr].is_input and isInput)
+                    or (attributes[attr].is_output and isOutput)
+                    and ((datatype is None) or datatype == attributes[attr].datatype))
+            ]
+    return selection
+
+def get_model_dict(
+        shop: ShopSession,
+        objectType: str = None,
+        objectName: str = None,
+        attributeName: str = None,
+        datatype: str = None,
+        isInput: bool = False,
+        isOutput: bool = True,
+        includeTime: bool = False,
+        includeConnections: bool = False,
+        compressTxy: bool = False,
+        timeFormat: TimeFormatEnum = TimeFormatEnum.iso
+    ) -> Dict[str, Any]:
+
+    """
+        Same content as the ShopModel of GET /model after exclude_unset and exclude_none, but as plain data with numpy arrays
+        that fastjson writes directly, without building and validating pydantic models for every attribute.
+    """
+
+    content = dict()
+    if includeTime:
+        content['time'] = get_model_time_dict(shop)
+
+    selection = select_model_attributes(shop, objectType, objectName, attributeName, datatype, isInput, isOutput)
+    session_index = session_time_index(shop) if timeFormat == TimeFormatEnum.implicit else None
+    model_dict = dict()
+    for ot, objects in selection.items():
+        model_dict[ot] = dict()
+        for on, attribute_list in objects.items():
+            model_dict[ot][on] = get_model_object_attributes_dict(shop, ot, on, attribute_list, compressTxy, timeFormat, session_index)
+    content['model'] = model_dict
+
+    if includeConnections:
+        content['connections'] = get_model_connections_dict(shop)
+
+    return content
+
+def get_model_object_attributes_dict(
+        shop: ShopSession,
+        object_type: str,
+        object_name: str,
+        attribute_list: List[str],
+        compressTxy: bool = False,
+        timeFormat: TimeFormatEnum = TimeFormatEnum.iso,
+        session_index: pd.DatetimeIndex = None
+    ) -> Dict[str, Any]:
+
+    attributes = dict()
+    readers = attribute_readers[object_type]
+    for attr in attribute_list:
+        value = readers[attr](shop, object_name, compressTxy, timeFormat, session_index)
+        if value is not None:
+            attributes[attr] = value
+    return attributes
+
+def get_model_time_dict(shop: ShopSession) -> Dict[str, Any]:
+    return get_time_resolution_model(shop).dict(exclude_unset=True, exclude_none=True)
+
+def get_model_connections_dict(shop: ShopSession) -> List[Dict[str, Any]]:
+    return [c.dict(by_alias=True, exclude_none=True) for c in get_model_connections(shop)]
+
+def set_model(shop: ShopSession, model: ShopModel) -> Optional[CommandStatus]:
+    if hasattr(model, 'time'):
+        if model.time is not None:
+            set_time_resolution(shop, model.time)
+    if hasattr(model, 'model'):
+        if model.model is not None:
+            for (object_type, objects) in model.model:
+                try:
+                    object_generator = shop.model[object_type]
+                except Exception as e:
+                    raise HTTPException(500, f'model does not implement object_type {{{object_type}}}')
+                if objects is not None:
+                    object_names = object_generator.get_object_names()
+                    writers = attribute_writers[object_type]
+                    for (object_name, object_attributes) in objects.items():
+                        if object_name not in object_names:
+                            try:
+                                object_generator.add_object(object_name)
+                            except Exception as e:
+                                raise HTTPException(500, f'object_name {{{object_name}}} is in conflict with existing instance')
+                        if object_attributes:
+                            for (attribute_name, attribute_value) in object_attributes:
+                                if attribute_value is not None:
+                                    try:
+                                        setter = writers[attribute_name]
+                                    except Exception as e:
+                                        http_raise_internal(f'unknown object_attribute {attribute_name} for {object_type} {object_name}', e)
+                                    setter(shop, object_type, object_name, attribute_name, attribute_value)
+    if hasattr(model, 'connections'):
+        if model.connections is not None:
+            add_model_connections(shop, model.connections)
+    if hasattr(model, 'commands'):
+        if model.commands is not None:
+            return execute_commands(shop, model.commands)
+    return None
+
+def get_object_names(shop: ShopSession, object_type: str) -> List[str]:
+    return list(get_object_generator(shop, object_type).get_object_names())
+
+def _object_generator_for_update(shop: ShopSession, object_type: str):
+    try:
+        object_generator = shop.model[object_type]
+    except Exception as e:
+        raise HTTPException(500, f'model does not implement object_type {{{object_type}}}')
+
+    for cmd in shop.get_executed_commands():
+        if 'start sim' in cmd:
+            shop._sim_has_started = True
+            break
+
+    if shop._sim_has_started:
+        raise HTTPException(500, f'simulation has already been started, make a new session first')
+
+    return object_generator
+
+def _set_object_instance(shop: ShopSession, object_generator, object_names: Set[str], object_type: str, object_name: str, object_instance: ObjectInstance) -> bool:
+
+    """
+        Adds the object unless it is in object_names, and sets the attributes of object_instance. Returns True if the object was added.
+    """
+
+    created = object_name not in object_names
+    if created:
+        try:
+            object_generator.add_object(object_name)
+        except Exception as e:
+            raise HTTPException(500, f'object_name {{{object_name}}} is in conflict with existing instance')
+        object_names.add(object_name)
+
+    if object_instance and object_instance.attributes:
+        writers = attribute_writers[object_type]
+        for (k,v) in object_instance.attributes.items():
+
+            try:
+                setter = writers[k]
+            except Exception as e:
+                http_raise_internal(f'unknown object_attribute {k} for object_type {object_type}', e)
+            setter(shop, object_type, object_name, k, v)
+
+    return created
+
+def set_model_object_instance(shop: ShopSession, object_type: str, object_name: str, object_instance: ObjectInstance) -> ObjectInstance:
+
+    object_generator = _object_generator_for_update(shop, object_type)
+    _set_object_instance(shop, object_generator, set(object_generator.get_object_names()), object_type, object_name, object_instance)
+
+    get_object(shop, object_type, object_name)
+    return serialize_model_object_instance(shop, object_type, object_name)
+
+def set_model_object_instances(shop: ShopSession, object_type: str, object_instances: Dict[str, ObjectInstance], minimal: bool = False) -> Dict[str, Any]:
+
+    """
+        Adds or modifies many instances of one object_type, {object_name: ObjectInstance}. An instance that fails is
+        reported in errors and does not stop the others. Returns the fields of ObjectInstancesStatus, the instances are
+        read back (like GET /model/{object_type}) unless minimal.
+    """
+
+    object_generator = _object_generator_for_update(shop, object_type)
+    object_names = set(object_generator.get_object_names())
+
+    created, updated = 0, 0
+    errors: Dict[str, str] = {}
+    for object_name, object_instance in object_instances.items():
+        try:
+            if _set_object_instance(shop, object_generator, object_names, object_type, object_name, object_instance):
+                created += 1
+            else:
+                updated += 1
+        except HTTPException as e:
+            errors[object_name] = str(e.detail)
+        except Exception as e:
+            errors[object_name] = str(e)
+
+    status = {'object_type': str(getattr(object_type, 'value', object_type)), 'created': created, 'updated': updated, 'failed': len(errors), 'errors': errors}
+    if not minimal:
+        status['instances'] = {
+            object_name: get_model_object_instance_dict(shop, object_type, object_name)
+            for object_name in object_instances if object_name not in errors
+        }
+    return status
+
+def get_model_object_instance_dict(shop: ShopSession, object_type: str, object_name: str, timeFormat: TimeFormatEnum = TimeFormatEnum.iso) -> Dict[str, Any]:
+    get_object(shop, object_type, object_name) # Check that object exists
+    session_index = session_time_index(shop) if timeFormat == TimeFormatEnum.implicit else None
+    return {
+        'attributes': {
+            attribute_name: read(shop, object_name, False, timeFormat, session_index)
+            for attribute_name, read in attribute_readers[object_type].items()
+        }
+    }
+
+# ------ connections
+
+def add_model_connection(shop: ShopSession, from_type: str, from_name: str, to_type: str, to_name: str, connection_type: str = ''):
+    fo = get_object(shop, from_type, from_name)
+    to = get_object(shop, to_type, to_name)
+    fo.connect_to(to, connection_type=connection_type)
+
+def add_model_connections(shop: ShopSession, connections: List[Connection]):
+    for connection in connections:
+        relation_type = connection.relation_type if connection.relation_type != 'default' else ''
+        add_model_connection(shop, connection.from_type, connection.from_, connection.to_type, connection.to, relation_type)
+
+def get_topology(shop: ShopSession) -> str:
+    return shop.model.build_connection_tree().source
+
+# ------ commands
+
+def execute_command(shop: ShopSession, command: str, args: CommandArguments) -> CommandStatus:
+    shop._command = command
+    try:
+        with timing.command(command):
+            status: bool = shop._execute_command(args.options, args.values) # does this return anything
+    except Exception as e:
+        http_raise_internal('failed to execute simulation command', e)
+    return CommandStatus(
+        message=('ok' if status else 'something went wrong ...'),
+        status=status
+    )
+
+def execute_commands(shop: ShopSession, commands: List[Command]) -> CommandStatus:
+    status = True
+    for command in commands:
+        try:
+            # status: bool = session._execute_command(command.options, command.values) # does this return anything
+            with timing.command(command.command):
+                last_status = shop.shop_api.ExecuteCommand(command.command, command.options, command.values)
+            if status:
+                status = last_status
+        except Exception as e:
+            http_raise_internal('failed to execute simulation command', e)
+    return CommandStatus(
+        message=('ok' if status else 'something went wrong ...'),
+        status=status
+    )
+
+# ------ internal methods
+
+def get_internal_method_names(shop: ShopSession) -> List[str]:
+    return list(filter(lambda x: x[0] != '_', shop.shop_api.__dir__()))
+
+def get_internal_method_description(shop: ShopSession, command: str) -> str:
+    return str(getattr(shop.shop_api, command).__doc__)
+
+def call_internal_method(shop: ShopSession, command: str, args: tuple, kwargs: dict) -> Any:
+    res = getattr(shop.shop_api, command)(*args, **kwargs)
+    if command == 'GetTxySeriesY':
+        res = np.transpose(res)
+    return res
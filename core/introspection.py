@@ -0,0 +1,91 @@
+from typing import Any, Dict
+import datetime as dt
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from pyshop import ShopSession
+
+from . import config
+from .schemas import registry, SessionInfo
+from .reaper import process_rss
+from .workers import ShopSessionWorker
+
+
+def _value_bytes(value: Any) -> int:
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return int(value.values.nbytes + value.index.values.nbytes)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sum(_value_bytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def inspect_session(shop: ShopSession) -> Dict[str, Any]:
+
+    """
+        Counts the objects and the attributes that have a value, and estimates the memory of the values as pyshop returns them.
+        Reads every attribute, so the result is cached on the worker (see session_info).
+    """
+
+    object_count = attribute_count = value_bytes = 0
+    for object_type in registry.object_types:
+        for object_name in shop.model[object_type].get_object_names():
+            object_count += 1
+            for attribute_name in registry.attribute_names[object_type]:
+                try:
+                    value = shop.model[object_type][object_name][attribute_name].get()
+                except Exception:
+                    continue
+                if value is not None:
+                    attribute_count += 1
+                    value_bytes += _value_bytes(value)
+    return {'object_count': object_count, 'attribute_count': attribute_count, 'value_bytes': value_bytes}
+
+
+async def session_info(worker: ShopSessionWorker) -> SessionInfo:
+
+    """
+        Never waits for a busy session: the object counts are refreshed at most every config.SESSION_INSPECT_INTERVAL seconds
+        and only while the session is idle, otherwise the last counts are returned.
+    """
+
+    now = time.monotonic()
+    if (
+        worker.pending_calls == 0 and not worker.spill_file
+        and (worker.inspected_at is None or now - worker.inspected_at >= config.SESSION_INSPECT_INTERVAL)
+    ):
+        inspection = await worker.peek(inspect_session)
+        if inspection is not None:
+            worker.inspection, worker.inspected_at = inspection, time.monotonic()
+
+    inspection = worker.inspection or {}
+    current_call, current_call_started = worker.current_call, worker.current_call_started
+    if worker.spill_file:
+        memory_bytes, memory_source = None, 'spilled'
+    elif worker.pid is not None:
+        memory_bytes, memory_source = process_rss(worker.pid), 'process'
+    else:
+        memory_bytes, memory_source = inspection.get('value_bytes'), 'estimate'
+
+    return SessionInfo(
+        session_id=worker.id,
+        session_name=worker.name,
+        status=worker.status,
+        created_at=worker.created_at,
+        last_accessed=worker.last_accessed,
+        idle_seconds=0.0 if current_call else max(0.0, now - worker.last_used),
+        current_call=current_call,
+        current_call_seconds=now - current_call_started if current_call_started else None,
+        pending_calls=worker.pending_calls,
+        call_count=worker.call_count,
+        command_seconds=worker.command_seconds,
+        memory_bytes=memory_bytes,
+        memory_source=memory_source,
+        spill_file_bytes=os.path.getsize(worker.spill_file) if worker.spill_file and os.path.exists(worker.spill_file) else None,
+        object_count=inspection.get('object_count'),
+        attribute_count=inspection.get('attribute_count'),
+        inspected_at=dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=now - worker.inspected_at) if worker.inspected_at else None,
+    )
@@ -0,0 +1,167 @@
+from fastapi import HTTPException
+import datetime as dt
+from typing import Any, Callable, Dict, List, Tuple
+import asyncio
+import time
+import weakref
+
+from . import config
+from .sessions import SessionManager
+from .schemas import Job, JobCommand, JobStatusEnum, CommandStatus
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+class JobRecord:
+
+    def __init__(self, username: str, job: Job, steps: List[Tuple[Callable, tuple]]):
+        self.username: str = username
+        self.job: Job = job
+        self.steps: List[Tuple[Callable, tuple]] = steps
+        self.done: asyncio.Event = asyncio.Event()
+        self.task: asyncio.Task = None
+
+
+class JobManager:
+
+    """
+        Runs SHOP commands in the background. A job is a list of commands that is executed in order,
+        jobs on the same session are executed one after the other in the order they were submitted.
+    """
+
+    jobs: Dict[int, JobRecord] = {}
+    job_counter: int = 0
+    # a lock only lives while some job on the session holds a reference to it, so deleted sessions leave nothing behind
+    session_locks: 'weakref.WeakValueDictionary[Tuple[str, int], asyncio.Lock]' = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def submit(username: str, session_id: int, commands: List[JobCommand], steps: List[Tuple[Callable, tuple]]) -> Job:
+
+        """
+            Every command is paired with a step (func, args) that is executed as SessionManager.call(username, session_id, func, *args).
+            The job is queued immediately, use wait(...) or get_job(...) to follow it.
+        """
+
+        SessionManager.get_shop_session(username, session_id) # Check that session exists
+
+        JobManager.job_counter += 1
+        for command in commands:
+            command.status = JobStatusEnum.queued
+        job = Job(
+            job_id=JobManager.job_counter,
+            session_id=session_id,
+            status=JobStatusEnum.queued,
+            submitted_at=_now(),
+            commands=commands
+        )
+
+        record = JobRecord(username, job, steps)
+        JobManager.jobs[job.job_id] = record
+        record.task = asyncio.create_task(JobManager._run(record))
+        JobManager._prune()
+        return job
+
+    @staticmethod
+    async def _run(record: JobRecord):
+
+        job = record.job
+        key = (record.username, job.session_id)
+        lock = JobManager.session_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            JobManager.session_locks[key] = lock
+
+        try:
+            async with lock:
+                job.status = JobStatusEnum.running
+                job.started_at = _now()
+                job_start = time.perf_counter()
+
+                for command, (func, args) in zip(job.commands, record.steps):
+                    if job.status == JobStatusEnum.failed:
+                        command.status = JobStatusEnum.cancelled
+                        continue
+
+                    command.status = JobStatusEnum.running
+                    command.started_at = _now()
+                    command_start = time.perf_counter()
+                    try:
+                        result: Any = await SessionManager.call(record.username, job.session_id, func, *args)
+                        command.result = result.status if isinstance(result, CommandStatus) else bool(result)
+                        command.status = JobStatusEnum.finished
+                    except HTTPException as e:
+                        command.error = str(e.detail)
+                        command.status = JobStatusEnum.failed
+                    except Exception as e:
+                        command.error = f'{type(e).__name__}: {e}'
+                        command.status = JobStatusEnum.failed
+                    command.finished_at = _now()
+                    command.duration = time.perf_counter() - command_start
+
+                    if command.status == JobStatusEnum.failed:
+                        job.status = JobStatusEnum.failed
+
+                if job.status != JobStatusEnum.failed:
+                    job.status = JobStatusEnum.finished
+                job.finished_at = _now()
+                job.duration = time.perf_counter() - job_start
+        except asyncio.CancelledError:
+            job.status = JobStatusEnum.cancelled
+            for command in job.commands:
+                if command.status == JobStatusEnum.queued:
+                    command.status = JobStatusEnum.cancelled
+        finally:
+            record.done.set()
+
+    @staticmethod
+    def _prune():
+        # finished jobs are kept for inspection, but only the most recent ones
+        finished = [job_id for job_id, record in JobManager.jobs.items() if record.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - config.JOB_HISTORY_SIZE)]:
+            JobManager.jobs.pop(job_id)
+
+    @staticmethod
+    def _get_record(username: str, job_id: int) -> JobRecord:
+        record = JobManager.jobs.get(job_id)
+        if record is None or record.username != username:
+            raise HTTPException(404, f'Job with id {{{job_id}}} not found')
+        return record
+
+    @staticmethod
+    def get_jobs(username: str, session_id: int = None) -> List[Job]:
+        return [
+            record.job for record in JobManager.jobs.values()
+            if record.username == username and (session_id is None or record.job.session_id == session_id)
+        ]
+
+    @staticmethod
+    def get_job(username: str, job_id: int) -> Job:
+        return JobManager._get_record(username, job_id).job
+
+    @staticmethod
+    async def wait(username: str, job_id: int, timeout: float) -> Job:
+
+        """
+            Waits until the job is done or the timeout (in seconds) has passed, and returns the job in either case.
+        """
+
+        record = JobManager._get_record(username, job_id)
+        try:
+            await asyncio.wait_for(asyncio.shield(record.done.wait()), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return record.job
+
+    @staticmethod
+    def cancel(username: str, job_id: int) -> Job:
+        record = JobManager._get_record(username, job_id)
+        if record.job.status == JobStatusEnum.running:
+            raise HTTPException(409, f'Job with id {{{job_id}}} is already running and cannot be cancelled')
+        if record.job.status == JobStatusEnum.queued:
+            record.task.cancel()
+            record.job.status = JobStatusEnum.cancelled
+            for command in record.job.commands:
+                command.status = JobStatusEnum.cancelled
+        return record.job
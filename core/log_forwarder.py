@@ -0,0 +1,134 @@
+from typing import Dict, List
+import logging
+import queue
+import threading
+import time
+import requests
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+class LogForwarder:
+
+    """
+        Forwards SHOP log messages to a logging endpoint without ever blocking the caller.
+
+        Messages are put on a bounded queue and sent by a background thread over one keep-alive connection,
+        either one message per request or (batch=True) as JSON lists of up to batch_size messages.
+        When the queue fills up, info messages are sampled and finally dropped, warnings and errors are only dropped
+        when the queue is completely full. Everything that is not delivered is counted.
+    """
+
+    def __init__(
+            self,
+            max_queue_size: int = config.LOG_QUEUE_SIZE,
+            batch_size: int = config.LOG_BATCH_SIZE,
+            flush_interval: float = config.LOG_FLUSH_INTERVAL,
+            max_retries: int = config.LOG_MAX_RETRIES,
+            sample_rate: int = config.LOG_SAMPLE_RATE
+        ):
+        self.endpoint: str = ''
+        self.batch: bool = False
+        self.max_queue_size: int = max_queue_size
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.max_retries: int = max_retries
+        self.sample_rate: int = sample_rate
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._http = requests.Session()
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._sample_counter: int = 0
+        self._counters: Dict[str, int] = {
+            'enqueued': 0,
+            'sent': 0,
+            'dropped': 0,
+            'sampled_out': 0,
+            'failed': 0,
+            'retries': 0,
+            'requests': 0,
+        }
+
+    def configure(self, endpoint: str, batch: bool = False):
+        self.endpoint = endpoint
+        self.batch = batch
+
+    def _count(self, counter: str, n: int = 1):
+        with self._lock:
+            self._counters[counter] += n
+
+    def submit(self, level: str, message: str, id: str):
+        if not self.endpoint:
+            return
+
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='log-forwarder', daemon=True)
+                    self._thread.start()
+
+        # under back-pressure only every sample_rate'th info message is kept
+        if self._queue.qsize() >= self.max_queue_size // 2 and not is_important(level):
+            self._sample_counter += 1
+            if self._sample_counter % self.sample_rate != 0:
+                self._count('sampled_out')
+                return
+
+        try:
+            self._queue.put_nowait({'level': level, 'message': message, 'id': id})
+            self._count('enqueued')
+        except queue.Full:
+            self._count('dropped')
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters['queued'] = self._queue.qsize()
+        return counters
+
+    def _run(self):
+        while True:
+            batch: List[dict] = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, messages: List[dict]):
+        endpoint = self.endpoint
+        if not endpoint:
+            self._count('dropped', len(messages))
+            return
+
+        payloads = [messages] if self.batch else messages
+        for payload in payloads:
+            n = len(payload) if self.batch else 1
+            for attempt in range(self.max_retries + 1):
+                if attempt > 0:
+                    self._count('retries')
+                    time.sleep(min(0.1 * 2 ** attempt, 5.0))
+                try:
+                    self._count('requests')
+                    resp = self._http.post(endpoint, json=payload, timeout=10)
+                    if resp.status_code == 200:
+                        self._count('sent', n)
+                        break
+                    logger.warning(f'logging endpoint {endpoint} responded with {resp.status_code}')
+                except Exception as e:
+                    logger.warning(f'failed to forward log messages to endpoint {endpoint}: {e}')
+            else:
+                self._count('failed', n)
+
+
+def is_important(level: str) -> bool:
+    level = str(level).upper()
+    return 'WARN' in level or 'ERR' in level
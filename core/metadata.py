@@ -0,0 +1,235 @@
+from typing import Any, Callable, Dict, Iterable, Mapping, NamedTuple, Optional, Tuple
+from types import MappingProxyType
+from enum import Enum
+import hashlib
+import json
+import os
+import tempfile
+from fastapi import HTTPException
+
+from . import config, fastjson
+
+# bump when the content of the metadata snapshot changes, so old cache files are not read
+_METADATA_FORMAT = 1
+
+#
+# Notice
+# - xy             <-> Curve
+# - xy_array, xyn  <-> OrderedDict[float, Curve]
+# - xyt            <-> OrderedDict[datetime, Curve]
+# - txy, #ttxy     <-> TimeSeries
+#
+
+class ObjectAttributeTypeEnum(str, Enum):
+    boolean = 'boolean'
+    integer = 'integer'
+    float = 'float'
+    string = 'string'
+    datetime = 'datetime'
+    float_array = 'float_array',
+    integer_array = 'integer_array',
+    string_array = 'string_array';
+    Curve = 'Curve'
+    MapFloatCurve = 'OrderedDict[float, Curve]'
+    MapTimeCurve = 'OrderedDict[datetime, Curve]'
+    TimeSeries = 'TimeSeries'
+
+
+_ATTRIBUTE_TYPES = {
+    'bool': ObjectAttributeTypeEnum.boolean,
+    'int': ObjectAttributeTypeEnum.integer,
+    'double': ObjectAttributeTypeEnum.float,
+    'str': ObjectAttributeTypeEnum.string,
+    'string': ObjectAttributeTypeEnum.string,
+    'double_array': ObjectAttributeTypeEnum.float_array,
+    'int_array': ObjectAttributeTypeEnum.integer_array,
+    'string_array': ObjectAttributeTypeEnum.string_array,
+    'xy': ObjectAttributeTypeEnum.Curve,
+    'xy_array': ObjectAttributeTypeEnum.MapFloatCurve,
+    'xyn': ObjectAttributeTypeEnum.MapFloatCurve,
+    'xyt': ObjectAttributeTypeEnum.MapTimeCurve,
+    'txy': ObjectAttributeTypeEnum.TimeSeries,
+}
+
+
+def new_attribute_type_name_from_old(name: str) -> ObjectAttributeTypeEnum:
+
+    if name in _ATTRIBUTE_TYPES:
+        return _ATTRIBUTE_TYPES[name]
+    else:
+        raise HTTPException(500, f'name {{{name}}} not in understood type_name list ... needs to be handled ...')
+
+
+def _as_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
+def _as_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class AttributeMetadata(NamedTuple):
+    name: str
+    datatype: str
+    attribute_type: Optional[ObjectAttributeTypeEnum] # None if the SHOP datatype is not supported by the api
+    is_input: bool
+    is_output: bool
+    x_unit: str
+    y_unit: str
+    info: Mapping[str, Any]
+
+
+class MetadataRegistry:
+
+    """
+        Read-only metadata about all object types and their attributes, built once at startup from
+        {object_type: {attribute_name: attribute_info}}, where attribute_info is the dict returned by pyshop's get_attribute_info.
+
+        The metadata is the same for every session, so the responses of the metadata endpoints are rendered here once.
+    """
+
+    def __init__(self, attribute_info: Dict[str, Dict[str, Dict[str, Any]]]):
+
+        self.object_types: Tuple[str, ...] = tuple(attribute_info)
+        self.attribute_names: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+            object_type: tuple(attributes) for object_type, attributes in attribute_info.items()
+        })
+        self.attributes: Mapping[str, Mapping[str, AttributeMetadata]] = MappingProxyType({
+            object_type: MappingProxyType({
+                attribute_name: AttributeMetadata(
+                    name=attribute_name,
+                    datatype=info['datatype'],
+                    attribute_type=_ATTRIBUTE_TYPES.get(info['datatype']),
+                    is_input=_as_bool(info.get('isInput')),
+                    is_output=_as_bool(info.get('isOutput')),
+                    x_unit=info.get('xUnit', 'unknown'),
+                    y_unit=info.get('yUnit', 'unknown'),
+                    info=MappingProxyType(dict(info))
+                ) for attribute_name, info in attributes.items()
+            }) for object_type, attributes in attribute_info.items()
+        })
+        # attribute_map[object_type][attribute_name][info_key], the raw attribute info as returned by pyshop
+        self.attribute_map: Mapping[str, Mapping[str, Mapping[str, Any]]] = MappingProxyType({
+            object_type: MappingProxyType({
+                attribute_name: attribute.info for attribute_name, attribute in attributes.items()
+            }) for object_type, attributes in self.attributes.items()
+        })
+
+        self.information_json: bytes = fastjson.dumps(attribute_info)
+        self.object_types_json: bytes = fastjson.dumps(list(self.object_types))
+        self._attributes_json: Mapping[Tuple[str, bool], bytes] = MappingProxyType({
+            (object_type, verbose): fastjson.dumps(self.object_type_attributes(object_type, verbose))
+            for object_type in self.object_types for verbose in (False, True)
+        })
+
+    def attribute_type(self, object_type: str, attribute_name: str) -> ObjectAttributeTypeEnum:
+        attribute = self.attributes[object_type][attribute_name]
+        if attribute.attribute_type is None:
+            return new_attribute_type_name_from_old(attribute.datatype)
+        return attribute.attribute_type
+
+    def object_type_attributes(self, object_type: str, verbose: bool) -> Dict[str, Any]:
+
+        """
+            The attributes field of ObjectType, attribute types only or (verbose) all fields of ObjectAttribute.
+        """
+
+        attributes = self.attributes[object_type]
+        if not verbose:
+            return {name: attribute.attribute_type for name, attribute in attributes.items()}
+
+        return {
+            name: {
+                'attribute_name': name,
+                'attribute_type': attribute.attribute_type,
+                'is_input': attribute.is_input,
+                'is_output': attribute.is_output,
+                'legacy_datatype': attribute.datatype,
+                'x_unit': _as_str(attribute.info.get('xUnit')),
+                'y_unit': _as_str(attribute.info.get('yUnit')),
+                'license_name': _as_str(attribute.info.get('licenseName')),
+                'full_name': _as_str(attribute.info.get('fullName')),
+                'data_func_name': _as_str(attribute.info.get('dataFuncName')),
+                'description': _as_str(attribute.info.get('description')),
+                'documentation_url': _as_str(attribute.info.get('documentationUrl')),
+                'example_url_prefix': _as_str(attribute.info.get('exampleUrlPrefix')),
+                'example': _as_str(attribute.info.get('example')),
+            } for name, attribute in attributes.items()
+        }
+
+    def object_type_information_json(self, object_type: str, instances: Iterable[str], verbose: bool) -> bytes:
+        # same document as ObjectType, with the pre-rendered attributes spliced in
+        return b''.join([
+            b'{"object_type":', fastjson.dumps(object_type),
+            b',"instances":', fastjson.dumps(list(instances)),
+            b',"attributes":', self._attributes_json[(object_type, verbose)],
+            b'}'
+        ])
+
+
+def shop_versions() -> Dict[str, str]:
+
+    """
+        Identifies the installed pyshop and SHOP binaries without starting SHOP.
+        SHOP has no version file, so the binaries in ICC_COMMAND_PATH are fingerprinted by name, size and modification time.
+    """
+
+    try:
+        from importlib.metadata import version
+        pyshop_version = version('sintef-pyshop')
+    except Exception:
+        pyshop_version = 'unknown'
+
+    fingerprint = hashlib.sha256()
+    shop_path = os.environ.get('ICC_COMMAND_PATH', '')
+    if os.path.isdir(shop_path):
+        for entry in sorted(os.scandir(shop_path), key=lambda e: e.name):
+            if entry.is_file():
+                stat = entry.stat()
+                fingerprint.update(f'{entry.name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+
+    versions = {'format': str(_METADATA_FORMAT), 'pyshop': pyshop_version, 'shop': fingerprint.hexdigest()}
+    if config.SHOP_SESSION_CLASS:
+        versions['session_class'] = config.SHOP_SESSION_CLASS
+    return versions
+
+
+def load_metadata(probe: Callable[[], Dict[str, Any]], cache_dir: str = None) -> Dict[str, Any]:
+
+    """
+        Returns the metadata snapshot for the installed pyshop/SHOP versions, from the cache file if it exists.
+        Otherwise probe() is called to read it from a live ShopSession, and the result is written to the cache.
+        The snapshot must be JSON serializable.
+    """
+
+    cache_dir = config.METADATA_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return probe()
+
+    versions = shop_versions()
+    key = hashlib.sha256(json.dumps(versions, sort_keys=True).encode()).hexdigest()[:16]
+    cache_file = os.path.join(cache_dir, f'metadata-{key}.json')
+
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+        if cached.get('versions') == versions:
+            return cached['metadata']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    metadata = probe()
+
+    # written to a temporary file first, so that concurrently starting servers never read half a file
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'versions': versions, 'metadata': metadata}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+    return metadata
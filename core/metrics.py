@@ -0,0 +1,183 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+import bisect
+import threading
+import time
+
+from . import config
+
+#
+# Metrics in the Prometheus text format, served at GET /metrics
+# - a small in-process implementation, so that recording a value is a lock, a bisect and two additions
+# - values that are already counted elsewhere (sessions, jobs, log forwarder) are read when /metrics is scraped
+#
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COMMAND_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {} # labels -> (count per bucket, [sum])
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or self._values.setdefault(labels, ([0] * len(self.buckets), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def time(self, *labels: str) -> '_Timer':
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total[0])}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class _Timer:
+
+    def __init__(self, histogram: Histogram, labels: Labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+REQUEST_DURATION = Histogram('restshop_http_request_duration_seconds', 'Time to handle a request, by route template and status code.', ('method', 'route', 'status'))
+REQUEST_BYTES = Counter('restshop_http_request_bytes_total', 'Request body bytes received, by route template.', ('method', 'route'))
+RESPONSE_BYTES = Counter('restshop_http_response_bytes_total', 'Response body bytes sent, by route template.', ('method', 'route'))
+SHOP_CALL_DURATION = Histogram('restshop_shop_call_duration_seconds', 'Time of calls into a ShopSession, by interface function.', ('function',), COMMAND_BUCKETS)
+SHOP_COMMAND_DURATION = Histogram('restshop_shop_command_duration_seconds', 'Time of SHOP commands run by a session (/simulation, /jobs and the commands of a model), by command.', ('command',), COMMAND_BUCKETS)
+SERIALIZE_DURATION = Histogram('restshop_serialize_duration_seconds', 'Time spent encoding response bodies, by format.', ('format',))
+
+_METRICS = [REQUEST_DURATION, REQUEST_BYTES, RESPONSE_BYTES, SHOP_CALL_DURATION, SHOP_COMMAND_DURATION, SERIALIZE_DURATION]
+
+# name -> (type, help, callback returning [(labels dict, value)]), read when /metrics is scraped
+_collectors: Dict[str, Tuple[str, str, Callable[[], List[Tuple[Dict[str, str], float]]]]] = {}
+
+
+def register_collector(name: str, metric_type: str, help: str, collect: Callable[[], List[Tuple[Dict[str, str], float]]]):
+    _collectors[name] = (metric_type, help, collect)
+
+
+def render() -> bytes:
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    for name, (metric_type, help, collect) in _collectors.items():
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} {metric_type}']
+        for labels, value in collect():
+            lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class MetricsMiddleware:
+
+    """
+        ASGI middleware that records the duration, status and body sizes of every request.
+        Requests are labelled with the path template of the route (e.g. /model/{object_type}), not the concrete path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Callable, str] = None
+
+    def _route(self, scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(route, 'endpoint', None): route.path for route in scope['app'].routes if hasattr(route, 'path')
+            }
+        # the router puts the matched endpoint into the scope
+        return self._route_paths.get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not config.METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = ['500']
+        received = [0]
+        sent = [0]
+
+        async def counting_receive():
+            message = await receive()
+            received[0] += len(message.get('body', b''))
+            return message
+
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            elif message['type'] == 'http.response.body':
+                sent[0] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            method, route = scope['method'], self._route(scope)
+            REQUEST_DURATION.observe(time.perf_counter() - start, method, route, status[0])
+            REQUEST_BYTES.inc(received[0], method, route)
+            RESPONSE_BYTES.inc(sent[0], method, route)
@@ -0,0 +1,92 @@
+from typing import Callable, Dict, List
+import logging
+import threading
+import time
+
+from . import config
+from .workers import ShopSessionWorker, create_shop_session_worker
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+
+    """
+        Keeps up to size ShopSession workers started ahead of time, so that creating a session does not have to wait
+        for SHOP to load and check its license.
+
+        Pooled workers are started with the default log file and the logging callback given to start(). acquire(...) hands
+        one out and gives it the identity of the new session, a background thread then starts a replacement.
+        Requests the pool can not serve (another log file or backend, or an empty pool) are counted as misses and the
+        caller creates the session itself.
+    """
+
+    def __init__(self, size: int = config.SESSION_POOL_SIZE, backend: str = config.SESSION_BACKEND, log_file: str = config.SESSION_POOL_LOG_FILE):
+        self.size: int = size
+        self.backend: str = backend
+        self.log_file: str = log_file
+        self.logging_callback: Callable = None
+
+        self._workers: List[ShopSessionWorker] = []
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._refill = threading.Condition(self._lock)
+        self._counters: Dict[str, int] = {
+            'hits': 0,
+            'misses': 0,
+            'created': 0,
+            'failed': 0,
+        }
+
+    def start(self, logging_callback: Callable = None):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self.logging_callback = logging_callback
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-pool', daemon=True)
+                self._thread.start()
+
+    def acquire(self, session_id: int, session_name: str, log_file: str = '', logging_callback: Callable = None, logging_callback_id: str = '', backend: str = None) -> ShopSessionWorker:
+
+        """
+            Returns a pooled worker bound to the given session, or None if the pool can not serve the request.
+        """
+
+        with self._lock:
+            matches = (
+                log_file == self.log_file
+                and logging_callback is self.logging_callback
+                and (backend or config.SESSION_BACKEND) == self.backend
+            )
+            worker = self._workers.pop() if matches and self._workers else None
+            self._counters['hits' if worker else 'misses'] += 1
+            self._refill.notify()
+
+        if worker is None:
+            return None
+        worker.bind(session_id, session_name, logging_callback_id)
+        return worker
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, size=self.size, available=len(self._workers))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while len(self._workers) >= self.size:
+                    self._refill.wait()
+
+            try:
+                worker = create_shop_session_worker(self.backend, 0, 'pooled', self.log_file, self.logging_callback, '')
+            except Exception as e:
+                with self._lock:
+                    self._counters['failed'] += 1
+                logger.warning(f'Could not start a pooled ShopSession: {e}')
+                time.sleep(config.SESSION_POOL_RETRY_INTERVAL)
+                continue
+
+            with self._lock:
+                self._workers.append(worker)
+                self._counters['created'] += 1
@@ -0,0 +1,176 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+import cProfile
+import datetime as dt
+import io
+import os
+import pstats
+import re
+import threading
+import uuid
+
+from . import config
+
+#
+# Opt-in profiling of single requests, see ProfilingMiddleware
+# - the event loop thread is profiled with cProfile while the request is handled
+# - calls into ShopSessions made for the request are profiled where they run (session thread or worker process),
+#   and their stats are merged into the profile of the request
+#
+
+PROFILE_HEADER = 'x-restshop-profile'
+PROFILE_ID_HEADER = 'x-restshop-profile-id'
+
+_PROFILE_ID = re.compile(r'^[0-9a-f]{12}$')
+
+
+class RequestProfile:
+
+    def __init__(self, method: str, path: str):
+        self.id: str = uuid.uuid4().hex[:12]
+        self.method: str = method
+        self.path: str = path
+        self.started_at: dt.datetime = dt.datetime.now(dt.timezone.utc)
+        self.profiler = cProfile.Profile()
+        self._stats: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add_stats(self, stats: Dict):
+        with self._lock:
+            self._stats.append(stats)
+
+    def save(self, profile_dir: str) -> str:
+        stats = pstats.Stats(self.profiler)
+        with self._lock:
+            for other in self._stats:
+                stats.add(_RawStats(other))
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f'{self.id}.prof')
+        stats.dump_stats(path)
+        _prune(profile_dir)
+        return path
+
+
+class _RawStats:
+
+    # pstats.Stats.add accepts anything with create_stats() and a stats dict
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('current_profile', default=None)
+
+# cProfile allows one active profiler per thread, so only one request is profiled at a time
+_active = threading.Lock()
+
+
+def run_profiled(shop, func: Callable, *args, **kwargs) -> Tuple[Any, Dict]:
+
+    """
+        Runs func(shop, *args, **kwargs) under cProfile and returns its result together with the raw stats.
+        Module level, so that it can be sent to a worker process like any other call.
+    """
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(shop, *args, **kwargs)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def _prune(profile_dir: str):
+    files = sorted(
+        (entry for entry in os.scandir(profile_dir) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in files[:max(0, len(files) - config.PROFILE_KEEP)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(config.PROFILE_DIR, f'{profile_id}.prof')
+    return path if os.path.exists(path) else None
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    if not os.path.isdir(config.PROFILE_DIR):
+        return []
+    entries = sorted(
+        (entry for entry in os.scandir(config.PROFILE_DIR) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    return [
+        {
+            'profile_id': entry.name[:-len('.prof')],
+            'created_at': dt.datetime.fromtimestamp(entry.stat().st_mtime, dt.timezone.utc),
+            'size': entry.stat().st_size,
+        } for entry in entries
+    ]
+
+
+def report(path: str, sort: str = 'cumulative', limit: int = 50) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def _requested(scope) -> bool:
+    for name, value in scope.get('headers', []):
+        if name == PROFILE_HEADER.encode() and value.lower() in (b'1', b'true', b'yes'):
+            return True
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('profile', ['false'])[-1].lower() in ('1', 'true', 'yes')
+
+
+class ProfilingMiddleware:
+
+    """
+        Profiles a request when config.PROFILING_ENABLED is set and the request has the header x-restshop-profile: 1
+        or the query parameter profile=true. The profile is written to config.PROFILE_DIR, its id is returned in the
+        x-restshop-profile-id header and it can be read from GET /profiles/{profile_id}.
+
+        Everything else that runs on the event loop meanwhile is included in the profile, so profile on a quiet server.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not config.PROFILING_ENABLED or not _requested(scope):
+            return await self.app(scope, receive, send)
+
+        if not _active.acquire(blocking=False):
+            # another request is being profiled
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope['method'], scope['path'])
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message, headers=list(message.get('headers', [])) + [(PROFILE_ID_HEADER.encode(), profile.id.encode())])
+            await send(message)
+
+        token = current_profile.set(profile)
+        try:
+            profile.profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_profile_id)
+            finally:
+                profile.profiler.disable()
+            profile.save(config.PROFILE_DIR)
+        finally:
+            current_profile.reset(token)
+            _active.release()
@@ -0,0 +1,194 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import gc
+import logging
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from . import config
+from .workers import ShopSessionWorker
+
+logger = logging.getLogger(__name__)
+
+Sessions = List[Tuple[str, ShopSessionWorker]] # (username, worker)
+
+
+def _proc_rss(pid: int) -> int:
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _proc_children(pid: int) -> List[int]:
+    children = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children += [int(child) for child in f.read().split()]
+        except OSError:
+            pass
+    return children
+
+
+def process_rss(pid: int = None) -> Optional[int]:
+
+    """
+        Resident memory in bytes of a process (default the api process) and its child processes, e.g. session workers.
+        None if it can not be measured on this platform. Uses psutil (optional dependency) if it is installed, /proc otherwise.
+    """
+
+    pid = os.getpid() if pid is None else pid
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+        except psutil.Error:
+            return None
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    try:
+        rss, pids = 0, [pid]
+        while pids:
+            pid = pids.pop()
+            try:
+                rss += _proc_rss(pid)
+                pids += _proc_children(pid)
+            except OSError:
+                pass
+        return rss
+    except Exception:
+        return None
+
+
+class SessionReaper:
+
+    """
+        Removes sessions in the background so that forgotten sessions do not fill up the server:
+        - sessions that have not been used for ttl_seconds
+        - the least recently used sessions while there are more than max_sessions
+        - the least recently used sessions that are not spilled to disk while the memory of the server is above rss_budget_mb
+        A session with running or queued calls is never removed. Every eviction is logged.
+        Expired user sessions (UserSession.expires) are removed as well.
+    """
+
+    def __init__(
+            self,
+            ttl_seconds: float = config.SESSION_TTL_SECONDS,
+            max_sessions: int = config.MAX_SESSIONS,
+            rss_budget_mb: float = config.RSS_BUDGET_MB,
+            check_interval: float = config.REAPER_CHECK_INTERVAL
+        ):
+        self.ttl_seconds: float = ttl_seconds
+        self.max_sessions: int = max_sessions
+        self.rss_budget_mb: float = rss_budget_mb
+        self.check_interval: float = check_interval
+
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            'evicted_ttl': 0,
+            'evicted_max_sessions': 0,
+            'evicted_memory': 0,
+            'skipped_busy': 0,
+            'checks': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 or self.max_sessions > 0 or self.rss_budget_mb > 0
+
+    def start(self, get_sessions: Callable[[], Sessions], remove_session: Callable[[str, int], bool], cleanup: Callable[[], None] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(get_sessions, remove_session, cleanup), name='session-reaper', daemon=True)
+                self._thread.start()
+
+    def stats(self) -> Dict[str, int]:
+        rss = process_rss()
+        with self._lock:
+            return dict(self._counters, rss_bytes=rss)
+
+    def _run(self, get_sessions: Callable[[], Sessions], remove_session: Callable[[str, int], bool], cleanup: Callable[[], None]):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                if cleanup:
+                    cleanup()
+                self.reap(get_sessions, remove_session)
+            except Exception as e:
+                logger.exception(f'Session reaper failed: {e}')
+
+    def _evict(self, username: str, worker: ShopSessionWorker, remove_session: Callable[[str, int], bool], reason: str, counter: str) -> bool:
+        if worker.pending_calls > 0:
+            with self._lock:
+                self._counters['skipped_busy'] += 1
+            return False
+        idle = time.monotonic() - worker.last_used
+        if not remove_session(username, worker.id):
+            return False
+        with self._lock:
+            self._counters[counter] += 1
+        logger.warning(f'Evicted session {worker.id} ({worker.name}) of user {username} after {idle:.0f} s idle: {reason}')
+        return True
+
+    def reap(self, get_sessions: Callable[[], Sessions], remove_session: Callable[[str, int], bool]) -> int:
+
+        """
+            One pass over all sessions, returns the number of evicted sessions.
+        """
+
+        with self._lock:
+            self._counters['checks'] += 1
+
+        now = time.monotonic()
+        # least recently used first
+        sessions = sorted(get_sessions(), key=lambda session: session[1].last_used)
+        evicted = 0
+
+        if self.ttl_seconds > 0:
+            remaining = []
+            for username, worker in sessions:
+                if now - worker.last_used > self.ttl_seconds and self._evict(username, worker, remove_session, f'idle longer than {self.ttl_seconds} s', 'evicted_ttl'):
+                    evicted += 1
+                else:
+                    remaining.append((username, worker))
+            sessions = remaining
+
+        if self.max_sessions > 0:
+            remaining = []
+            excess = len(sessions) - self.max_sessions
+            for username, worker in sessions:
+                if excess > 0 and self._evict(username, worker, remove_session, f'more than {self.max_sessions} sessions', 'evicted_max_sessions'):
+                    evicted += 1
+                    excess -= 1
+                else:
+                    remaining.append((username, worker))
+            sessions = remaining
+
+        if self.rss_budget_mb > 0:
+            budget = self.rss_budget_mb * 1024 * 1024
+            rss = process_rss()
+            for username, worker in sessions:
+                if rss is None or rss <= budget:
+                    break
+                if worker.spill_file:
+                    continue # holds no SHOP memory
+                if self._evict(username, worker, remove_session, f'memory {rss / 2**20:.0f} MB above budget of {self.rss_budget_mb} MB', 'evicted_memory'):
+                    evicted += 1
+                    # sessions are released on their own thread, give it a moment before measuring again
+                    time.sleep(0.1)
+                    gc.collect()
+                    rss = process_rss()
+
+        return evicted
@@ -1,7 +1,9 @@
-from typing import List, Dict, Optional, Union, Any, OrderedDict
+from typing import List, Dict, Optional, Union, Any, OrderedDict, Mapping, Type, Callable, Tuple
 from enum import Enum
-from pydantic import BaseModel, Field, create_model
+from types import MappingProxyType
+from pydantic import BaseModel, Field, create_model, root_validator
 from datetime import datetime
+import threading
 from fastapi import HTTPException
 
 import numpy as np
@@ -11,14 +13,40 @@ from pyshop import ShopSession
 from pyshop.shopcore.shop_api import get_attribute_info
 from pyshop.helpers.timeseries import remove_consecutive_duplicates
 
-from .sessions import SessionManager
+from .metadata import MetadataRegistry, AttributeMetadata, ObjectAttributeTypeEnum, new_attribute_type_name_from_old, load_metadata
+from .workers import shop_session_class
+from . import config, timing
+
+def _probe_metadata() -> Dict[str, Any]:
+
+    """
+        Reads the enums and other metadata from a live ShopSession, which is released again afterwards.
+    """
+
+    shop_session = shop_session_class()(license_path='', silent=True, name='metadata_probe', id=0)
+    try:
+        object_types = list(shop_session.model._all_types)
+        return {
+            'object_types': object_types,
+            'attribute_info': {
+                ot: {
+                    at: get_attribute_info(shop_session.shop_api, ot, at)
+                    for at in shop_session.shop_api.GetObjectTypeAttributeNames(ot)
+                } for ot in object_types
+            },
+            'relation_types': [
+                relation_type
+                for object_type in object_types
+                for relation_type in shop_session.shop_api.GetValidRelationTypes(object_type)
+            ],
+            'commands': dict(shop_session._commands),
+            'api_commands': [name for name in shop_session.shop_api.__dir__() if name[0] != '_'],
+        }
+    finally:
+        del shop_session
 
-# this dummy user and session is used to dynamically get enums and other metadata from a live ShopSession
-# TODO: make this cleaner, ... wrap in some init construct or something.
-dummy_user = '__dummy_user__'
-SessionManager.add_user_session('__dummy_user__', None)
-SessionManager.add_shop_session(dummy_user, 'default_session')
-_shop_session = SessionManager.get_shop_session(dummy_user, 1)
+# metadata is the same for every session, so it is only read from SHOP when the cache does not match the installed versions
+_metadata = load_metadata(_probe_metadata)
 
 class StrEnum(str, Enum):
     pass
@@ -51,18 +79,18 @@ class Item(BaseModel):
     price: float
     tax: Optional[float] = None
 
-_SHOP_OBJECT_TYPE_NAMES = _shop_session.model._all_types
-_SHOP_RELATION_TYPES = [
-    _shop_session.shop_api.GetValidRelationTypes(object_type)
-    for object_type in _SHOP_OBJECT_TYPE_NAMES
-] # flattens
-_SHOP_RELATION_TYPES = [e for sub in _SHOP_RELATION_TYPES for e in sub ]
-_SHOP_COMMANDS = _shop_session._commands
+_SHOP_OBJECT_TYPE_NAMES = _metadata['object_types']
+
+# metadata about all object types and attributes is read once, everything else looks it up in the registry
+registry = MetadataRegistry(_metadata['attribute_info'])
+attribute_map = registry.attribute_map
+_SHOP_RELATION_TYPES = _metadata['relation_types']
+_SHOP_COMMANDS = _metadata['commands']
 
 ApiCommandEnum = StrEnum(
     'ApiCommandEnum',
     names={
-        name: name for name in filter(lambda x : x[0] != '_', _shop_session.shop_api.__dir__())
+        name: name for name in _metadata['api_commands']
     }
 )
 
@@ -101,6 +129,16 @@ class Session(BaseModel):
     session_id: Optional[int] = Field(1, description='unique session identifier per user session')
     session_name: Optional[str] = Field('unnamed', description='name of session')
     log_file: Optional[str] = Field('pyshop_log.py', description='name of pyshop logfile')
+    status: Optional[str] = Field(None, description='set to failed if the SHOP worker of the session died and had to be restarted')
+    error: Optional[str] = Field(None, description='reason the session failed')
+    template: Optional[str] = Field(None, description='id of the model template the session is created from, see /templates')
+
+class Template(BaseModel):
+    template_id: str
+    created_at: datetime
+    has_time_resolution: bool
+    object_count: int = Field(description='number of object instances in the template')
+    connection_count: int
 
 # Commands
 
@@ -180,13 +218,36 @@ def DataFrame_from_pd(data_frame: pd.DataFrame) -> DataFrame:
 
 # ----------------- Primitive data types
 
+class TimeFormatEnum(StrEnum):
+    iso = 'iso'
+    epoch = 'epoch'
+    start_step = 'start_step'
+    implicit = 'implicit'
+
 class TimeSeries(BaseModel):
     name: Optional[str] = Field(None, description="name of the series")
     unit: Optional[str] = Field('NOK', description='unit of time series values')
     # values: Dict[datetime, List[float]] = Field({}, description='values')
-    timestamps: List[datetime]
+    timestamps: Optional[List[datetime]] = Field(None, description='one timestamp per value')
+    epoch_timestamps: Optional[List[int]] = Field(None, description='one timestamp per value in seconds since 1970-01-01T00:00:00Z')
+    start: Optional[datetime] = Field(None, description='timestamp of the first value, the following values are step seconds apart')
+    step: Optional[int] = Field(None, description='seconds between values, used together with start')
     values: List[List[float]]
 
+    @property
+    def is_implicit(self) -> bool:
+        return self.timestamps is None and self.epoch_timestamps is None and self.start is None
+
+    # without timestamps, epoch_timestamps or start the values follow the time resolution of the session
+    @root_validator(skip_on_failure=True)
+    def check_time_encoding(cls, series):
+        encodings = [key for key in ('timestamps', 'epoch_timestamps', 'start') if series.get(key) is not None]
+        if len(encodings) > 1:
+            raise ValueError(f'only one of timestamps, epoch_timestamps and start can be given, got {encodings}')
+        if (series.get('start') is None) != (series.get('step') is None):
+            raise ValueError('start and step must be given together')
+        return series
+
 def TimeSeries_from_pd(series: pd.Series) -> TimeSeries:
 
     if series is None or len(series) == 0:
@@ -198,60 +259,85 @@ def TimeSeries_from_pd(series: pd.Series) -> TimeSeries:
         values = [list(series.values)]
     )
 
+def TimeSeries_index(time_series: TimeSeries, session_index: pd.DatetimeIndex = None) -> pd.DatetimeIndex:
+
+    """
+        Returns the timestamps of the series whatever encoding it was sent with.
+        session_index is the time grid of the session (see session_time_index) and is only needed for implicit timestamps.
+    """
+
+    n = len(time_series.values[0]) if time_series.values else 0
+    if time_series.timestamps is not None:
+        return pd.DatetimeIndex(time_series.timestamps)
+    if time_series.epoch_timestamps is not None:
+        return pd.to_datetime(np.asarray(time_series.epoch_timestamps, dtype=np.int64), unit='s', utc=True)
+    if time_series.start is not None:
+        return pd.Timestamp(time_series.start) + pd.to_timedelta(np.arange(n, dtype=np.int64) * time_series.step, unit='s')
+    if session_index is None:
+        raise HTTPException(400, f'TimeSeries {{{time_series.name}}} has no timestamps and can not follow the time resolution here')
+    if n > len(session_index):
+        raise HTTPException(400, f'TimeSeries {{{time_series.name}}} has {n} values, but the time resolution of the session only has {len(session_index)} time steps')
+    return session_index[:n]
+
+def session_time_index(shop_session: ShopSession) -> pd.DatetimeIndex:
+
+    """
+        The start of every time step of the session, derived from its time resolution.
+    """
+
+    time_res = shop_session.get_time_resolution()
+    time_unit = pd.Timedelta(1, unit={'hour': 'h', 'minute': 'min', 'second': 's'}.get(time_res['timeunit'], 'h'))
+    end_time = pd.Timestamp(time_res['endtime'])
+    resolution = time_res['timeresolution']
+
+    # the resolution series holds the length of the time steps (in time units) from each of its timestamps onwards
+    breakpoints = [pd.Timestamp(t) for t in resolution.index] + [end_time]
+    steps = [
+        pd.date_range(t0, t1, freq=time_unit * float(length), inclusive='left')
+        for t0, t1, length in zip(breakpoints[:-1], breakpoints[1:], resolution.values)
+    ]
+    return steps[0].append(steps[1:]) if steps else pd.DatetimeIndex([])
+
+def TimeSeries_timestamps(shop_session: ShopSession, index: pd.DatetimeIndex, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex = None) -> Dict[str, Any]:
+
+    """
+        Encodes the timestamps of a series as TimeSeries fields in the requested format.
+        Falls back to a more explicit format when the series can not be represented, e.g. irregular series with start_step.
+    """
+
+    index = pd.DatetimeIndex(index)
+    nanoseconds = index.values.astype('datetime64[ns]').view(np.int64)
+
+    if timeFormat == TimeFormatEnum.implicit and len(index) > 0:
+        if session_index is None:
+            session_index = session_time_index(shop_session)
+        # compared as UTC nanoseconds, so that a series without time zone matches a session with one
+        if np.array_equal(session_index[:len(index)].values.astype('datetime64[ns]').view(np.int64), nanoseconds):
+            return {}
+
+    whole_seconds = bool((nanoseconds % 10**9 == 0).all())
+
+    if timeFormat in (TimeFormatEnum.implicit, TimeFormatEnum.start_step) and len(index) > 1 and whole_seconds:
+        steps = np.diff(nanoseconds)
+        if (steps == steps[0]).all():
+            return {'start': iso_timestamps(index[:1], True)[0], 'step': int(steps[0] // 10**9)}
+
+    if timeFormat != TimeFormatEnum.iso and whole_seconds:
+        return {'epoch_timestamps': nanoseconds // 10**9}
+
+    return {'timestamps': iso_timestamps(index, whole_seconds)}
+
+def iso_timestamps(index: pd.DatetimeIndex, whole_seconds: bool = True) -> List[str]:
+    # timestamps without time zone are taken as UTC
+    utc = index.tz_convert('UTC') if index.tz is not None else index
+    return [f'{t}+00:00' for t in np.datetime_as_string(utc.values, unit='s' if whole_seconds else 'us')]
+
 class Curve(BaseModel):
     x_unit: Optional[str] = Field('MW', description='unit of x_values')
     y_unit: Optional[str] = Field('%', description='unit of y_values')
     x_values: List[float]
     y_values: List[float]
 
-#
-# Notice
-# - xy             <-> Curve 
-# - xy_array, xyn  <-> OrderedDict[float, Curve]
-# - xyt            <-> OrderedDict[datetime, Curve]
-# - txy, #ttxy     <-> TimeSeries
-#
-
-class ObjectAttributeTypeEnum(str, Enum):
-    boolean = 'boolean'
-    integer = 'integer'
-    float = 'float'
-    string = 'string'
-    datetime = 'datetime'
-    float_array = 'float_array',
-    integer_array = 'integer_array',
-    string_array = 'string_array';
-    Curve = 'Curve'
-    MapFloatCurve = 'OrderedDict[float, Curve]'
-    MapTimeCurve = 'OrderedDict[datetime, Curve]'
-    TimeSeries = 'TimeSeries'
-
-
-def new_attribute_type_name_from_old(name: str) -> ObjectAttributeTypeEnum:
-    
-    conversion_map = {
-        'bool': ObjectAttributeTypeEnum.boolean,
-        'int': ObjectAttributeTypeEnum.integer,
-        'double': ObjectAttributeTypeEnum.float,
-        'str': ObjectAttributeTypeEnum.string,
-        'string': ObjectAttributeTypeEnum.string,
-        'double_array': ObjectAttributeTypeEnum.float_array,
-        'int_array': ObjectAttributeTypeEnum.integer_array,
-        'string_array': ObjectAttributeTypeEnum.string_array,
-        'xy': ObjectAttributeTypeEnum.Curve,
-        'xy_array': ObjectAttributeTypeEnum.MapFloatCurve,
-        'xyn': ObjectAttributeTypeEnum.MapFloatCurve,
-        'xyt': ObjectAttributeTypeEnum.MapTimeCurve,
-        'txy': ObjectAttributeTypeEnum.TimeSeries,
-    }
-
-    if name in conversion_map:
-        return conversion_map[name]
-    else:
-        raise HTTPException(500, f'name {{{name}}} not in understood type_name list ... needs to be handled ...')
-    return name
-    
-
 AttributeValue = Union[None, float, str, List[float], List[str], Curve, OrderedDict[float, Curve], OrderedDict[datetime, Curve], TimeSeries]
 
 class ObjectAttribute(BaseModel):
@@ -280,6 +366,18 @@ class ObjectTypeInstance(BaseModel):
     object_type: str
     instances: Dict[str, ObjectInstance]
 
+class ReturnEnum(StrEnum):
+    representation = 'representation'
+    minimal = 'minimal'
+
+class ObjectInstancesStatus(BaseModel):
+    object_type: str
+    created: int = Field(description='number of instances that were added')
+    updated: int = Field(description='number of existing instances that were modified')
+    failed: int = Field(description='number of instances with an error, they are not counted as created or updated')
+    errors: Dict[str, str] = Field({}, description='error of every failed instance, by object_name')
+    instances: Optional[Dict[str, ObjectInstance]] = Field(None, description='the instances after the update, left out with return=minimal')
+
 class ObjectType(BaseModel):
     object_type: str = Field(description='name of the object_type')
     # instances: Optional[Dict[str, ObjectInstance]] = Field(description='list of instances of this type')
@@ -314,12 +412,66 @@ class Connection(BaseModel):
 class ModelOld(BaseModel):
     object_types: List = Field(description='List of all object types and their corresponding object instances.')
 
-ObjectModel = {
-    o: create_model(
-        f'ObjectModel{o}',
-        **{a: (AttributeValue, None) for a in _shop_session.shop_api.GetObjectTypeAttributeNames(o)}
-    ) for o in _SHOP_OBJECT_TYPE_NAMES
-}
+class _ObjectModels(Mapping):
+
+    """
+        ObjectModel[object_type] is the pydantic model of one object instance, with one field per attribute.
+        There are thousands of attributes in total, so each model is only created the first time it is used.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, Type[BaseModel]] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, object_type: str) -> Type[BaseModel]:
+        model = self._models.get(object_type)
+        if model is None:
+            with self._lock:
+                model = self._models.get(object_type)
+                if model is None:
+                    model = create_model(
+                        f'ObjectModel{object_type}',
+                        __module__=__name__,
+                        **{a: (AttributeValue, None) for a in registry.attribute_names[object_type]}
+                    )
+                    self._models[object_type] = model
+        return model
+
+    def __iter__(self):
+        return iter(_SHOP_OBJECT_TYPE_NAMES)
+
+    def __len__(self):
+        return len(_SHOP_OBJECT_TYPE_NAMES)
+
+ObjectModel = _ObjectModels()
+
+def __getattr__(name: str) -> Any:
+    # dynamic models must be reachable as module attributes to be pickled to and from worker processes
+    if name.startswith('ObjectModel') and name[len('ObjectModel'):] in registry.attribute_names:
+        return ObjectModel[name[len('ObjectModel'):]]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def _object_model_field(object_type: str) -> type:
+
+    """
+        Field type of ObjectTypeModel that validates with ObjectModel[object_type], without creating it up front.
+    """
+
+    def validate(value: Any) -> BaseModel:
+        return ObjectModel[object_type].parse_obj(value)
+
+    def modify_schema(field_schema: Dict[str, Any]) -> None:
+        field_schema.update(
+            title=f'ObjectModel{object_type}',
+            type='object',
+            description=f'attributes of {object_type}, see /model/{object_type}/information for their types',
+            properties={a: {'title': a} for a in registry.attribute_names[object_type]},
+        )
+
+    return type(f'ObjectModelField{object_type}', (), {
+        '__get_validators__': classmethod(lambda cls: iter([validate])),
+        '__modify_schema__': staticmethod(modify_schema),
+    })
 
 class TimeResolution(BaseModel):
     start_time: datetime = Field(description="optimization start time")
@@ -329,7 +481,8 @@ class TimeResolution(BaseModel):
 
 ObjectTypeModel = create_model(
     'ObjectTypeModel',
-    **{o: (Dict[str, ObjectModel[o]], None) for o in _SHOP_OBJECT_TYPE_NAMES}
+    __module__=__name__,
+    **{o: (Dict[str, _object_model_field(o)], None) for o in _SHOP_OBJECT_TYPE_NAMES}
 )
 
 class Command(BaseModel):
@@ -343,120 +496,435 @@ class ShopModel(BaseModel):
     connections: Optional[List[Connection]]
     commands: Optional[List[Command]]
 
+# Jobs
+
+class JobStatusEnum(StrEnum):
+    queued = 'queued'
+    running = 'running'
+    finished = 'finished'
+    failed = 'failed'
+    cancelled = 'cancelled'
+
+class JobCommand(BaseModel):
+    command: str
+    options: List[str] = []
+    values: List[str] = []
+    status: JobStatusEnum = JobStatusEnum.queued
+    result: Optional[bool] = Field(None, description='return value of the SHOP command')
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration: Optional[float] = Field(None, description='execution time in seconds')
+
+class Job(BaseModel):
+    job_id: int
+    session_id: int
+    status: JobStatusEnum = JobStatusEnum.queued
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration: Optional[float] = Field(None, description='execution time in seconds, not counting time spent in the queue')
+    commands: List[JobCommand] = []
+
 
 # Logging
 
 class LoggingEndpoint(BaseModel):
     endpoint: str
+    batch: bool = Field(False, description='send lists of messages in each request instead of one message per request')
+
+class LoggingStats(BaseModel):
+    endpoint: str
+    batch: bool
+    queued: int = Field(description='messages waiting to be sent')
+    enqueued: int = Field(description='messages accepted by the queue')
+    sent: int = Field(description='messages delivered to the endpoint')
+    dropped: int = Field(description='messages dropped because the queue was full')
+    sampled_out: int = Field(description='info messages skipped while the queue was more than half full')
+    failed: int = Field(description='messages given up after all retries')
+    retries: int
+    requests: int
+
+class SessionInfo(BaseModel):
+    session_id: int
+    session_name: str
+    status: str = Field(description='ok, failed or spilled')
+    created_at: datetime
+    last_accessed: datetime = Field(description='start of the last call to the session')
+    idle_seconds: float = Field(description='seconds since the last call finished, 0 while a call is running')
+    current_call: Optional[str] = Field(None, description='the call that is running, e.g. execute_command start_sim')
+    current_call_seconds: Optional[float] = Field(None, description='how long the current call has been running')
+    pending_calls: int = Field(description='calls running or queued on the session')
+    call_count: int
+    command_seconds: float = Field(description='total time spent running SHOP commands')
+    memory_bytes: Optional[int] = Field(None, description='resident memory of the worker process, or with the thread backend an estimate of the model data')
+    memory_source: str = Field(description='process, estimate or spilled')
+    spill_file_bytes: Optional[int] = None
+    object_count: Optional[int] = None
+    attribute_count: Optional[int] = Field(None, description='attributes that have a value')
+    inspected_at: Optional[datetime] = Field(None, description='time the object and attribute counts were taken')
+
+class SessionPoolStats(BaseModel):
+    size: int = Field(description='number of sessions the pool keeps started')
+    available: int = Field(description='started sessions waiting in the pool')
+    hits: int = Field(description='sessions handed out from the pool')
+    misses: int = Field(description='sessions that had to be started on request')
+    created: int = Field(description='sessions started by the pool')
+    failed: int = Field(description='sessions that failed to start in the pool')
+
+class SessionSpillStats(BaseModel):
+    spilled: int = Field(description='sessions currently on disk')
+    spills: int = Field(description='sessions written to disk')
+    restores: int = Field(description='sessions restored from disk')
+    failed: int = Field(description='spills and restores that failed')
+    spilled_bytes: int = Field(description='bytes written to disk')
+    spill_seconds: float = Field(description='total time spent spilling')
+    restore_seconds: float = Field(description='total time spent restoring')
+    last_spill_seconds: float
+    last_restore_seconds: float
+
+class SessionReaperStats(BaseModel):
+    evicted_ttl: int = Field(description='sessions deleted because they were idle longer than the ttl')
+    evicted_max_sessions: int = Field(description='sessions deleted because there were too many sessions')
+    evicted_memory: int = Field(description='sessions deleted because the server was above its memory budget')
+    skipped_busy: int = Field(description='evictions skipped because the session was running a command')
+    checks: int
+    rss_bytes: Optional[int] = Field(description='current memory of the server including worker processes')
+
+class ProfileInfo(BaseModel):
+    profile_id: str
+    created_at: datetime
+    size: int = Field(description='size of the pstats file in bytes')
     
-def serialize_model_object_attribute(shop_session: ShopSession, object_type: str, object_name: str, attribute_name: str, compressTxy: bool) -> AttributeValue:
+# ------ raw array reads
+# time series and curves are read straight from the shop_api getters that pyshop calls to build its pandas objects,
+# the readers return None when the shop_api does not have them (or config.RAW_ARRAY_READS is off) and the value is read through pyshop
 
-    # attribute_type = new_attribute_type_name_from_old(attribute.info()['datatype'])
-    attribute_type = new_attribute_type_name_from_old(attribute_map[object_type][attribute_name]['datatype'])
-    # attribute_name = attribute._attr_name
-    info = attribute_map[object_type][attribute_name]
+TIME_UNIT_SECONDS = {'hour': 3600, 'minute': 60, 'second': 1}
 
-    attribute_y_unit = info['yUnit'] if 'yUnit' in info else 'unknown'
-    attribute_x_unit = info['xUnit'] if 'xUnit' in info else 'unknown'
+def _raw_getters(shop_session: ShopSession, *names: str) -> Optional[List[Callable]]:
+    if not config.RAW_ARRAY_READS:
+        return None
+    getters = [getattr(shop_session.shop_api, name, None) for name in names]
+    return None if None in getters else getters
+
+def shop_time_zone(shop_session: ShopSession) -> str:
+    # like pyshop: the times of SHOP are wall-clock times in this time zone, empty if none is set (or SHOP does not know time zones)
+    try:
+        return shop_session.shop_api.GetTimeZone()
+    except AttributeError:
+        return ''
+
+def shop_start_nanoseconds(time_string: str, time_zone: str) -> int:
+    # like pyshop: YYYYMMDD[HH[MM[SS]]], longer strings are cut after the seconds, the time is a wall-clock time in time_zone
+    time_string = time_string[:14]
+    start = pd.Timestamp(datetime.strptime(time_string, '%Y%m%d%H%M%S'[:len(time_string) - 2]))
+    return (start.tz_localize(time_zone) if time_zone else start).value
+
+def get_txy_raw(shop_session: ShopSession, object_type: str, object_name: str, attribute_name: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+
+    """
+        Returns (timestamps, values): timestamps are int64 nanoseconds since the epoch (UTC), values are float64 (time steps x scenarios).
+        Reads shop_api.GetTxySeriesStartTime (YYYYMMDDHHMMSS, empty if the series is not set), GetTxySeriesT (time units from start) and GetTxySeriesY.
+        Like pyshop, only the start is a wall-clock time in the time zone of the session, the offsets are elapsed time
+        from it (so series that cross a daylight saving change come out right), and values >= 1e40 (no value in SHOP) are NaN.
+    """
+
+    getters = _raw_getters(shop_session, 'GetTxySeriesStartTime', 'GetTxySeriesT', 'GetTxySeriesY', 'GetTimeUnit')
+    if getters is None:
+        return None
+    get_start_time, get_t, get_y, get_time_unit = getters
+    with timing.phase('shop'):
+        start_time = get_start_time(object_type, object_name, attribute_name)
+        if not start_time:
+            return np.empty(0, dtype=np.int64), np.empty((0, 1), dtype=np.float64)
+        offsets = get_t(object_type, object_name, attribute_name)
+        values = get_y(object_type, object_name, attribute_name)
+        try:
+            # per series time units came with SHOP 16.5
+            time_unit = shop_session.shop_api.GetTxySeriesTimeUnit(object_type, object_name, attribute_name)
+        except (AttributeError, KeyError):
+            time_unit = get_time_unit()
+        time_zone = shop_time_zone(shop_session)
+    with timing.phase('convert'):
+        start = shop_start_nanoseconds(start_time, time_zone)
+        nanoseconds = start + np.asarray(offsets, dtype=np.int64) * (TIME_UNIT_SECONDS.get(time_unit, 3600) * 10**9)
+        values = np.array(values, dtype=np.float64)
+        values[values >= 1e40] = np.nan
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+    return nanoseconds, values
+
+def get_xy_raw(shop_session: ShopSession, object_type: str, object_name: str, attribute_name: str) -> Optional[Tuple[float, np.ndarray, np.ndarray]]:
+    getters = _raw_getters(shop_session, 'GetXyCurveReference', 'GetXyCurveX', 'GetXyCurveY')
+    if getters is None:
+        return None
+    get_reference, get_x, get_y = getters
+    with timing.phase('shop'):
+        reference = get_reference(object_type, object_name, attribute_name)
+        x = get_x(object_type, object_name, attribute_name)
+        y = get_y(object_type, object_name, attribute_name)
+    with timing.phase('convert'):
+        return float(reference), np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+def get_xy_array_raw(shop_session: ShopSession, object_type: str, object_name: str, attribute_name: str) -> Optional[List[Tuple[float, np.ndarray, np.ndarray]]]:
+
+    """
+        Returns [(reference, x, y)], read with shop_api.GetXyCurveArrayReferences, NPoints, X and Y. X and Y hold all curves
+        after each other, the curves are views into them.
+    """
+
+    getters = _raw_getters(shop_session, 'GetXyCurveArrayReferences', 'GetXyCurveArrayNPoints', 'GetXyCurveArrayX', 'GetXyCurveArrayY')
+    if getters is None:
+        return None
+    get_references, get_points, get_x, get_y = getters
+    with timing.phase('shop'):
+        references = get_references(object_type, object_name, attribute_name)
+        points = get_points(object_type, object_name, attribute_name)
+        x = get_x(object_type, object_name, attribute_name)
+        y = get_y(object_type, object_name, attribute_name)
+    with timing.phase('convert'):
+        bounds = np.cumsum(np.asarray(points, dtype=np.int64))[:-1]
+        x = np.split(np.asarray(x, dtype=np.float64), bounds)
+        y = np.split(np.asarray(y, dtype=np.float64), bounds)
+        return [(float(reference), curve_x, curve_y) for reference, curve_x, curve_y in zip(references, x, y)]
+
+def _consecutive_changes(values: np.ndarray) -> np.ndarray:
+    # the rows (time steps) that pyshop.helpers.timeseries.remove_consecutive_duplicates keeps, NaN equals NaN
+    filled = np.where(np.isnan(values), 1e40, values)
+    keep = np.ones(len(filled), dtype=bool)
+    keep[1:] = (filled[1:] != filled[:-1]).any(axis=1)
+    return keep
+
+def _time_series_fields(
+        shop_session: ShopSession,
+        name: Optional[str],
+        unit: str,
+        index: pd.DatetimeIndex,
+        values: np.ndarray,
+        timeFormat: TimeFormatEnum,
+        session_index: pd.DatetimeIndex
+    ) -> Dict[str, Any]:
+    time_series = {'name': name, 'unit': unit}
+    time_series.update(TimeSeries_timestamps(shop_session, index, timeFormat, session_index))
+    time_series['values'] = values
+    return {k: v for k, v in time_series.items() if v is not None}
+
+def encode_curve(curve: pd.Series, x_unit: str, y_unit: str) -> Dict[str, Any]:
+    return curve_fields(curve.index.to_numpy(dtype=np.float64), curve.to_numpy(dtype=np.float64), x_unit, y_unit)
+
+def curve_fields(x_values: np.ndarray, y_values: np.ndarray, x_unit: str, y_unit: str) -> Dict[str, Any]:
+    return {
+        'x_unit': x_unit,
+        'y_unit': y_unit,
+        'x_values': x_values,
+        'y_values': y_values
+    }
+
+# ------ attribute encoders
+# every encoder takes (shop_session, attribute, value, compressTxy, timeFormat, session_index), where attribute is the
+# AttributeMetadata of the registry and value is what pyshop's get() returned, or what the raw reader returned for the raw encoders
+
+def _scalar_encoder(convert: Callable[[Any], Any]) -> Callable:
+    return lambda shop_session, attribute, value, compressTxy, timeFormat, session_index: convert(value)
 
-    value = shop_session.model[object_type][object_name][attribute_name].get()
+def _cannot_parse(attribute: AttributeMetadata, value: Any):
+    raise HTTPException(500, f"{attribute.attribute_type}: cannot parse <{type(value)}>")
 
-    if value is None:
+def _encode_txy(shop_session: ShopSession, attribute: AttributeMetadata, value: Any, compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    if isinstance(value, pd.Series) or isinstance(value, pd.DataFrame):
+        if compressTxy:
+            value = remove_consecutive_duplicates(value)
+        if isinstance(value, pd.Series):
+            values = value.to_numpy(dtype=np.float64).reshape(1, len(value))
+        else:
+            values = np.ascontiguousarray(value.to_numpy(dtype=np.float64).transpose())
+        return _time_series_fields(shop_session, getattr(value, 'name', None), attribute.y_unit, value.index, values, timeFormat, session_index)
+    _cannot_parse(attribute, value)
+
+def _encode_xy(shop_session: ShopSession, attribute: AttributeMetadata, value: Any, compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    if isinstance(value, pd.Series):
+        return encode_curve(value, attribute.x_unit, attribute.y_unit)
+    _cannot_parse(attribute, value)
+
+def _encode_xy_array(shop_session: ShopSession, attribute: AttributeMetadata, value: Any, compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    if type(value) == list and isinstance(value[0], pd.Series):
+        return { ser.name: # reference value is stored in series.name
+            encode_curve(ser, attribute.x_unit, attribute.y_unit) for ser in value
+        }
+    _cannot_parse(attribute, value)
+
+def _encode_xyt(shop_session: ShopSession, attribute: AttributeMetadata, value: Any, compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    return f'{attribute.attribute_type}: {type(value)}'
+
+_encoders: Dict[ObjectAttributeTypeEnum, Callable] = {
+    ObjectAttributeTypeEnum.boolean: _scalar_encoder(bool),
+    ObjectAttributeTypeEnum.integer: _scalar_encoder(int),
+    ObjectAttributeTypeEnum.float: _scalar_encoder(float),
+    ObjectAttributeTypeEnum.string: _scalar_encoder(str),
+    ObjectAttributeTypeEnum.datetime: _scalar_encoder(str),
+    ObjectAttributeTypeEnum.float_array: _scalar_encoder(lambda value: np.array(value, dtype=float)),
+    ObjectAttributeTypeEnum.integer_array: _scalar_encoder(lambda value: np.array(value, dtype=int)),
+    ObjectAttributeTypeEnum.string_array: _scalar_encoder(lambda value: np.array(value, dtype=str).tolist()),
+    ObjectAttributeTypeEnum.TimeSeries: _encode_txy,
+    ObjectAttributeTypeEnum.Curve: _encode_xy,
+    ObjectAttributeTypeEnum.MapFloatCurve: _encode_xy_array,
+    ObjectAttributeTypeEnum.MapTimeCurve: _encode_xyt,
+}
+
+def _encode_txy_raw(shop_session: ShopSession, attribute: AttributeMetadata, raw: Tuple[np.ndarray, np.ndarray], compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    nanoseconds, values = raw
+    if len(nanoseconds) == 0:
+        return None
+    if compressTxy:
+        keep = _consecutive_changes(values)
+        nanoseconds, values = nanoseconds[keep], values[keep]
+    # pyshop returns a series named after the attribute when there is one scenario, and a DataFrame otherwise
+    name = attribute.name if values.shape[1] == 1 else None
+    index = pd.DatetimeIndex(nanoseconds.view('datetime64[ns]'))
+    return _time_series_fields(shop_session, name, attribute.y_unit, index, np.ascontiguousarray(values.T), timeFormat, session_index)
+
+def _encode_xy_raw(shop_session: ShopSession, attribute: AttributeMetadata, raw: Tuple[float, np.ndarray, np.ndarray], compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    _, x, y = raw
+    if len(x) == 0:
         return None
+    return curve_fields(x, y, attribute.x_unit, attribute.y_unit)
 
-    if attribute_type == ObjectAttributeTypeEnum.boolean:
-        return bool(value)
+def _encode_xy_array_raw(shop_session: ShopSession, attribute: AttributeMetadata, raw: List[Tuple[float, np.ndarray, np.ndarray]], compressTxy: bool, timeFormat: TimeFormatEnum, session_index: pd.DatetimeIndex) -> Any:
+    if not raw:
+        return None
+    return {reference: curve_fields(x, y, attribute.x_unit, attribute.y_unit) for reference, x, y in raw}
 
-    if attribute_type == ObjectAttributeTypeEnum.integer:
-        return int(value)
+# attribute type -> (raw reader, raw encoder)
+_raw_codecs: Dict[ObjectAttributeTypeEnum, Tuple[Callable, Callable]] = {
+    ObjectAttributeTypeEnum.TimeSeries: (get_txy_raw, _encode_txy_raw),
+    ObjectAttributeTypeEnum.Curve: (get_xy_raw, _encode_xy_raw),
+    ObjectAttributeTypeEnum.MapFloatCurve: (get_xy_array_raw, _encode_xy_array_raw),
+}
 
-    if attribute_type == ObjectAttributeTypeEnum.float:
-        return float(value)
+def _to_lists(fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in fields.items()}
 
-    if attribute_type == ObjectAttributeTypeEnum.string:
-        return str(value)
+def _serialize_plain(value: Any) -> AttributeValue:
+    return value.tolist() if isinstance(value, np.ndarray) else value
 
-    if attribute_type == ObjectAttributeTypeEnum.datetime:
-        return str(value)
+def _serialize_xy_array(value: Any) -> AttributeValue:
+    if isinstance(value, dict):
+        return {ref: Curve(**_to_lists(curve)) for ref, curve in value.items()}
+    return value
 
-    if attribute_type == ObjectAttributeTypeEnum.float_array:
-        return np.array(value, dtype=float).tolist()
+_serializers: Dict[ObjectAttributeTypeEnum, Callable[[Any], AttributeValue]] = {
+    ObjectAttributeTypeEnum.TimeSeries: lambda value: TimeSeries(**_to_lists(value)),
+    ObjectAttributeTypeEnum.Curve: lambda value: Curve(**_to_lists(value)),
+    ObjectAttributeTypeEnum.MapFloatCurve: _serialize_xy_array,
+}
 
-    if attribute_type == ObjectAttributeTypeEnum.integer_array:
-        return np.array(value, dtype=int).tolist()
+# ------ prebound attribute readers
+# the registry is the same for every session, so the type, units, encoder and raw getter of every attribute are
+# looked up once here, and reading an attribute is a single call without lookups or branching on its type
 
-    if attribute_type == ObjectAttributeTypeEnum.string_array:
-        return np.array(value, dtype=str).tolist()
+AttributeReader = Callable[[ShopSession, str, bool, TimeFormatEnum, Optional[pd.DatetimeIndex]], Any]
 
-    if attribute_type == ObjectAttributeTypeEnum.TimeSeries:
+def _bind_reader(object_type: str, attribute_name: str) -> AttributeReader:
+    attribute = registry.attributes[object_type][attribute_name]
 
-        if isinstance(value, pd.Series) or isinstance(value, pd.DataFrame):
-            if compressTxy:
-                value = remove_consecutive_duplicates(value)
-            if isinstance(value, pd.Series):
-                # values = {t: [v] for t, v in zip(value.index.values, value.values)}
-                timestamps = value.index.values.tolist()
-                values = value.values.reshape(1, value.values.size).tolist()
+    if attribute.attribute_type is None:
+        def read_unsupported(shop_session, object_name, compressTxy, timeFormat, session_index):
+            return new_attribute_type_name_from_old(attribute.datatype) # raises
+        return read_unsupported
 
-            if isinstance(value, pd.DataFrame):
-                # values = {t: v for t, v in zip(value.index.values, value.values.tolist())}
-                timestamps = value.index.value.tolist()
-                values = value.values.transpose().tolist()
+    encode = _encoders[attribute.attribute_type]
+    raw_reader, encode_raw = _raw_codecs.get(attribute.attribute_type, (None, None))
 
-            return TimeSeries(
-                name = value.name,
-                unit = attribute_y_unit,
-                timestamps = timestamps,
-                values = values
-            )
+    def read(shop_session: ShopSession, object_name: str, compressTxy: bool, timeFormat: TimeFormatEnum, session_index: Optional[pd.DatetimeIndex]) -> Any:
+        if raw_reader is not None:
+            raw = raw_reader(shop_session, object_type, object_name, attribute_name)
+            if raw is not None:
+                with timing.phase('convert'):
+                    return encode_raw(shop_session, attribute, raw, compressTxy, timeFormat, session_index)
 
-    if attribute_type == ObjectAttributeTypeEnum.Curve:
+        with timing.phase('shop'):
+            value = shop_session.model[object_type][object_name][attribute_name].get()
 
-        if isinstance(value, pd.Series):
-            return Curve(
-                x_unit = attribute_x_unit,
-                y_unit = attribute_y_unit,
-                x_values = value.index.values.tolist(),
-                y_values = value.values.tolist()
-            )
+        if value is None:
+            return None
+        with timing.phase('convert'):
+            return encode(shop_session, attribute, value, compressTxy, timeFormat, session_index)
+
+    return read
+
+def _bind_serializer(object_type: str, attribute_name: str) -> Callable[[Any], AttributeValue]:
+    serialize = _serializers.get(registry.attributes[object_type][attribute_name].attribute_type, _serialize_plain)
+
+    def serialize_timed(value: Any) -> AttributeValue:
+        if value is None:
+            return None
+        with timing.phase('convert'):
+            return serialize(value)
 
-    if attribute_type == ObjectAttributeTypeEnum.MapTimeCurve:
-        return f'{attribute_type}: {type(value)}'
+    return serialize_timed
 
-    if attribute_type == ObjectAttributeTypeEnum.MapFloatCurve:
+# attribute_readers[object_type][attribute_name](shop_session, object_name, compressTxy, timeFormat, session_index) -> JSON ready value
+attribute_readers: Mapping[str, Mapping[str, AttributeReader]] = MappingProxyType({
+    object_type: MappingProxyType({
+        attribute_name: _bind_reader(object_type, attribute_name) for attribute_name in attribute_names
+    }) for object_type, attribute_names in registry.attribute_names.items()
+})
 
-        if type(value) == list and isinstance(value[0], pd.Series):
+# attribute_serializers[object_type][attribute_name](JSON ready value) -> AttributeValue, the pydantic models of the response
+attribute_serializers: Mapping[str, Mapping[str, Callable[[Any], AttributeValue]]] = MappingProxyType({
+    object_type: MappingProxyType({
+        attribute_name: _bind_serializer(object_type, attribute_name) for attribute_name in attribute_names
+    }) for object_type, attribute_names in registry.attribute_names.items()
+})
 
-            return { ser.name: # reference value is stored in series.name
-                Curve(
-                    x_unit = attribute_x_unit,
-                    y_unit = attribute_y_unit,
-                    x_values = ser.index.values.tolist(),
-                    y_values = ser.values.tolist()
-                ) for ser in value
-            }
 
-    raise HTTPException(500, f"{attribute_type}: cannot parse <{type(value)}>")
+def encode_model_object_attribute(
+        shop_session: ShopSession,
+        object_type: str,
+        object_name: str,
+        attribute_name: str,
+        compressTxy: bool,
+        timeFormat: TimeFormatEnum = TimeFormatEnum.iso,
+        session_index: pd.DatetimeIndex = None
+    ) -> Any:
 
+    """
+        Returns the attribute value as JSON ready data, arrays are kept as numpy arrays.
+        Time series and curves are dicts with the fields of TimeSeries and Curve, fields that are None are left out.
+    """
 
-def serialize_model_object_instance(shop_session: ShopSession, object_type: str, object_name: str) -> ObjectInstance:
+    return attribute_readers[object_type][attribute_name](shop_session, object_name, compressTxy, timeFormat, session_index)
+
+def serialize_model_object_attribute(
+        shop_session: ShopSession,
+        object_type: str,
+        object_name: str,
+        attribute_name: str,
+        compressTxy: bool,
+        timeFormat: TimeFormatEnum = TimeFormatEnum.iso,
+        session_index: pd.DatetimeIndex = None
+    ) -> AttributeValue:
+
+    value = attribute_readers[object_type][attribute_name](shop_session, object_name, compressTxy, timeFormat, session_index)
+    return attribute_serializers[object_type][attribute_name](value)
+
+
+def serialize_model_object_instance(shop_session: ShopSession, object_type: str, object_name: str, timeFormat: TimeFormatEnum = TimeFormatEnum.iso) -> ObjectInstance:
 
     # attribute_names = list(o._attr_names)
 
+    session_index = session_time_index(shop_session) if timeFormat == TimeFormatEnum.implicit else None
+    readers, serializers = attribute_readers[object_type], attribute_serializers[object_type]
+
     return ObjectInstance(
         # object_type = o.get_type(),
         # object_name = o.get_name(),
         attributes = {
-            attribute_name: serialize_model_object_attribute(shop_session, object_type, object_name, attribute_name, False) for attribute_name in attribute_map[object_type]
+            attribute_name: serializers[attribute_name](read(shop_session, object_name, False, timeFormat, session_index)) for attribute_name, read in readers.items()
         }
     )
 
 class CommandArguments(BaseModel):
     options: List[str] = []
     values: List[str] = []
-
-attribute_map = dict()
-for ot in _SHOP_OBJECT_TYPE_NAMES:
-    attribute_map[ot] = dict()
-    for at in _shop_session.shop_api.GetObjectTypeAttributeNames(ot):
-        attribute_map[ot][at] = get_attribute_info(_shop_session.shop_api, ot, at)
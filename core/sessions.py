@@ -1,45 +1,54 @@
-from pyshop import ShopSession
 from fastapi import HTTPException
 import datetime as dt
-from typing import Callable, List, Dict
-import requests
+from typing import Any, Callable, List, Dict, Tuple
+import threading
+
+from . import config
+from .workers import ShopSessionWorker, create_shop_session_worker
+from .log_forwarder import LogForwarder
+from .pool import SessionPool
+from .spill import SessionSpiller
+from .reaper import SessionReaper
 
 class UserSession:
 
     def __init__(self, username: str, expires: dt.datetime):
         self.username: str = username
         self.expires: dt.datetime = expires
-        self.shop_sessions: Dict[int, ShopSession] = {}
+        self.shop_sessions: Dict[int, ShopSessionWorker] = {}
         self.shop_sessions_time_resolution_is_set: Dict[int, bool] = {}
         self.session_counter: int = 0
+        self._session_counter_lock = threading.Lock()
 
     
-    def add_shop_session(self, session_name: str, logging_callback: Callable = None, logging_callback_id: str = '', log_file: str = '') -> ShopSession:
+    def add_shop_session(self, session_name: str, logging_callback: Callable = None, logging_callback_id: str = '', log_file: str = '', backend: str = None) -> ShopSessionWorker:
 
         """
             The signature of the callback is shown by example
-                def callback(msg, id):
-                    print(f'{msg} : {id}')
+                def callback(msg, level, id):
+                    print(f'{level} {msg} : {id}')
                     return None
         """
 
-        self.session_counter += 1
+        with self._session_counter_lock:
+            self.session_counter += 1
+            session_id = self.session_counter
 
-        new_shop_session = None
-        if logging_callback:
-            new_shop_session = ShopSession(license_path='', silent=True, log_file=log_file, name=session_name, id=self.session_counter)
-            new_shop_session.shop_api.RegisterCallback(logging_callback, logging_callback_id)
-        else:
-            new_shop_session = ShopSession(license_path='', silent=False, log_file=log_file, name=session_name, id=self.session_counter)
+        new_shop_session = SessionManager.session_pool.acquire(session_id, session_name, log_file, logging_callback, logging_callback_id, backend)
+        if new_shop_session is None:
+            new_shop_session = create_shop_session_worker(
+                backend if backend else config.SESSION_BACKEND,
+                session_id, session_name, log_file, logging_callback, logging_callback_id
+            )
 
-        self.shop_sessions[self.session_counter] = new_shop_session
-        self.shop_sessions_time_resolution_is_set[self.session_counter] = False
+        self.shop_sessions[session_id] = new_shop_session
+        self.shop_sessions_time_resolution_is_set[session_id] = False
         return new_shop_session
 
     def remove_shop_session(self, session_id: int) -> bool:
         if session_id in self.shop_sessions:
             shop_session = self.shop_sessions.pop(session_id)
-            del shop_session
+            shop_session.close()
             return True
         else:
             return False
@@ -52,31 +61,15 @@ class UserSession:
 class SessionManager:
 
     user_sessions: Dict[str, UserSession] = {}
-    logging_endpoint: str = ''
+    log_forwarder: LogForwarder = LogForwarder()
+    session_pool: SessionPool = SessionPool()
+    session_spiller: SessionSpiller = SessionSpiller()
+    session_reaper: SessionReaper = SessionReaper()
 
     @staticmethod
     def log_callback(msg, level, id):
-
-        endpoint = SessionManager.logging_endpoint
-        # endpoint = endpoint if endpoint else 'http://host.docker.internal:5000/log/message'
-        if endpoint:
-            try:
-                resp = requests.post(
-                    endpoint,
-                    json={
-                        'level': level,
-                        'message': msg,
-                        'id': id
-                    }
-                )
-                if resp.status_code != 200:
-                    print(f'logging endpoint is complaining')
-                    print(f'response: {resp}')
-
-            except Exception as e:
-                print(f'failed to forward log message to endpoint: {endpoint}')
-                print(f' --- exception: {e}')
-
+        # called from the thread running SHOP, so the message is only queued here and sent in the background
+        SessionManager.log_forwarder.submit(level, msg, id)
         return None
 
 
@@ -92,7 +85,9 @@ class SessionManager:
     @staticmethod
     def remove_user_session(username) -> bool:
         if username in SessionManager.user_sessions:
-            SessionManager.user_sessions.pop(username)
+            us = SessionManager.user_sessions.pop(username)
+            for session_id in list(us.shop_sessions):
+                us.remove_shop_session(session_id)
             return True
         else:
             return False
@@ -105,7 +100,7 @@ class SessionManager:
             return None
 
     @staticmethod
-    def get_shop_sessions(username: str) -> Dict[int, ShopSession]:
+    def get_shop_sessions(username: str) -> Dict[int, ShopSessionWorker]:
         us = SessionManager.get_user_session(username)
         if us:
             return us.shop_sessions
@@ -113,7 +108,15 @@ class SessionManager:
             return []
 
     @staticmethod
-    def get_shop_session(username: str, session_id: int) -> ShopSession:
+    def get_all_shop_sessions() -> List[ShopSessionWorker]:
+        return [s for _, s in SessionManager.get_shop_session_list()]
+
+    @staticmethod
+    def get_shop_session_list() -> List[Tuple[str, ShopSessionWorker]]:
+        return [(username, s) for username, us in list(SessionManager.user_sessions.items()) for s in list(us.shop_sessions.values())]
+
+    @staticmethod
+    def get_shop_session(username: str, session_id: int) -> ShopSessionWorker:
 
         try:
             us = SessionManager.get_user_session(username)
@@ -128,10 +131,21 @@ class SessionManager:
         return sess
 
     @staticmethod
-    def add_shop_session(username: str, session_name: str, log_file: str = '') -> ShopSession:
+    async def call(username: str, session_id: int, func: Callable, *args, **kwargs) -> Any:
+
+        """
+            Runs func(shop_session, *args, **kwargs) on the worker of the given session and awaits the result.
+            All interaction with pyshop must go through here, so that a long running command never blocks the event loop.
+            With the process backend func and its arguments are pickled, so func must be a module level function.
+        """
+
+        return await SessionManager.get_shop_session(username, session_id).run(func, *args, **kwargs)
+
+    @staticmethod
+    def add_shop_session(username: str, session_name: str, log_file: str = '', backend: str = None) -> ShopSessionWorker:
         us = SessionManager.get_user_session(username)
         if us:
-            return us.add_shop_session(session_name, SessionManager.log_callback, f'{username}:{session_name}', log_file)
+            return us.add_shop_session(session_name, SessionManager.log_callback, f'{username}:{session_name}', log_file, backend)
         else:
             return None
 
@@ -145,26 +159,11 @@ class SessionManager:
 
     @staticmethod
     def cleanup_user_sessions() -> None:
-        for user in SessionManager.get_user_session_list():
-            us = SessionManager.get_user_session(user)
-            if dt.datetime.utcnow() > us.expires:
+        for user, us in list(SessionManager.get_user_sessions().items()):
+            if us.expires is not None and dt.datetime.utcnow() > us.expires:
                 SessionManager.remove_user_session(user)
 
     @staticmethod
     def update_expiry_time(username: str, expires: dt.datetime) -> None:
         us = SessionManager.get_user_session(username)
         us.update_expiry_time(expires)
-    
-    @staticmethod
-    def get_model_object_generator(username: str, session_id: int, object_type: str):
-        model = SessionManager.get_shop_session(username, session_id).model
-        if object_type not in model._all_types:
-            raise HTTPException(400, f'object_type {{{object_type}}} is not implemented.')
-        return model[object_type]
-            
-    @staticmethod
-    def get_model_object_instance(username: str, session_id: int, object_type: str, object_name: str):
-        model_object_generator = SessionManager.get_model_object_generator(username, session_id, object_type)
-        if object_name not in model_object_generator._names:
-            raise HTTPException(400, f'object_name {{{object_name}}} is not an instance of object_type {{{object_type}}}.')
-        return model_object_generator[object_name]
\ No newline at end of file
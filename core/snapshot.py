@@ -0,0 +1,113 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from pyshop import ShopSession
+
+from .schemas import registry, RelationTypeEnum
+from .interface import http_raise_internal, is_time_resolution_set, add_model_connection
+
+#
+# A SessionSnapshot holds the inputs of a ShopSession as the values pyshop returns (floats, lists, pandas objects),
+# so that it can be copied into another session without going through the json schemas.
+#
+
+class SessionSnapshot(NamedTuple):
+    time_resolution: Optional[Dict[str, Any]]
+    objects: Dict[str, Dict[str, Dict[str, Any]]] # objects[object_type][object_name][attribute_name] = value
+    connections: List[Tuple[str, str, str, str, str]] # (from_type, from_name, to_type, to_name, relation_type)
+    commands: List[str] # executed commands, replayed in order by restore_session
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {} # output attributes, like objects
+
+
+def _get_value(shop: ShopSession, object_type: str, object_name: str, attribute_name: str) -> Any:
+    try:
+        return shop.model[object_type][object_name][attribute_name].get()
+    except Exception:
+        # attributes that were never set can not always be read back
+        return None
+
+
+def get_connections(shop: ShopSession) -> List[Tuple[str, str, str, str, str]]:
+    connections = []
+    for object_type in registry.object_types:
+        generator = shop.model[object_type]
+        for object_name in generator.get_object_names():
+            for relation_type in RelationTypeEnum:
+                for to in generator[object_name].get_relations(direction='output', relation_type=relation_type):
+                    connections.append((object_type, object_name, to.get_type(), to.get_name(), relation_type.value))
+    return connections
+
+
+def _get_values(shop: ShopSession, is_input: bool) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    objects = {}
+    for object_type in registry.object_types:
+        attributes = [
+            attribute.name for attribute in registry.attributes[object_type].values()
+            if (attribute.is_input if is_input else attribute.is_output and not attribute.is_input)
+        ]
+        for object_name in shop.model[object_type].get_object_names():
+            values = {
+                attribute_name: _get_value(shop, object_type, object_name, attribute_name)
+                for attribute_name in attributes
+            }
+            objects.setdefault(object_type, {})[object_name] = {k: v for k, v in values.items() if v is not None}
+    return objects
+
+
+def snapshot_session(shop: ShopSession, include_commands: bool = False, include_results: bool = False) -> SessionSnapshot:
+
+    """
+        Reads the time resolution, all input attributes, the connections and (include_commands) the executed commands of a session.
+        With include_results the output attributes are read as well, so that a solved session can be restored without solving it again.
+    """
+
+    return SessionSnapshot(
+        time_resolution=shop.get_time_resolution() if is_time_resolution_set(shop) else None,
+        objects=_get_values(shop, is_input=True),
+        connections=get_connections(shop),
+        commands=list(shop.get_executed_commands()) if include_commands else [],
+        results=_get_values(shop, is_input=False) if include_results else {},
+    )
+
+
+def restore_session(shop: ShopSession, snapshot: SessionSnapshot):
+
+    """
+        Builds the snapshot into a new, empty session.
+    """
+
+    if snapshot.time_resolution is not None:
+        shop.set_time_resolution(
+            starttime=snapshot.time_resolution['starttime'],
+            endtime=snapshot.time_resolution['endtime'],
+            timeunit=snapshot.time_resolution['timeunit'],
+            timeresolution=snapshot.time_resolution.get('timeresolution')
+        )
+
+    for object_type, objects in snapshot.objects.items():
+        generator = shop.model[object_type]
+        existing = set(generator.get_object_names())
+        for object_name, attributes in objects.items():
+            if object_name not in existing:
+                generator.add_object(object_name)
+            for attribute_name, value in attributes.items():
+                try:
+                    generator[object_name][attribute_name].set(value)
+                except Exception as e:
+                    http_raise_internal(f'could not copy {object_type} {object_name} {attribute_name}', e)
+
+    for object_type, objects in snapshot.results.items():
+        for object_name, attributes in objects.items():
+            for attribute_name, value in attributes.items():
+                try:
+                    shop.model[object_type][object_name][attribute_name].set(value)
+                except Exception:
+                    # SHOP does not accept every output attribute as input, those are only available after solving again
+                    pass
+
+    for from_type, from_name, to_type, to_name, relation_type in snapshot.connections:
+        add_model_connection(shop, from_type, from_name, to_type, to_name, relation_type if relation_type != 'default' else '')
+
+    for command in snapshot.commands:
+        try:
+            shop.execute_full_command(command)
+        except Exception as e:
+            http_raise_internal(f'failed to replay command {{{command}}}', e)
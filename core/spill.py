@@ -0,0 +1,151 @@
+from fastapi import HTTPException
+from typing import Callable, Dict, Iterable
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from . import config
+from .snapshot import SessionSnapshot, snapshot_session, restore_session
+from .workers import ShopSessionWorker
+
+logger = logging.getLogger(__name__)
+
+
+class SessionSpiller:
+
+    """
+        Bounds the memory of sessions nobody uses: a session that has been idle for idle_seconds is snapshotted
+        (inputs, results, connections and time resolution) to a file in spill_dir and its ShopSession is released.
+        The first call to the session restores it from the file before the call is executed.
+        Executed commands are not replayed on restore, so get_executed_commands starts empty again.
+
+        Spills run on the thread of the session (see ShopSessionWorker.spill), so they never overlap a call.
+    """
+
+    def __init__(
+            self,
+            idle_seconds: float = config.SESSION_SPILL_IDLE_SECONDS,
+            spill_dir: str = config.SESSION_SPILL_DIR,
+            check_interval: float = config.SESSION_SPILL_CHECK_INTERVAL
+        ):
+        self.idle_seconds: float = idle_seconds
+        self.spill_dir: str = spill_dir
+        self.check_interval: float = check_interval
+
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {
+            'spills': 0,
+            'restores': 0,
+            'failed': 0,
+            'spilled_bytes': 0,
+            'spill_seconds': 0.0,
+            'restore_seconds': 0.0,
+            'last_spill_seconds': 0.0,
+            'last_restore_seconds': 0.0,
+        }
+
+    def start(self, get_workers: Callable[[], Iterable[ShopSessionWorker]]):
+        if self.idle_seconds <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(get_workers,), name='session-spiller', daemon=True)
+                self._thread.start()
+
+    def stats(self, workers: Iterable[ShopSessionWorker] = ()) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters, spilled=sum(1 for worker in workers if worker.spill_file))
+
+    def _is_idle(self, worker: ShopSessionWorker) -> bool:
+        return not worker.spill_file and time.monotonic() - worker.last_used >= self.idle_seconds
+
+    def _run(self, get_workers: Callable[[], Iterable[ShopSessionWorker]]):
+        while True:
+            time.sleep(self.check_interval)
+            for worker in list(get_workers()):
+                if self._is_idle(worker):
+                    try:
+                        worker.spill(self)
+                    except Exception as e:
+                        logger.warning(f'Could not spill session {worker.id}: {e}')
+
+    def _count(self, counter: str, value: float = 1):
+        with self._lock:
+            self._counters[counter] += value
+
+    def spill(self, worker: ShopSessionWorker) -> bool:
+
+        """
+            Called on the thread of the session. Returns False if the session was used since it was found idle.
+        """
+
+        if not self._is_idle(worker):
+            return False
+
+        start = time.perf_counter()
+        try:
+            snapshot: SessionSnapshot = worker.execute(snapshot_session, False, True)
+            os.makedirs(self.spill_dir, exist_ok=True)
+            fd, spill_file = tempfile.mkstemp(dir=self.spill_dir, prefix=f'session-{worker.id}-', suffix='.pickle')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self._count('failed')
+            raise
+
+        # mark the session as spilled first, so the stopped process is not reported as failed in between
+        worker.spill_file = spill_file
+        worker._spiller = self
+        try:
+            worker._stop_shop()
+        except Exception:
+            worker.spill_file = None
+            worker._spiller = None
+            os.remove(spill_file)
+            self._count('failed')
+            raise
+
+        duration = time.perf_counter() - start
+        with self._lock:
+            self._counters['spills'] += 1
+            self._counters['spilled_bytes'] += os.path.getsize(spill_file)
+            self._counters['spill_seconds'] += duration
+            self._counters['last_spill_seconds'] = duration
+        logger.info(f'Spilled session {worker.id} to {spill_file} in {duration:.3f} s')
+        return True
+
+    def restore(self, worker: ShopSessionWorker):
+
+        """
+            Called on the thread of the session, before the first call after it was spilled.
+        """
+
+        start = time.perf_counter()
+        try:
+            with open(worker.spill_file, 'rb') as f:
+                snapshot: SessionSnapshot = pickle.load(f)
+            worker._start_shop()
+            worker.execute(restore_session, snapshot)
+        except Exception as e:
+            self._count('failed')
+            raise HTTPException(500, f'Session {{{worker.id}}} could not be restored from {{{worker.spill_file}}}: {e}')
+
+        self.discard(worker)
+
+        duration = time.perf_counter() - start
+        with self._lock:
+            self._counters['restores'] += 1
+            self._counters['restore_seconds'] += duration
+            self._counters['last_restore_seconds'] = duration
+        logger.info(f'Restored session {worker.id} in {duration:.3f} s')
+
+    def discard(self, worker: ShopSessionWorker):
+        try:
+            os.remove(worker.spill_file)
+        except OSError:
+            pass
+        worker.spill_file = None
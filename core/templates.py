@@ -0,0 +1,130 @@
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+import datetime as dt
+from typing import Dict, List, Tuple
+import os
+import pickle
+import re
+import tempfile
+import threading
+
+from . import config
+from .schemas import ShopModel, Template
+from .snapshot import SessionSnapshot, snapshot_session
+from .workers import create_shop_session_worker
+from . import interface
+
+_TEMPLATE_ID = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+
+def _load_model(shop, model: ShopModel) -> SessionSnapshot:
+    interface.set_model(shop, model)
+    return snapshot_session(shop)
+
+
+class TemplateManager:
+
+    """
+        Named static models that sessions can be created from (POST /session with a template id).
+
+        A template is validated and loaded into a scratch ShopSession once, and kept as the SessionSnapshot of that session,
+        i.e. as the values pyshop returns. Templates are kept in memory and pickled to config.TEMPLATE_DIR, so they
+        survive restarts. Files in the directory are loaded the first time a template is looked up.
+    """
+
+    templates: Dict[str, Tuple[Template, SessionSnapshot]] = {}
+    _loaded_from_disk: bool = False
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _check_id(template_id: str):
+        if not _TEMPLATE_ID.match(template_id):
+            raise HTTPException(400, f'Template id {{{template_id}}} may only contain letters, digits, _, . and -')
+
+    @staticmethod
+    def _path(template_id: str) -> str:
+        return os.path.join(config.TEMPLATE_DIR, f'{template_id}.pickle')
+
+    @staticmethod
+    def _load_from_disk():
+        with TemplateManager._lock:
+            if TemplateManager._loaded_from_disk:
+                return
+            TemplateManager._loaded_from_disk = True
+            if not config.TEMPLATE_DIR or not os.path.isdir(config.TEMPLATE_DIR):
+                return
+            for file_name in sorted(os.listdir(config.TEMPLATE_DIR)):
+                template_id, extension = os.path.splitext(file_name)
+                if extension != '.pickle' or template_id in TemplateManager.templates:
+                    continue
+                try:
+                    with open(os.path.join(config.TEMPLATE_DIR, file_name), 'rb') as f:
+                        TemplateManager.templates[template_id] = pickle.load(f)
+                except Exception:
+                    # written by another version or broken, the template has to be registered again
+                    continue
+
+    @staticmethod
+    def _save_to_disk(template_id: str, entry: Tuple[Template, SessionSnapshot]):
+        if not config.TEMPLATE_DIR:
+            return
+        os.makedirs(config.TEMPLATE_DIR, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=config.TEMPLATE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, TemplateManager._path(template_id))
+
+    @staticmethod
+    async def register(template_id: str, model: ShopModel) -> Template:
+
+        """
+            Loads the model into a scratch session, which is closed again once its snapshot is taken.
+            Commands are not part of a template, they are run in the sessions created from it.
+        """
+
+        TemplateManager._check_id(template_id)
+        if model.commands:
+            raise HTTPException(400, 'A template can not contain commands')
+
+        # starting and closing the scratch session, and the pickle files, stay off the event loop
+        worker = await run_in_threadpool(create_shop_session_worker, config.SESSION_BACKEND, 0, f'template-{template_id}')
+        try:
+            snapshot = await worker.run(_load_model, model)
+        finally:
+            await run_in_threadpool(worker.close)
+
+        template = Template(
+            template_id=template_id,
+            created_at=dt.datetime.now(dt.timezone.utc),
+            has_time_resolution=snapshot.time_resolution is not None,
+            object_count=sum(len(objects) for objects in snapshot.objects.values()),
+            connection_count=len(snapshot.connections),
+        )
+        await run_in_threadpool(TemplateManager._load_from_disk)
+        with TemplateManager._lock:
+            TemplateManager.templates[template_id] = (template, snapshot)
+        await run_in_threadpool(TemplateManager._save_to_disk, template_id, (template, snapshot))
+        return template
+
+    @staticmethod
+    def get_templates() -> List[Template]:
+        TemplateManager._load_from_disk()
+        return [template for template, _ in TemplateManager.templates.values()]
+
+    @staticmethod
+    def get_snapshot(template_id: str) -> SessionSnapshot:
+        TemplateManager._load_from_disk()
+        if template_id not in TemplateManager.templates:
+            raise HTTPException(404, f'Template with id {{{template_id}}} not found')
+        return TemplateManager.templates[template_id][1]
+
+    @staticmethod
+    def remove(template_id: str) -> bool:
+        TemplateManager._check_id(template_id)
+        TemplateManager._load_from_disk()
+        with TemplateManager._lock:
+            if TemplateManager.templates.pop(template_id, None) is None:
+                return False
+        if config.TEMPLATE_DIR and os.path.exists(TemplateManager._path(template_id)):
+            os.remove(TemplateManager._path(template_id))
+        return True
@@ -0,0 +1,217 @@
+from typing import Any, Callable, Dict, Tuple
+from contextvars import ContextVar
+import asyncio
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+from fastapi.routing import APIRoute
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+#
+# Server-Timing breakdown of a request
+# - TimingMiddleware starts a RequestTiming for every request and adds the Server-Timing header to the response
+# - the shared code paths (interface setters, encode_model_object_attribute, fastjson.dumps, ...) add to a phase with
+#   `with timing.phase(...)`, which does nothing outside a request
+# - calls into ShopSessions are timed where they run (session thread or worker process) and merged, see run_timed
+# - parse and validate are the parts of the FastAPI route handler before and after the endpoint, see TimedRoute
+#
+
+PHASES = {
+    'parse': 'body parse and validation',
+    'shop': 'SHOP reads and writes',
+    'convert': 'pandas and numpy conversion',
+    'validate': 'response model validation',
+    'encode': 'response encoding',
+}
+
+
+class RequestTiming:
+
+    def __init__(self):
+        self.started: float = time.perf_counter()
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.endpoint_finished: float = None
+        self._endpoint_encode: float = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] += seconds
+
+    def merge(self, phases: Dict[str, float]):
+        with self._lock:
+            for phase, seconds in phases.items():
+                self.phases[phase] += seconds
+
+    def finish_endpoint(self):
+        self.endpoint_finished = time.perf_counter()
+        self._endpoint_encode = self.phases['encode']
+
+    def finish_handler(self, handler_started: float, endpoint_started: float = None):
+        now = time.perf_counter()
+        if endpoint_started is None:
+            # the request failed before the endpoint was called
+            self.add('parse', now - handler_started)
+            return
+        self.add('parse', endpoint_started - handler_started)
+        if self.endpoint_finished is not None:
+            # the response model is validated and the response is rendered after the endpoint returned
+            encoded = self.phases['encode'] - self._endpoint_encode
+            self.add('validate', max(0.0, now - self.endpoint_finished - encoded))
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.phases, total=time.perf_counter() - self.started)
+
+    def header(self) -> str:
+        return ', '.join(
+            f'{phase};dur={seconds * 1000:.3f}' + (f';desc="{PHASES[phase]}"' if phase in PHASES else '')
+            for phase, seconds in self.as_dict().items() if seconds > 0 or phase == 'total'
+        )
+
+
+current_timing: ContextVar[RequestTiming] = ContextVar('current_timing', default=None)
+
+_NO_TIMING = contextlib.nullcontext()
+
+
+class _Phase:
+
+    __slots__ = ('timing', 'phase', 'start')
+
+    def __init__(self, timing: RequestTiming, phase: str):
+        self.timing = timing
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timing.add(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def phase(name: str):
+    timing = current_timing.get()
+    return _NO_TIMING if timing is None else _Phase(timing, name)
+
+
+def run_timed(shop, func: Callable, *args, **kwargs) -> Tuple[Any, Dict[str, float]]:
+
+    """
+        Runs func(shop, *args, **kwargs) with its own RequestTiming and returns its result together with the phases.
+        Module level, so that it can be sent to a worker process like any other call.
+    """
+
+    timing = RequestTiming()
+    token = current_timing.set(timing)
+    try:
+        result = func(shop, *args, **kwargs)
+    finally:
+        current_timing.reset(token)
+    return result, timing.phases
+
+
+# SHOP commands are timed where they run (session thread or worker process) with `with timing.command(name)`,
+# the worker that runs the call sets the listener and gets listener(name, None) when the command starts and
+# listener(name, seconds) when it is done, see ShopSessionWorker._on_command
+command_listener: ContextVar[Callable[[str, float], None]] = ContextVar('command_listener', default=None)
+
+
+@contextlib.contextmanager
+def command(name: str):
+    listener = command_listener.get()
+    if listener is None:
+        yield
+        return
+    name = str(getattr(name, 'value', name)).replace(' ', '_')
+    listener(name, None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        listener(name, time.perf_counter() - start)
+
+
+class TimedRoute(APIRoute):
+
+    """
+        Marks where the endpoint starts and ends inside the FastAPI route handler, so that body parsing and
+        validation (before) and response model validation (after) get their own phase.
+    """
+
+    def get_route_handler(self) -> Callable:
+        call = self.dependant.call
+        endpoint_started: ContextVar[float] = ContextVar('endpoint_started', default=None)
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(*args, **kwargs):
+                timing = current_timing.get()
+                if timing is None:
+                    return await call(*args, **kwargs)
+                endpoint_started.set(time.perf_counter())
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    timing.finish_endpoint()
+            self.dependant.call = timed_call
+
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timing = current_timing.get()
+            if timing is None:
+                return await handler(request)
+            handler_started = time.perf_counter()
+            token = endpoint_started.set(None)
+            try:
+                return await handler(request)
+            finally:
+                timing.finish_handler(handler_started, endpoint_started.get())
+                endpoint_started.reset(token)
+
+        return timed_handler
+
+
+class TimingMiddleware:
+
+    """
+        Adds a Server-Timing header with the phases of the request to every response and logs them as a record with
+        the fields method, path, status and server_timing (seconds per phase) at info level.
+        Streaming responses are encoded after the header is sent, their encode time is only in the log record.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not config.SERVER_TIMING_ENABLED:
+            return await self.app(scope, receive, send)
+
+        timing = RequestTiming()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                message = dict(message, headers=list(message.get('headers', [])) + [(b'server-timing', timing.header().encode())])
+            await send(message)
+
+        token = current_timing.set(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
+            phases = timing.as_dict()
+            logger.info(
+                f"{scope['method']} {scope['path']} {status[0]} " + ' '.join(f'{phase}={seconds * 1000:.1f}ms' for phase, seconds in phases.items()),
+                extra={'method': scope['method'], 'path': scope['path'], 'status': status[0], 'server_timing': phases}
+            )
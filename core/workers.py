@@ -0,0 +1,383 @@
+from pyshop import ShopSession
+from fastapi import HTTPException
+from typing import Any, Callable, Dict, Optional, Type
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import abc
+import datetime as dt
+import asyncio
+import functools
+import importlib
+import time
+
+from . import config, metrics, profiling, timing
+
+
+@functools.lru_cache(maxsize=None)
+def shop_session_class() -> Type[ShopSession]:
+    if not config.SHOP_SESSION_CLASS:
+        return ShopSession
+    module_name, _, class_name = config.SHOP_SESSION_CLASS.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_shop_session(session_id: int, session_name: str, log_file: str = '', logging_callback: Callable = None, logging_callback_id: str = '') -> ShopSession:
+    session_class = shop_session_class()
+    if logging_callback:
+        shop_session = session_class(license_path='', silent=True, log_file=log_file, name=session_name, id=session_id)
+        shop_session.shop_api.RegisterCallback(logging_callback, logging_callback_id)
+    else:
+        shop_session = session_class(license_path='', silent=False, log_file=log_file, name=session_name, id=session_id)
+    return shop_session
+
+
+class ShopSessionWorker(abc.ABC):
+
+    """
+        Owns one ShopSession and the single thread that is allowed to talk to it.
+
+        execute(...) runs func(shop_session, *args, **kwargs) and blocks, run(...) does the same from async code
+        without blocking the event loop. Calls are served one at a time in submission order.
+    """
+
+    def __init__(self, session_id: int, session_name: str, log_file: str = '', logging_callback: Callable = None, logging_callback_id: str = ''):
+        self.id: int = session_id
+        self.name: str = session_name
+        self.log_file: str = log_file
+        self.logging_callback: Callable = logging_callback
+        self.logging_callback_id: str = logging_callback_id
+        self.failure: str = None
+        self.last_used: float = time.monotonic()
+        self.pending_calls: int = 0 # calls running or queued on the session, a session with pending calls is never evicted
+        self.spill_file: str = None # set while the ShopSession is released and its snapshot is on disk, see core.spill
+        self._spiller = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'shop-session-{session_id}')
+
+        # accounting for GET /sessions/info
+        self.created_at: dt.datetime = dt.datetime.now(dt.timezone.utc)
+        self.last_accessed: dt.datetime = self.created_at
+        self.current_call: str = None
+        self.current_call_function: str = None
+        self.current_call_started: float = None
+        self.call_count: int = 0
+        self.call_seconds: Dict[str, float] = {} # total duration per function name
+        self.command_seconds: float = 0.0 # total duration of the SHOP commands run in these calls
+        self.inspection: Dict[str, Any] = None # last result of introspection.inspect_session
+        self.inspected_at: float = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        # process that holds the ShopSession, None if it is the api process itself
+        return None
+
+    @property
+    def status(self) -> str:
+        if self.failure:
+            return 'failed'
+        return 'spilled' if self.spill_file else 'ok'
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        self.pending_calls += 1
+        try:
+            # the profile and timing of the request (see core.profiling and core.timing) are read here, the executor thread does not see the context
+            profile, request_timing = profiling.current_profile.get(), timing.current_timing.get()
+            return await loop.run_in_executor(self._executor, functools.partial(self._call, profile, request_timing, func, *args, **kwargs))
+        finally:
+            self.pending_calls -= 1
+
+    def _call(self, profile, request_timing, func: Callable, *args, **kwargs) -> Any:
+        if self.spill_file:
+            self._spiller.restore(self)
+        self.current_call_function = func.__name__
+        self.current_call = f'{func.__name__} {args[0]}' if args and isinstance(args[0], str) else func.__name__
+        self.current_call_started = self.last_used = time.monotonic()
+        self.last_accessed = dt.datetime.now(dt.timezone.utc)
+        listener = timing.command_listener.set(self._on_command)
+        try:
+            call, call_args = (timing.run_timed, (func,) + args) if request_timing is not None else (func, args)
+            if profile is not None:
+                result, stats = self.execute(profiling.run_profiled, call, *call_args, **kwargs)
+                profile.add_stats(stats)
+            else:
+                result = self.execute(call, *call_args, **kwargs)
+            if request_timing is not None:
+                result, phases = result
+                request_timing.merge(phases)
+            return result
+        finally:
+            timing.command_listener.reset(listener)
+            self.last_used = time.monotonic()
+            duration = self.last_used - self.current_call_started
+            self.call_seconds[func.__name__] = self.call_seconds.get(func.__name__, 0.0) + duration
+            metrics.SHOP_CALL_DURATION.observe(duration, func.__name__)
+            self.call_count += 1
+            self.current_call = self.current_call_function = self.current_call_started = None
+
+    def _on_command(self, command: str, seconds: Optional[float]):
+        # called by timing.command for every SHOP command of the running call, seconds is None when the command starts
+        if seconds is None:
+            self.current_call = f'{self.current_call_function} {command}'
+            return
+        self.current_call = self.current_call_function
+        self.command_seconds += seconds
+        metrics.SHOP_COMMAND_DURATION.observe(seconds, command)
+
+    async def peek(self, func: Callable, *args, **kwargs) -> Any:
+
+        """
+            Like run(...), but does not count as use of the session and does not restore a spilled session (returns None instead).
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._peek, func, *args, **kwargs))
+
+    def _peek(self, func: Callable, *args, **kwargs) -> Any:
+        if self.spill_file:
+            return None
+        return self.execute(func, *args, **kwargs)
+
+    @abc.abstractmethod
+    def execute(self, func: Callable, *args, **kwargs) -> Any:
+        pass
+
+    def spill(self, spiller) -> bool:
+
+        """
+            Runs spiller.spill(self) on the thread of the session, after the calls that are already queued.
+            The next call restores the session through spiller.restore(self) before it is executed.
+        """
+
+        return self._executor.submit(spiller.spill, self).result()
+
+    @abc.abstractmethod
+    def _start_shop(self):
+        pass
+
+    @abc.abstractmethod
+    def _stop_shop(self):
+        pass
+
+    def bind(self, session_id: int, session_name: str, logging_callback_id: str = ''):
+
+        """
+            Gives a worker that was started ahead of time (see core.pool) the identity of the session it is handed out as.
+        """
+
+        self.id = session_id
+        self.name = session_name
+        self.logging_callback_id = logging_callback_id
+        self._executor.submit(self._bind).result()
+
+    def _bind(self):
+        pass
+
+    def close(self):
+        # a running command is allowed to finish, the session is released right after
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+    def _close(self):
+        if self.spill_file:
+            self._spiller.discard(self)
+        else:
+            self._release()
+
+    def _release(self):
+        pass
+
+
+class ThreadShopSessionWorker(ShopSessionWorker):
+
+    def __init__(self, session_id: int, session_name: str, log_file: str = '', logging_callback: Callable = None, logging_callback_id: str = ''):
+        super().__init__(session_id, session_name, log_file, logging_callback, logging_callback_id)
+        self.shop_session: ShopSession = create_shop_session(session_id, session_name, log_file, logging_callback, logging_callback_id)
+
+    def execute(self, func: Callable, *args, **kwargs) -> Any:
+        return func(self.shop_session, *args, **kwargs)
+
+    def _bind(self):
+        _bind_shop_session(self.shop_session, self.id, self.name, self.logging_callback, self.logging_callback_id)
+
+    def _start_shop(self):
+        self.shop_session = create_shop_session(self.id, self.name, self.log_file, self.logging_callback, self.logging_callback_id)
+
+    def _stop_shop(self):
+        self.shop_session = None
+
+    def _release(self):
+        self.shop_session = None
+
+
+def _bind_shop_session(shop_session: ShopSession, session_id: int, session_name: str, logging_callback: Callable, logging_callback_id: str):
+    shop_session._id = session_id
+    shop_session._name = session_name
+    if logging_callback:
+        shop_session.shop_api.RegisterCallback(logging_callback, logging_callback_id)
+
+
+# the log callback of the ShopSession in a worker process, set by _worker_process_main
+_process_logging_callback: Callable = None
+
+def _bind_worker_process_session(shop_session: ShopSession, session_id: int, session_name: str, logging_callback_id: str):
+    _bind_shop_session(shop_session, session_id, session_name, _process_logging_callback, logging_callback_id)
+
+
+def _worker_process_main(connection, session_id: int, session_name: str, log_file: str, forward_logs: bool, logging_callback_id: str):
+    global _process_logging_callback
+
+    # log messages are sent back over the same connection while a call is running, the api process forwards them
+    def forward_log(msg, level, id):
+        connection.send(('log', (msg, level, id)))
+        return None
+
+    if forward_logs:
+        _process_logging_callback = forward_log
+
+    # the commands of a call are reported the same way, the api process keeps the statistics (see ShopSessionWorker._on_command)
+    timing.command_listener.set(lambda command, seconds: connection.send(('command', (command, seconds))))
+
+    shop_session = create_shop_session(session_id, session_name, log_file, forward_log if forward_logs else None, logging_callback_id)
+    connection.send(('ready', None))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        func, args, kwargs = message
+        try:
+            connection.send(('result', func(shop_session, *args, **kwargs)))
+        except HTTPException as e:
+            connection.send(('http_error', (e.status_code, e.detail)))
+        except Exception as e:
+            connection.send(('error', f'{type(e).__name__}: {e}'))
+
+    del shop_session
+    connection.close()
+
+
+def _get_process_context():
+    context = multiprocessing.get_context(config.WORKER_START_METHOD)
+    if config.WORKER_START_METHOD == 'forkserver':
+        context.set_forkserver_preload(['pyshop', 'pandas', 'numpy'])
+    return context
+
+
+class ProcessShopSessionWorker(ShopSessionWorker):
+
+    """
+        Keeps the ShopSession in a separate process, so that solves run truly in parallel and a crash inside SHOP
+        only takes down this session. A worker that dies is restarted with an empty session and reported as failed.
+    """
+
+    def __init__(self, session_id: int, session_name: str, log_file: str = '', logging_callback: Callable = None, logging_callback_id: str = ''):
+        super().__init__(session_id, session_name, log_file, logging_callback, logging_callback_id)
+        self.restarts: int = 0
+        self._process = None
+        self._connection = None
+        self._start()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None and self._process.is_alive() else None
+
+    @property
+    def status(self) -> str:
+        if self._process is not None and not self._process.is_alive() and not self.failure and not self.spill_file:
+            self.failure = f'worker process exited with code {self._process.exitcode}'
+        return super().status
+
+    def _start(self):
+        context = _get_process_context()
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_worker_process_main,
+            args=(child_connection, self.id, self.name, self.log_file, self.logging_callback is not None, self.logging_callback_id),
+            name=f'shop-session-{self.id}',
+            daemon=True
+        )
+        self._process.start()
+        child_connection.close()
+
+        try:
+            kind, payload = self._connection.recv()
+        except EOFError:
+            self._process.join()
+            kind, payload = 'exit', f'worker process exited with code {self._process.exitcode}'
+        if kind != 'ready':
+            raise HTTPException(500, f'SHOP worker of session {{{self.id}}} failed to start: {payload}')
+
+    def _restart(self) -> str:
+        exitcode = self._process.exitcode if self._process.exitcode is not None else 'unknown'
+        self.failure = f'worker process exited with code {exitcode}'
+        self.restarts += 1
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join()
+        self._start()
+        return self.failure
+
+    def execute(self, func: Callable, *args, **kwargs) -> Any:
+
+        if not self._process.is_alive():
+            failure = self._restart()
+            raise HTTPException(500, f'SHOP worker of session {{{self.id}}} died ({failure}) and was restarted with an empty model')
+
+        try:
+            self._connection.send((func, args, kwargs))
+            while True:
+                kind, payload = self._connection.recv()
+                if kind == 'log':
+                    if self.logging_callback:
+                        self.logging_callback(*payload)
+                    continue
+                if kind == 'command':
+                    self._on_command(*payload)
+                    continue
+                break
+        except (EOFError, OSError):
+            self._process.join(timeout=1)
+            failure = self._restart()
+            raise HTTPException(500, f'SHOP worker of session {{{self.id}}} died ({failure}) and was restarted with an empty model')
+
+        if kind == 'http_error':
+            raise HTTPException(*payload)
+        if kind == 'error':
+            raise HTTPException(500, f'SHOP worker of session {{{self.id}}} -- Internal Exception: {payload}')
+        return payload
+
+    def _bind(self):
+        self.execute(_bind_worker_process_session, self.id, self.name, self.logging_callback_id)
+
+    def _start_shop(self):
+        self._start()
+
+    def _stop_shop(self):
+        self._release()
+
+    def _release(self):
+        try:
+            self._connection.send(None)
+            self._process.join(timeout=10)
+        except Exception:
+            pass
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._connection.close()
+
+
+def create_shop_session_worker(backend: str, session_id: int, session_name: str, log_file: str = '', logging_callback: Callable = None, logging_callback_id: str = '') -> ShopSessionWorker:
+    if backend == 'thread':
+        return ThreadShopSessionWorker(session_id, session_name, log_file, logging_callback, logging_callback_id)
+    if backend == 'process':
+        return ProcessShopSessionWorker(session_id, session_name, log_file, logging_callback, logging_callback_id)
+    raise ValueError(f'unknown session backend {{{backend}}}, expected thread or process')
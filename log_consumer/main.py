@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Body
+from typing import List
 
 from pydantic import BaseModel
 
@@ -27,3 +28,14 @@ async def post_log_message(message: LogMessage = Body(LogMessage(
 
     return LogStatus(status='ok')
 
+@app.post("/log/messages", response_model=LogStatus)
+async def post_log_messages(messages: List[LogMessage] = Body([LogMessage(
+    level='INFO',
+    id='42',
+    message='hello log'
+)])):
+
+    for message in messages:
+        print(message)
+
+    return LogStatus(status='ok')
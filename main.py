@@ -1,21 +1,34 @@
 import json
 
 from datetime import datetime
-from typing import List, Any
+from typing import List, Dict, Any, Union
 
 from fastapi import Depends, FastAPI, HTTPException, Body, Query, Response, Header
 
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 import core
+from core import config
 from core.sessions import SessionManager
 from core.schemas import ObjectTypeModel, ShopCommandEnum, ObjectTypeEnum, OrderedDict, RelationDirectionEnum, RelationTypeEnum, ApiCommandEnum, \
         Session, CommandStatus, ApiCommands, ApiCommandArgs, ApiCommandDescription, Series, ObjectType, ObjectAttribute, \
-        ObjectInstance, TimeSeries, Curve, Connection, CommandArguments, LoggingEndpoint, TimeResolution, ModelOld, \
+        ObjectInstance, ObjectInstancesStatus, ReturnEnum, TimeSeries, Curve, Connection, CommandArguments, LoggingEndpoint, SessionInfo, LoggingStats, SessionPoolStats, SessionSpillStats, SessionReaperStats, ProfileInfo, Template, TimeResolution, ModelOld, \
         ShopModel, Series_from_pd, TimeSeries_from_pd, new_attribute_type_name_from_old, serialize_model_object_attribute, serialize_model_object_instance, \
-        attribute_map
-
-from core.interface import set_datatype, get_model_connections
+        attribute_map, registry, Command, Job, JobCommand, JobStatusEnum, TimeFormatEnum, session_time_index
+from core.jobs import JobManager
+from core.templates import TemplateManager
+
+import core.interface as interface
+import core.columnar as columnar
+import core.fastjson as fastjson
+import core.snapshot as snapshot
+import core.introspection as introspection
+import core.metrics as metrics
+import core.profiling as profiling
+import core.timing as timing
+from core.fastjson import FastJSONResponse
+from core.interface import get_model_connections, http_raise_internal
 
 from pyshop.shopcore.shop_rest import NumpyArrayEncoder
 
@@ -29,13 +42,7 @@ def shop_session(user_name: str, session_id: str):
 
 class CustomJSONResonse(JSONResponse):
     def render(self, content: Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=True,
-            indent=None,
-            separators=(",", ":"),
-        ).encode("utf-8")
+        return fastjson.dumps(content)
 
 api_description = """ """
 
@@ -53,6 +60,10 @@ app = FastAPI(
             'name': 'Session',
             'description': 'All model objects and operations are tied to a Session'
         },
+        {
+            'name': 'Templates',
+            'description': 'Named static models that new Sessions can be created from',
+        },
         {
             'name': 'Time Resolution',
             'description': 'Specify the time resolution for the optimization problem',
@@ -73,6 +84,10 @@ app = FastAPI(
             'name': 'Simulation',
             'description': 'Interact with the simulation using SHOP commands',
         },
+        {
+            'name': 'Jobs',
+            'description': 'Follow SHOP commands that were submitted to run in the background',
+        },
         {
             'name': 'Logging',
             'description': 'Configure logging',
@@ -80,30 +95,42 @@ app = FastAPI(
         {
             'name': 'Topology',
             'description': 'Get model topology as graphviz filestring',
+        },
+        {
+            'name': 'Metrics',
+            'description': 'Server metrics in the Prometheus text format',
+        },
+        {
+            'name': 'Profiling',
+            'description': 'Profiles of single requests, see RESTSHOP_PROFILING_ENABLED',
         }
     ]
 )
-
-def http_raise_internal(msg: str, e: Exception):
-    raise HTTPException(500, f'{msg} -- Internal Exception: {e}')
+# set before the routes are declared, see core.timing
+app.router.route_class = timing.TimedRoute
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(timing.TimingMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
 
 def get_session_id(session_id: int = Header(1)) -> int:
     return session_id
 
-def check_that_time_resolution_is_set(session_id: int = Depends(get_session_id)):
+async def check_that_time_resolution_is_set(session_id: int = Depends(get_session_id)):
     session = SessionManager.get_user_session(test_user)
     is_set = session.shop_sessions_time_resolution_is_set[session_id]
     if is_set == False:
         # In case time resolutions has been set through internal, check again
-        try:
-            session.shop_sessions[session_id].get_time_resolution()
+        if await SessionManager.call(test_user, session_id, interface.is_time_resolution_set):
             session.shop_sessions_time_resolution_is_set[session_id] = True
-        except:
+        else:
             raise HTTPException(400, 'First you must set the time_resolution of the session')
     
 
 test_user = 'test_user'
 SessionManager.add_user_session('test_user', None)
+SessionManager.session_pool.start(SessionManager.log_callback)
+SessionManager.session_spiller.start(SessionManager.get_all_shop_sessions)
+SessionManager.session_reaper.start(SessionManager.get_shop_session_list, SessionManager.remove_shop_session, SessionManager.cleanup_user_sessions)
 # SessionManager.add_shop_session(test_user, 'default_session') # Create default session at startup of rest API
 
 
@@ -114,27 +141,81 @@ async def root_documentation():
 
 # ------- session
 
-@app.post("/session", tags=['Session'])
+@app.post("/session", response_model=Session, response_model_exclude_none=True, tags=['Session'])
 async def create_session(s: Session = Body(Session(session_name='unnamed'), example={'session_name': 'unnamed', 'log_file': ''})):
-    shop = SessionManager.add_shop_session(test_user, session_name=s.session_name, log_file=s.log_file)
-    return Session(session_id = shop._id, session_name=shop._name, log_file=shop._log_file)
+    template = await run_in_threadpool(TemplateManager.get_snapshot, s.template) if s.template else None
+    shop = await run_in_threadpool(SessionManager.add_shop_session, test_user, session_name=s.session_name, log_file=s.log_file)
+    if template is not None:
+        try:
+            await SessionManager.call(test_user, shop.id, snapshot.restore_session, template)
+        except Exception:
+            SessionManager.remove_shop_session(test_user, shop.id)
+            raise
+        SessionManager.get_user_session(test_user).shop_sessions_time_resolution_is_set[shop.id] = template.time_resolution is not None
+    return Session(session_id = shop.id, session_name=shop.name, log_file=shop.log_file, template=s.template)
+
+@app.post("/session/fork", response_model=Session, response_model_exclude_none=True, tags=['Session'])
+async def fork_session(
+    s: Session = Body(None, example={'session_name': 'what-if', 'log_file': ''}),
+    includeCommands: bool = Query(False, description='replay the commands executed in the session, e.g. to fork a solved session'),
+    session_id = Depends(get_session_id)
+):
+    source = SessionManager.get_shop_session(test_user, session_id)
+    session_snapshot = await SessionManager.call(test_user, session_id, snapshot.snapshot_session, includeCommands)
+
+    session_name = s.session_name if s and 'session_name' in s.__fields_set__ else f'{source.name}-fork'
+    log_file = s.log_file if s else Session().log_file
+    shop = await run_in_threadpool(SessionManager.add_shop_session, test_user, session_name=session_name, log_file=log_file)
+    try:
+        await SessionManager.call(test_user, shop.id, snapshot.restore_session, session_snapshot)
+    except Exception:
+        SessionManager.remove_shop_session(test_user, shop.id)
+        raise
+
+    SessionManager.get_user_session(test_user).shop_sessions_time_resolution_is_set[shop.id] = session_snapshot.time_resolution is not None
+    return Session(session_id = shop.id, session_name=shop.name, log_file=shop.log_file)
 
-@app.get("/sessions", response_model=List[Session], tags=['Session'])
+@app.get("/sessions", response_model=List[Session], response_model_exclude_none=True, tags=['Session'])
 async def get_sessions():
     return [
         Session(
-            session_id = s._id,
-            session_name = s._name,
-            log_file = s._log_file
+            session_id = s.id,
+            session_name = s.name,
+            log_file = s.log_file,
+            status = s.status,
+            error = s.failure
         ) for _, s in SessionManager.get_shop_sessions(test_user).items()
     ]
 
 
-@app.get("/session", response_model=Session, tags=['Session'])
+@app.get("/sessions/info", response_model=List[SessionInfo], response_model_exclude_none=True, tags=['Session'])
+async def get_sessions_info(session_id: int = Query(None, description='only report this session')):
+    sessions = SessionManager.get_shop_sessions(test_user)
+    if session_id is not None:
+        if session_id not in sessions:
+            raise HTTPException(404, f'Session with id {{{session_id}}} not found')
+        sessions = {session_id: sessions[session_id]}
+    return [await introspection.session_info(s) for s in list(sessions.values())]
+
+@app.get("/sessions/pool", response_model=SessionPoolStats, tags=['Session'])
+async def get_session_pool_stats():
+    return SessionPoolStats(**SessionManager.session_pool.stats())
+
+@app.get("/sessions/spill", response_model=SessionSpillStats, tags=['Session'])
+async def get_session_spill_stats():
+    return SessionSpillStats(**SessionManager.session_spiller.stats(SessionManager.get_all_shop_sessions()))
+
+@app.get("/sessions/reaper", response_model=SessionReaperStats, tags=['Session'])
+async def get_session_reaper_stats():
+    return SessionReaperStats(**SessionManager.session_reaper.stats())
+
+@app.get("/session", response_model=Session, response_model_exclude_none=True, tags=['Session'])
 async def get_session(session_id: int = Query(1)):
     if session_id in SessionManager.get_shop_sessions(test_user):
         s = shop_session(test_user, session_id)
-        return Session(session_id = s._id, session_name = s._name)
+        if s.failure:
+            return Session(session_id = s.id, session_name = s.name, status = s.status, error = s.failure)
+        return Session(session_id = s.id, session_name = s.name)
     else:
         raise HTTPException(404, f'Session with id {{{session_id}}} not found')
 
@@ -148,6 +229,22 @@ async def delete_session(session_id: int = Query(1)):
     else:
         HTTPException(404, f'Session with id {{{session_id}}} not found')
 
+# --------- templates
+
+@app.get("/templates", response_model=List[Template], tags=['Templates'])
+async def get_templates():
+    return await run_in_threadpool(TemplateManager.get_templates)
+
+@app.put("/templates/{template_id}", response_model=Template, tags=['Templates'])
+async def register_template(template_id: str, model: ShopModel = Body(...)):
+    return await TemplateManager.register(template_id, model)
+
+@app.delete("/templates/{template_id}", tags=['Templates'])
+async def delete_template(template_id: str):
+    if not await run_in_threadpool(TemplateManager.remove, template_id):
+        raise HTTPException(404, f'Template with id {{{template_id}}} not found')
+    return None
+
 # --------- time_resolution
 
 @app.put("/time_resolution", tags=["Time Resolution"])
@@ -162,27 +259,7 @@ async def set_time_resolution(
     ),
     session_id = Depends(get_session_id)):
 
-    # validate
-    start = pd.Timestamp(time_resolution.start_time)
-    end = pd.Timestamp(time_resolution.end_time)
-
-    if (end <= start):
-        raise HTTPException(400, 'end_time must be strictly greater than start_time')
-
-    if (time_resolution.time_resolution):
-        tr: Series = time_resolution.time_resolution
-        shop_session(test_user, session_id).set_time_resolution(
-            starttime=start,
-            endtime=end,
-            timeunit=time_resolution.time_unit,
-            timeresolution=pd.Series(index=tr.index, data=tr.values)
-        )
-    else:
-        shop_session(test_user, session_id).set_time_resolution(
-            starttime=start,
-            endtime=end,
-            timeunit=time_resolution.time_unit
-        )
+    await SessionManager.call(test_user, session_id, interface.set_time_resolution, time_resolution)
 
 
     # store the fact that time_resolution has been set
@@ -195,7 +272,7 @@ async def set_time_resolution(
 async def get_time_resolution(session_id = Depends(get_session_id)):
 
     try:
-        tr = shop_session(test_user, session_id).get_time_resolution()
+        tr = await SessionManager.call(test_user, session_id, interface.get_time_resolution)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -205,16 +282,56 @@ async def get_time_resolution(session_id = Depends(get_session_id)):
         start_time=tr['starttime'],
         end_time=tr['endtime'],
         time_unit=tr['timeunit'],
-        time_resolution=Series_from_pd(tr['timeresolution'])
+        time_resolution=TimeSeries_from_pd(tr['timeresolution'])
     )
 
 # ------ object types and attributes
 @app.get("/object_types", response_model=List[str], response_model_exclude_unset=True, tags=['Object and attribute types'])
 async def get_model_object_types(session_id = Depends(get_session_id)):
-    return list(shop_session(test_user, session_id).model._all_types)
+    SessionManager.get_shop_session(test_user, session_id) # Check that session exists
+    return Response(content=registry.object_types_json, media_type='application/json')
 
 # ------ model
 
+time_format_desc = """
+How timestamps of time series are encoded: `iso` timestamps, `epoch` seconds since 1970-01-01T00:00:00Z,
+`start_step` with the first timestamp and the seconds between values, or `implicit` where the values follow the time resolution of the session.
+Series that can not be represented in the requested format fall back to `start_step`, `epoch` and finally `iso`.
+"""
+
+async def stream_model(session_id: int, selection: dict, includeTime: bool, includeConnections: bool, compressTxy: bool, timeFormat: TimeFormatEnum, session_index):
+
+    # every object is read in its own call, so that only one object is held in memory and other requests can run in between
+    try:
+        if includeTime:
+            time = await SessionManager.call(test_user, session_id, interface.get_model_time_dict)
+            yield fastjson.dumps_line({'time': time})
+
+        for object_type, objects in selection.items():
+            for object_name, attribute_list in objects.items():
+                attributes = await SessionManager.call(
+                    test_user, session_id, interface.get_model_object_attributes_dict,
+                    object_type, object_name, attribute_list, compressTxy, timeFormat, session_index
+                )
+                yield fastjson.dumps_line({'object_type': object_type, 'object_name': object_name, 'attributes': attributes})
+
+        if includeConnections:
+            connections = await SessionManager.call(test_user, session_id, interface.get_model_connections_dict)
+            yield fastjson.dumps_line({'connections': connections})
+    except HTTPException as e:
+        # the status code has already been sent, so errors are reported as the last line
+        yield fastjson.dumps_line({'error': e.detail})
+
+get_model_accept_desc = f"""
+Set to `{columnar.NPZ_MEDIA_TYPE}` or `{columnar.ARROW_MEDIA_TYPE}` (requires pyarrow on the server) to get the txy and curve attributes as columns instead of JSON.
+Every txy attribute is a float64 column named `object_type/object_name/attribute` next to a shared `timestamp` column,
+curves are packed into flat `x` and `y` arrays where curve i is `x[offset[i]:offset[i+1]]`.
+
+Set to `application/x-ndjson` to stream the model with one JSON object per line, starting with `{{"time": ...}}` if includeTime is set,
+then `{{"object_type": ..., "object_name": ..., "attributes": {{...}}}}` for every object and finally `{{"connections": [...]}}` if includeConnections is set.
+Objects are sent as soon as they are read, so memory use does not grow with the size of the model.
+"""
+
 @app.get("/model", response_model=ShopModel, response_model_exclude_unset=True, response_model_exclude_none=True, tags=['Model'])
 async def get_model(
         session_id = Depends(get_session_id),
@@ -226,56 +343,54 @@ async def get_model(
         isOutput: bool = True,
         includeTime: bool = False,
         includeConnections: bool = False,
-        compressTxy: bool = False
+        compressTxy: bool = False,
+        timeFormat: TimeFormatEnum = Query(TimeFormatEnum.iso, description=time_format_desc),
+        accept: str = Header(None, description=get_model_accept_desc)
     ):
-    session = shop_session(test_user, session_id)
-
-    # Get time resolution
-    if includeTime:
-        time_res = session.get_time_resolution()
-        time = TimeResolution(
-            start_time=time_res['starttime'],
-            end_time=time_res['endtime'],
-            time_unit=time_res['timeunit'],
-            time_resolution=TimeSeries_from_pd(time_res['timeresolution'])
+    media_type = columnar.negotiate_media_type(accept, [fastjson.NDJSON_MEDIA_TYPE] + columnar.COLUMNAR_MEDIA_TYPES)
+    if media_type == fastjson.NDJSON_MEDIA_TYPE:
+        selection = await SessionManager.call(
+            test_user, session_id, interface.select_model_attributes,
+            objectType=objectType,
+            objectName=objectName,
+            attributeName=attributeName,
+            datatype=datatype,
+            isInput=isInput,
+            isOutput=isOutput
         )
-    else:
-        time = None
-
-    # Get model objects
-    object_types = session.model._all_types if objectType is None else [objectType]
-    model_dict = dict()
-    for ot in object_types:
-        if objectName is None:
-            object_list = session.model[ot].get_object_names()
-            if len(object_list) == 0:
-                continue
-        else:
-            object_list = [objectName]
-        model_dict[ot] = dict()
-        for on in object_list:
-            attribute_list = session.shop_api.GetObjectTypeAttributeNames(ot) if attributeName is None else [attributeName]
-            model_dict[ot][on] = dict()
-            for attr in attribute_list:
-                if ((attribute_map[ot][attr]['isInput'] and isInput)
-                        or (attribute_map[ot][attr]['isOutput'] and isOutput)
-                        and ((datatype is None) or datatype == attribute_map[ot][attr]['datatype'])):
-                    model_dict[ot][on][attr] = serialize_model_object_attribute(session, ot, on, attr, compressTxy)
-    model = ObjectTypeModel(**model_dict)
-
-    # Get connections
-    if includeConnections:
-        connections = get_model_connections(session)
-    else:
-        connections = None
-
-    return ShopModel(
-        time=time,
-        model=model,
-        connections=connections,
+        session_index = await SessionManager.call(test_user, session_id, session_time_index) if timeFormat == TimeFormatEnum.implicit else None
+        lines = stream_model(session_id, selection, includeTime, includeConnections, compressTxy, timeFormat, session_index)
+        return StreamingResponse(lines, media_type=media_type)
+
+    if media_type is not None:
+        columns = await SessionManager.call(
+            test_user, session_id, columnar.get_model_columns,
+            objectType=objectType,
+            objectName=objectName,
+            attributeName=attributeName,
+            datatype=datatype,
+            isInput=isInput,
+            isOutput=isOutput
+        )
+        content = await run_in_threadpool(columnar.encode_columns, columns, media_type)
+        return Response(content=content, media_type=media_type)
+
+    content = await SessionManager.call(
+        test_user, session_id, interface.get_model_dict,
+        objectType=objectType,
+        objectName=objectName,
+        attributeName=attributeName,
+        datatype=datatype,
+        isInput=isInput,
+        isOutput=isOutput,
+        includeTime=includeTime,
+        includeConnections=includeConnections,
+        compressTxy=compressTxy,
+        timeFormat=timeFormat
     )
+    return FastJSONResponse(content)
 
-@app.put("/model", response_model=ShopModel, response_model_exclude_unset=True, tags=['Model'])
+@app.put("/model", response_model=Union[CommandStatus, Job, ShopModel], response_model_exclude_unset=True, tags=['Model'])
 async def create_or_modify_existing_model(
     model: ShopModel = Body(
         None,
@@ -443,84 +558,22 @@ async def create_or_modify_existing_model(
             ]
         }
     ),
-    session_id = Depends(get_session_id)
+    session_id = Depends(get_session_id),
+    asynchronous: bool = Query(False, description='queue the commands as a background job and return the job instead of waiting for them')
 ):
-    session = shop_session(test_user, session_id)
-    if hasattr(model, 'time'):
-        if model.time is not None:
-            time_resolution: TimeResolution = model.time
-            start = pd.Timestamp(time_resolution.start_time)
-            end = pd.Timestamp(time_resolution.end_time)
-
-            if (end <= start):
-                raise HTTPException(400, 'end_time must be strictly greater than start_time')
-
-            if (time_resolution.time_resolution):
-                tr: Series = time_resolution.time_resolution
-                session.set_time_resolution(
-                    starttime=start,
-                    endtime=end,
-                    timeunit=time_resolution.time_unit,
-                    timeresolution=pd.Series(index=tr.timestamps, data=tr.values[0])
-                )
-            else:
-                session.set_time_resolution(
-                    starttime=start,
-                    endtime=end,
-                    timeunit=time_resolution.time_unit
-                )
+    commands = model.commands if model is not None and asynchronous else None
+    if commands:
+        model = model.copy(update={'commands': None})
 
-            # store the fact that time_resolution has been set
-            us = SessionManager.get_user_session(test_user)
-            us.shop_sessions_time_resolution_is_set[session_id] = True
-    if hasattr(model, 'model'):
-        if model.model is not None:
-            for (object_type, objects) in model.model:
-                try:
-                    object_generator = session.model[object_type]
-                except Exception as e:
-                    raise HTTPException(500, f'model does not implement object_type {{{object_type}}}')
-                if objects is not None:
-                    object_names = object_generator.get_object_names()
-                    for (object_name, object_attributes) in objects.items():
-                        if object_name not in object_names:
-                            try:
-                                object_generator.add_object(object_name)
-                            except Exception as e:
-                                raise HTTPException(500, f'object_name {{{object_name}}} is in conflict with existing instance')
-                        model_object = session.model[object_type][object_name]
-                        if object_attributes:
-                            for (attribute_name, attribute_value) in object_attributes:
-                                if attribute_value is not None:
-                                    try:
-                                        datatype = attribute_map[object_type][attribute_name]['datatype']  #model_object[attribute_name].info()['datatype']
-                                    except Exception as e:
-                                        http_raise_internal(f'unknown object_attribute {attribute_name} for {object_type} {object_name}', e)
-                                    set_datatype(datatype)(session, object_type, object_name, attribute_name, attribute_value)
-    if hasattr(model, 'connections'):
-        if model.connections is not None:
-            for connection in model.connections:
-                relation_type = connection.relation_type if connection.relation_type != 'default' else ''
-
-                fo = SessionManager.get_model_object_instance(test_user, session_id, connection.from_type, connection.from_)
-                to = SessionManager.get_model_object_instance(test_user, session_id, connection.to_type, connection.to)
-
-                fo.connect_to(to, connection_type=relation_type)
-    if hasattr(model, 'commands'):
-        if model.commands is not None:
-            for command in model.commands:
-                status = True
-                try:
-                    # status: bool = session._execute_command(command.options, command.values) # does this return anything
-                    last_status = session.shop_api.ExecuteCommand(command.command, command.options, command.values)
-                    if status:
-                        status = last_status
-                except Exception as e:
-                    http_raise_internal('failed to execute simulation command', e)
-            return CommandStatus(
-                message=('ok' if status else 'something went wrong ...'),
-                status=status
-            )
+    status = await SessionManager.call(test_user, session_id, interface.set_model, model)
+    if model is not None and model.time is not None:
+        # store the fact that time_resolution has been set
+        us = SessionManager.get_user_session(test_user)
+        us.shop_sessions_time_resolution_is_set[session_id] = True
+
+    if commands:
+        return submit_commands(session_id, commands)
+    return status
 
 # ------ object_type
 
@@ -528,7 +581,7 @@ async def create_or_modify_existing_model(
 async def get_model_object_type_information_all(
     session_id = Depends(get_session_id)
 ):
-    return attribute_map
+    return Response(content=registry.information_json, media_type='application/json')
 
 @app.get("/model/{object_type}/information", response_model=ObjectType, response_model_exclude_unset=True, tags=['Model'])
 async def get_model_object_type_information(
@@ -541,52 +594,8 @@ async def get_model_object_type_information(
     if attribute_filter != '*':
         raise HTTPException(500, 'setting attribute_filter != * is not support yet')
 
-    ot = SessionManager.get_model_object_generator(test_user, session_id, object_type)
-    instances = list(ot.get_object_names())
-    sess = shop_session(test_user, session_id)
-    attribute_names: List[str] = list(sess.shop_api.GetObjectTypeAttributeNames(object_type))
-    attribute_types: List[str] = list(sess.shop_api.GetObjectTypeAttributeDatatypes(object_type))
-
-    if not verbose:
-        attributes = {
-            n: new_attribute_type_name_from_old(t)
-            for n, t in zip(attribute_names, attribute_types)
-        }
-    else:
-
-        # TODO: Create this kind of dictionary once at startup, since this might be expensive?
-        attr_info = {
-            attr_name: {
-                info_key: sess.shop_api.GetAttributeInfo(object_type, attr_name, info_key)
-                for info_key in sess.shop_api.GetValidAttributeInfoKeys()
-            } for attr_name in attribute_names
-        }
-
-        attributes = {
-            n: ObjectAttribute(
-                attribute_name = n,
-                attribute_type = new_attribute_type_name_from_old(t),
-                is_input = attr_info[n]['isInput'],
-                is_output = attr_info[n]['isOutput'],
-                legacy_datatype = attr_info[n]['datatype'],
-                x_unit = attr_info[n]['xUnit'],
-                y_unit = attr_info[n]['yUnit'],
-                license_name = attr_info[n]['licenseName'],
-                full_name = attr_info[n]['fullName'],
-                data_func_name = attr_info[n]['dataFuncName'],
-                description = attr_info[n]['description'],
-                documentation_url = attr_info[n]['documentationUrl'],
-                example_url_prefix = attr_info[n]['exampleUrlPrefix'],
-                example = attr_info[n]['example']
-            )
-            for n, t in zip(attribute_names, attribute_types)
-        }
-
-    return ObjectType(
-        object_type = object_type,
-        instances = instances, 
-        attributes = attributes,
-    )
+    instances = await SessionManager.call(test_user, session_id, interface.get_object_names, object_type)
+    return Response(content=registry.object_type_information_json(object_type.value, instances, verbose), media_type='application/json')
 
 # ------ object_name
 
@@ -621,54 +630,44 @@ async def create_or_modify_existing_model_object_instance(
     ),
     session_id = Depends(get_session_id)
     ):
-    
-    session = shop_session(test_user, session_id)
-    try:
-        object_generator = session.model[object_type]
-    except Exception as e:
-        raise HTTPException(500, f'model does not implement object_type {{{object_type}}}') 
-
-    for cmd in session.get_executed_commands():
-        print("-----", cmd)
-        if 'start sim' in cmd:
-            session._sim_has_started = True
-            break
-    
-    if session._sim_has_started:
-        raise HTTPException(500, f'simulation has already been started, make a new session first')
 
-    if object_name not in object_generator.get_object_names():
-        try:
-            object_generator.add_object(object_name)
-        except Exception as e:
-            raise HTTPException(500, f'object_name {{{object_name}}} is in conflict with existing instance')
-
-    if object_instance and object_instance.attributes:
-        for (k,v) in object_instance.attributes.items():
+    return await SessionManager.call(test_user, session_id, interface.set_model_object_instance, object_type, object_name, object_instance)
 
-            try:
-                datatype = attribute_map[object_type][k]['datatype'] #model_object[k].info()['datatype']
-            except Exception as e:
-                http_raise_internal(f'unknown object_attribute {k} for object_type {object_type}', e)
-            set_datatype(datatype)(session, object_type, object_name, k, v)
+@app.put("/model/{object_type}/instances",
+    response_model=ObjectInstancesStatus,
+    dependencies=[Depends(check_that_time_resolution_is_set)],
+    response_model_exclude_none=True, tags=['Model'])
+async def create_or_modify_existing_model_object_instances(
+    object_type: ObjectTypeEnum,
+    object_instances: Dict[str, ObjectInstance] = Body(
+        ...,
+        example={
+            'Plant1_G1': {'attributes': {'p_min': 10.0, 'p_max': 100.0, 'gen_eff_curve': {'x_values': [0.0, 100.0], 'y_values': [95.0, 98.0]}}},
+            'Plant1_G2': {'attributes': {'p_min': 20.0, 'p_max': 120.0, 'gen_eff_curve': {'x_values': [0.0, 120.0], 'y_values': [95.0, 98.0]}}},
+        },
+        description='instances by object_name'
+    ),
+    return_: ReturnEnum = Query(ReturnEnum.representation, alias='return', description='minimal returns only the counts and errors, without reading the instances back'),
+    session_id = Depends(get_session_id)
+    ):
 
-    SessionManager.get_model_object_instance(test_user, session_id, object_type, object_name)
-    return serialize_model_object_instance(session, object_type, object_name)
+    content = await SessionManager.call(test_user, session_id, interface.set_model_object_instances, object_type, object_instances, return_ == ReturnEnum.minimal)
+    return FastJSONResponse(content)
 
 @app.get("/model/{object_type}", response_model=ObjectInstance, dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Model'])
 async def get_model_object_instance(
     object_type: ObjectTypeEnum,
     object_name: str = Query('example_reservoir'),
     attribute_filter: str = Query('*', description='filter attributes by regex'),
+    timeFormat: TimeFormatEnum = Query(TimeFormatEnum.iso, description=time_format_desc),
     session_id = Depends(get_session_id)
     ):
 
     if attribute_filter != '*':
         raise HTTPException(500, 'setting attribute_filter != * is not support yet')
 
-    SessionManager.get_model_object_instance(test_user, session_id, object_type, object_name) # Check that object exists
-    session = shop_session(test_user, session_id)
-    return serialize_model_object_instance(session, object_type, object_name)
+    content = await SessionManager.call(test_user, session_id, interface.get_model_object_instance_dict, object_type, object_name, timeFormat)
+    return FastJSONResponse(content)
 
 
 # ------ connection
@@ -676,18 +675,11 @@ async def get_model_object_instance(
 
 @app.get("/connections", response_model=List[Connection], dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Connections'])
 async def get_connections(session_id = Depends(get_session_id)):
-    return get_model_connections(shop_session(test_user, session_id))
+    return await SessionManager.call(test_user, session_id, get_model_connections)
 
 @app.put("/connections", dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Connections'])
 async def add_connections(connections: List[Connection], session_id = Depends(get_session_id)):
-
-    for connection in connections:
-        relation_type = connection.relation_type if connection.relation_type != 'default' else ''
-
-        fo = SessionManager.get_model_object_instance(test_user, session_id, connection.from_type, connection.from_)
-        to = SessionManager.get_model_object_instance(test_user, session_id, connection.to_type, connection.to)
-
-        fo.connect_to(to, connection_type=relation_type)
+    await SessionManager.call(test_user, session_id, interface.add_model_connections, connections)
 
 @app.put("/connect/{from_type}/{from_name}/{to_type}/{to_name}", dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Connections'])
 async def add_connection(
@@ -697,33 +689,62 @@ async def add_connection(
     session_id = Depends(get_session_id)):
 
     connection_type = connection_type if connection_type != 'default' else ''
-
-    fo = SessionManager.get_model_object_instance(test_user, session_id, from_type, from_name)
-    to = SessionManager.get_model_object_instance(test_user, session_id, to_type, to_name)
-    fo.connect_to(to, connection_type=connection_type)
+    await SessionManager.call(test_user, session_id, interface.add_model_connection, from_type, from_name, to_type, to_name, connection_type)
 
 # ------ shop commands
 
-@app.post("/simulation/{command}", response_model=CommandStatus, dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Simulation'])
-async def post_simulation_command(command: ShopCommandEnum, args: CommandArguments = None, session_id = Depends(get_session_id)):
+@app.post("/simulation/{command}", response_model=Union[CommandStatus, Job], dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Simulation'])
+async def post_simulation_command(
+    command: ShopCommandEnum,
+    args: CommandArguments = None,
+    session_id = Depends(get_session_id),
+    asynchronous: bool = Query(False, description='queue the command as a background job and return the job instead of waiting for it')
+):
+    if asynchronous:
+        options, values = (args.options, args.values) if args else ([], [])
+        return JobManager.submit(
+            test_user, session_id,
+            commands=[JobCommand(command=command, options=options, values=values)],
+            steps=[(interface.execute_command, (command, args))]
+        )
+    return await SessionManager.call(test_user, session_id, interface.execute_command, command, args)
 
-    sess = shop_session(test_user, session_id)
-    sess._command = command
-    try:
-        status: bool = sess._execute_command(args.options, args.values) # does this return anything
-    except Exception as e:
-        http_raise_internal('failed to execute simulation command', e)
-    return CommandStatus(
-        message=('ok' if status else 'something went wrong ...'),
-        status=status
+# ------ jobs
+
+def submit_commands(session_id: int, commands: List[Command]) -> Job:
+    return JobManager.submit(
+        test_user, session_id,
+        commands=[JobCommand(command=c.command, options=c.options, values=c.values) for c in commands],
+        steps=[(interface.execute_commands, ([c],)) for c in commands]
     )
 
+@app.post("/jobs", response_model=Job, dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Jobs'])
+async def create_job(
+    commands: List[Command] = Body(..., example=[{'command': 'start sim', 'options': [], 'values': ['3']}]),
+    session_id = Depends(get_session_id)
+):
+    return submit_commands(session_id, commands)
+
+@app.get("/jobs", response_model=List[Job], tags=['Jobs'])
+async def get_jobs(session_id: int = Query(None, description='only list jobs of this session')):
+    return JobManager.get_jobs(test_user, session_id)
+
+@app.get("/jobs/{job_id}", response_model=Job, tags=['Jobs'])
+async def get_job(job_id: int, wait: float = Query(0, ge=0, description='wait up to this many seconds for the job to finish before responding')):
+    if wait > 0:
+        return await JobManager.wait(test_user, job_id, wait)
+    return JobManager.get_job(test_user, job_id)
+
+@app.delete("/jobs/{job_id}", response_model=Job, tags=['Jobs'])
+async def cancel_job(job_id: int):
+    return JobManager.cancel(test_user, job_id)
+
 # ------- logging
 
 logging_desc = """
 Specify where SHOP should send log messages.
 
-The messages are sent to the endpoint one by one in the body of POST requests. They are JSON formatted and contain three fields.
+The messages are sent to the endpoint in the body of POST requests. They are JSON formatted and contain three fields.
 
 Example:
 
@@ -734,6 +755,11 @@ Example:
 "message": "SHOP is thinking about your problem"
 }
 ```
+
+With `batch` set to true, every request contains a list of such messages instead, e.g. to `/log/messages` of the log consumer.
+
+Messages are queued and sent in the background, so SHOP is never slowed down by a slow endpoint.
+If the endpoint can not keep up, info messages are sampled and finally dropped, see `/logging/stats`.
 """
 
 @app.post("/logging/endpoint", response_model=LoggingEndpoint, tags=['Logging'], description=logging_desc)
@@ -741,31 +767,97 @@ async def register_logging_endpoint(endpoint: LoggingEndpoint = Body(LoggingEndp
 
     sessions = SessionManager.get_shop_sessions(test_user)
     if session_id in sessions:
-        session_name = sessions[session_id]._name
+        session_name = sessions[session_id].name
     else:
         raise HTTPException(404, f'Session with id {{{session_id}}} not found')
 
+    message = {
+        'id':session_name,
+        'level': 'INFO',
+        'message':'Connection established'
+    }
     try:
-        req = requests.post(
+        req = await run_in_threadpool(
+            requests.post,
             f'{endpoint.endpoint}',
-            data=json.dumps({
-                'id':session_name,
-                'level': 'INFO',
-                'message':'Connection established'
-            }),
+            data=json.dumps([message] if endpoint.batch else message),
             verify=False
         )
     except Exception as e:
         http_raise_internal('failed to ping log endpoint', e)
 
-    SessionManager.logging_endpoint = endpoint.endpoint
+    SessionManager.log_forwarder.configure(endpoint.endpoint, endpoint.batch)
     return endpoint
 
+@app.get("/logging/stats", response_model=LoggingStats, tags=['Logging'])
+async def get_logging_stats():
+    forwarder = SessionManager.log_forwarder
+    return LoggingStats(endpoint=forwarder.endpoint, batch=forwarder.batch, **forwarder.stats())
+
+# ------ metrics
+
+def _collect_sessions():
+    sessions = SessionManager.get_all_shop_sessions()
+    statuses = [s.status for s in sessions]
+    return [({'status': status}, statuses.count(status)) for status in ('ok', 'failed', 'spilled')]
+
+def _collect_jobs():
+    statuses = [job.status for job in JobManager.get_jobs(test_user)]
+    return [({'status': status.value}, statuses.count(status)) for status in JobStatusEnum]
+
+def _collect_log_messages():
+    stats = SessionManager.log_forwarder.stats()
+    return [({'outcome': outcome}, stats[outcome]) for outcome in ('enqueued', 'sent', 'dropped', 'sampled_out', 'failed')]
+
+metrics.register_collector('restshop_sessions', 'gauge', 'Sessions by status.', _collect_sessions)
+metrics.register_collector('restshop_session_pending_calls', 'gauge', 'Calls running or queued on all sessions.',
+    lambda: [({}, sum(s.pending_calls for s in SessionManager.get_all_shop_sessions()))])
+metrics.register_collector('restshop_jobs', 'gauge', 'Jobs by status, including finished jobs that are kept for polling.', _collect_jobs)
+metrics.register_collector('restshop_log_queue_depth', 'gauge', 'Log messages waiting to be forwarded.',
+    lambda: [({}, SessionManager.log_forwarder.stats()['queued'])])
+metrics.register_collector('restshop_log_messages_total', 'counter', 'Log messages by outcome, dropped and sampled_out were never forwarded.', _collect_log_messages)
+metrics.register_collector('restshop_session_pool_available', 'gauge', 'Started sessions waiting in the session pool.',
+    lambda: [({}, SessionManager.session_pool.stats()['available'])])
+
+@app.get("/metrics", tags=['Metrics'])
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ------ profiling
+def check_that_profiling_is_enabled():
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(404, 'Profiling is disabled, set RESTSHOP_PROFILING_ENABLED=1')
+
+@app.get("/profiles", response_model=List[ProfileInfo], dependencies=[Depends(check_that_profiling_is_enabled)], tags=['Profiling'])
+async def get_profiles():
+    return [ProfileInfo(**profile) for profile in profiling.list_profiles()]
+
+@app.get("/profiles/{profile_id}", dependencies=[Depends(check_that_profiling_is_enabled)], tags=['Profiling'])
+async def get_profile(
+        profile_id: str,
+        sort: str = Query('cumulative', description='pstats sort key, e.g. cumulative, tottime or ncalls'),
+        limit: int = Query(50, description='number of functions in the report'),
+        format: str = Query('text', description='text for a report, pstats for the raw file (e.g. for snakeviz)'),
+    ):
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(404, f'Profile {{{profile_id}}} not found')
+    if format == 'pstats':
+        with open(path, 'rb') as f:
+            return Response(content=f.read(), media_type='application/octet-stream',
+                headers={'Content-Disposition': f'attachment; filename="{profile_id}.prof"'})
+    try:
+        report = await run_in_threadpool(profiling.report, path, sort, limit)
+    except KeyError:
+        raise HTTPException(400, f'Unknown sort key {{{sort}}}')
+    return Response(content=report, media_type='text/plain')
+
 # ------ topology
 @app.get("/topology", dependencies=[Depends(check_that_time_resolution_is_set)], tags=['Topology'])
 async def get_topology(session_id = Depends(get_session_id)):
     try:
-        return Response(content=shop_session(test_user, session_id).model.build_connection_tree().source, media_type="text/plain")
+        source = await SessionManager.call(test_user, session_id, interface.get_topology)
+        return Response(content=source, media_type="text/plain")
     except:
         return CommandStatus(message = 'Failed to generate graphviz topology', status=False)
 
@@ -774,21 +866,18 @@ async def get_topology(session_id = Depends(get_session_id)):
 
 @app.get("/internal", response_model=ApiCommands, tags=['__internals'])
 async def get_available_internal_methods(session_id = Depends(get_session_id)):
-    command_types = shop_session(test_user, session_id).shop_api.__dir__()
-    command_types = list(filter(lambda x: x[0] != '_', command_types))
+    command_types = await SessionManager.call(test_user, session_id, interface.get_internal_method_names)
     return ApiCommands(command_types = command_types)
 
 @app.get("/internal/{command}", response_model=ApiCommandDescription, tags=['__internals'])
 async def get_internal_method_description(command: ApiCommandEnum, session_id = Depends(get_session_id)):
-    doc = getattr(shop_session(test_user, session_id).shop_api, command).__doc__
-    return ApiCommandDescription(description = str(doc))
+    doc = await SessionManager.call(test_user, session_id, interface.get_internal_method_description, command)
+    return ApiCommandDescription(description = doc)
 
 @app.post("/internal/{command}", response_model=CommandStatus, tags=['__internals'])
 async def call_internal_method(command: ApiCommandEnum, cmdargs: ApiCommandArgs = ApiCommandArgs(args=(), kwargs={}), session_id = Depends(get_session_id)):
     try:
-        res = getattr(shop_session(test_user, session_id).shop_api, command)(*cmdargs.args, **cmdargs.kwargs)
-        if command == 'GetTxySeriesY':
-            res = np.transpose(res)
+        res = await SessionManager.call(test_user, session_id, interface.call_internal_method, command, cmdargs.args, cmdargs.kwargs)
         return Response(content=json.dumps(res, cls=NumpyArrayEncoder), media_type="json/application")
     except:
         return CommandStatus(message = 'Invalid function or arguments', status=False)
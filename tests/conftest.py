@@ -7,8 +7,9 @@ import main
 
 @pytest.fixture(scope="class")
 def client():
-    client = TestClient(main.app)
-    return client
+    # one event loop for all requests, so that jobs keep running after the request that submitted them
+    with TestClient(main.app) as client:
+        yield client
 
 @pytest.fixture(scope="class")
 def session_id_manager():
@@ -1,10 +1,73 @@
 import pytest
 import json
+import io
+import numpy as np
 
-import sys, os
+import sys, os, time
 sys.path.append(os.getcwd())
 from core.schemas import *
 
+
+def shop_available() -> bool:
+    # pyshop with the SHOP binaries, not the stand-in session of benchmarks.standin
+    from core import config
+    path = os.environ.get('ICC_COMMAND_PATH', '')
+    return not config.SHOP_SESSION_CLASS and os.path.isdir(path) and any(f.startswith('shop_pybind') for f in os.listdir(path))
+
+requires_shop = pytest.mark.skipif(not shop_available(), reason='needs pyshop with the SHOP binaries (ICC_COMMAND_PATH)')
+
+
+def shop_with_reservoirs(start, hours, time_resolution=None):
+    from core import interface
+    from core.workers import create_shop_session
+    shop = create_shop_session(1, 'raw_arrays')
+    interface.set_time_resolution(shop, TimeResolution(start_time=start, end_time=start + pd.Timedelta(hours=hours), time_unit='hour', time_resolution=time_resolution))
+    for object_name in ('res_raw', 'res_pyshop'):
+        shop.model.reservoir.add_object(object_name)
+    return shop
+
+
+def read_inflow(shop, object_name, monkeypatch, raw):
+    from core import config, fastjson
+    monkeypatch.setattr(config, 'RAW_ARRAY_READS', raw)
+    return json.loads(fastjson.dumps(encode_model_object_attribute(shop, 'reservoir', object_name, 'inflow', False)))
+
+
+class StubLogEndpoint:
+    # stands in for the requests.Session of a LogForwarder, answers with the given status codes (or raises them) in turn, then 200
+    def __init__(self, *outcomes):
+        import threading
+        self.outcomes = list(outcomes)
+        self.payloads = []
+        self.posting = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def post(self, endpoint, json=None, timeout=None):
+        from types import SimpleNamespace
+        self.posting.set()
+        self.release.wait(5)
+        self.payloads.append(json)
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(status_code=outcome)
+
+
+def log_forwarder(endpoint, batch=False, **kwargs):
+    from core.log_forwarder import LogForwarder
+    forwarder = LogForwarder(**kwargs)
+    forwarder._http = endpoint
+    forwarder.configure('http://log-consumer/log/messages', batch)
+    return forwarder
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
 # SESSION
 class TestMain:
     
@@ -293,6 +356,194 @@ class TestMain:
         for attr, expected_value in self.expected_b.attributes.items():
             assert b.attributes[attr] == expected_value
 
+    def test_get_model_npz(self, client, session_id_manager):
+        response = client.get(
+            '/model',
+            params={'objectType': 'reservoir', 'objectName': 'test_res', 'isInput': True},
+            headers={"accept": "application/x-npz", "session-id": str(session_id_manager.session_id)}
+        )
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-npz'
+        columns = np.load(io.BytesIO(response.content))
+        assert len(columns['txy/timestamp']) == len(columns['txy/reservoir/test_res/inflow'])
+        assert list(columns['curves/attribute']) == ['vol_head', 'water_value_input']
+        assert list(columns['curves/offset']) == [0, 3, 6]
+        assert list(columns['curves/y'][:3]) == [42.0, 43.0, 45.0]
+
+    def test_get_model_arrow_mixed_datatypes(self, client, session_id_manager):
+        pytest.importorskip('pyarrow')
+        headers = {"accept": "application/vnd.apache.arrow.stream", "session-id": str(session_id_manager.session_id)}
+        params = {'objectType': 'reservoir', 'objectName': 'test_res', 'isInput': True}
+        assert client.get('/model', params=params, headers=headers).status_code == 406
+        response = client.get('/model', params={**params, 'datatype': 'txy'}, headers=headers)
+        assert response.status_code == 200
+
+    def test_get_model_ndjson(self, client, session_id_manager):
+        response = client.get(
+            '/model',
+            params={'objectType': 'reservoir', 'isInput': True, 'includeTime': True},
+            headers={"accept": "application/x-ndjson", "session-id": str(session_id_manager.session_id)}
+        )
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert 'time' in lines[0]
+        objects = {line['object_name']: line for line in lines[1:]}
+        assert objects['test_res']['object_type'] == 'reservoir'
+        assert objects['test_res']['attributes']['vol_head']['y_values'] == [42.0, 43.0, 45.0]
+
+    @pytest.mark.parametrize('use_orjson', [True, False])
+    def test_fastjson_non_finite_values(self, monkeypatch, use_orjson):
+        from core import fastjson
+        if use_orjson:
+            pytest.importorskip('orjson')
+        else:
+            monkeypatch.setattr(fastjson, 'orjson', None)
+        content = {'a': float('nan'), 'b': np.array([1.0, np.nan, np.inf]), 'c': [-np.inf, 2.0], 1.5: 'x'}
+        assert json.loads(fastjson.dumps(content)) == {'a': None, 'b': [1.0, None, None], 'c': [None, 2.0], '1.5': 'x'}
+
+    def test_put_model_object_instance_compact_timestamps(self, client, session_id_manager):
+        response = client.put(
+            '/model/reservoir',
+            params={'object_name': 'test_res_compact'},
+            headers={"session-id": str(session_id_manager.session_id)},
+            json={'attributes': {'inflow': {'start': '2021-05-02T00:00:00Z', 'step': 3600, 'values': [[42.0, 50.0, 55.0]]}}}
+        )
+        assert response.status_code == 200
+
+        response = client.get(
+            '/model/reservoir',
+            params={'object_name': 'test_res_compact', 'timeFormat': 'epoch'},
+            headers={"session-id": str(session_id_manager.session_id)}
+        )
+        assert response.status_code == 200
+        inflow = TimeSeries(**response.json()['attributes']['inflow'])
+        assert inflow.epoch_timestamps[1] - inflow.epoch_timestamps[0] == 3600
+        assert inflow.values[0][:3] == [42.0, 50.0, 55.0]
+
+    def test_raw_array_writes_match_pyshop(self, client, session_id_manager, monkeypatch):
+        from core import config
+        headers = {"session-id": str(session_id_manager.session_id)}
+        attributes = {
+            'inflow': {'epoch_timestamps': [1619913600, 1619920800, 1619924400], 'values': [[42.0, 50.0, 55.0]]},
+            'vol_head': {'x_values': [10.0, 20.0, 30.0], 'y_values': [42.0, 43.0, 45.0]},
+            'water_value_input': {'0': {'x_values': [10.0, 9.0], 'y_values': [42.0, 20.0]}, '1.5': {'x_values': [1.0], 'y_values': [2.0]}},
+        }
+        for raw, object_name in [(True, 'test_res_raw'), (False, 'test_res_pyshop')]:
+            monkeypatch.setattr(config, 'RAW_ARRAY_WRITES', raw)
+            assert client.put('/model/reservoir', params={'object_name': object_name}, headers=headers, json={'attributes': attributes}).status_code == 200
+        raw, pyshop = [
+            client.get('/model/reservoir', params={'object_name': object_name}, headers=headers).json()['attributes']
+            for object_name in ('test_res_raw', 'test_res_pyshop')
+        ]
+        for attribute_name in attributes:
+            assert raw[attribute_name] == pyshop[attribute_name]
+
+    @requires_shop
+    @pytest.mark.parametrize('case', ['no_value', 'time_zone', 'early_start', 'late_end', 'time_resolution'])
+    def test_raw_array_writes_match_shop(self, monkeypatch, case):
+        from core import config, interface
+        start = pd.Timestamp('2021-01-02T00:00:00Z')
+        series_start, values, time_resolution = start, [42.0, 50.0, 55.0], None
+        if case == 'no_value':
+            values = [42.0, 1e40, 55.0]
+        elif case == 'time_zone':
+            start = series_start = pd.Timestamp('2021-01-02T00:00:00', tz='Europe/Oslo')
+        elif case == 'early_start':
+            series_start, values = start - pd.Timedelta(hours=2), [1.0, 2.0, 42.0, 50.0, 55.0]
+        elif case == 'late_end':
+            values = list(np.arange(30.0))
+        elif case == 'time_resolution':
+            time_resolution = TimeSeries(timestamps=[start, start + pd.Timedelta(hours=6)], values=[[1.0, 3.0]])
+        shop = shop_with_reservoirs(start, 24, time_resolution)
+        for raw, object_name in ((True, 'res_raw'), (False, 'res_pyshop')):
+            monkeypatch.setattr(config, 'RAW_ARRAY_WRITES', raw)
+            interface.set_txy(shop, 'reservoir', object_name, 'inflow', TimeSeries(start=series_start, step=3600, values=[values]))
+        assert read_inflow(shop, 'res_raw', monkeypatch, False) == read_inflow(shop, 'res_pyshop', monkeypatch, False)
+
+    @requires_shop
+    @pytest.mark.parametrize('case', ['no_value', 'time_zone', 'daylight_saving'])
+    def test_raw_array_reads_match_shop(self, monkeypatch, case):
+        from core import config, interface
+        start, hours = pd.Timestamp('2021-01-02T00:00:00Z'), 24
+        if case == 'time_zone':
+            start = pd.Timestamp('2021-01-02T00:00:00', tz='Europe/Oslo')
+        elif case == 'daylight_saving':
+            # crosses 2021-03-28 (no 02:00) and 2021-10-31 (02:00 twice)
+            start = pd.Timestamp('2021-03-27T00:00:00', tz='Europe/Oslo')
+            hours = int((pd.Timestamp('2021-11-01T00:00:00', tz='Europe/Oslo') - start) / pd.Timedelta(hours=1))
+        shop = shop_with_reservoirs(start, hours)
+        monkeypatch.setattr(config, 'RAW_ARRAY_WRITES', False)
+        values = [42.0, 1e40] + [55.0] * (hours - 2)
+        interface.set_txy(shop, 'reservoir', 'res_pyshop', 'inflow', TimeSeries(start=start, step=3600, values=[values]))
+        raw = read_inflow(shop, 'res_pyshop', monkeypatch, True)
+        assert raw['values'][0][1] is None
+        if case == 'daylight_saving':
+            # pyshop localizes the start and adds the offsets as elapsed time
+            assert raw['timestamps'] == iso_timestamps(pd.date_range(start, periods=hours, freq='h'))
+        else:
+            assert raw == read_inflow(shop, 'res_pyshop', monkeypatch, False)
+
+    def test_raw_txy_start_time(self, monkeypatch):
+        from types import SimpleNamespace
+        from core import config
+        from core.schemas import get_txy_raw
+        monkeypatch.setattr(config, 'RAW_ARRAY_READS', True)
+        shop_api = SimpleNamespace(
+            GetTxySeriesStartTime=lambda *args: '20210328000000000', # SHOP may add milliseconds
+            GetTxySeriesT=lambda *args: np.arange(4),
+            GetTxySeriesY=lambda *args: np.ones((4, 1)),
+            GetTimeUnit=lambda: 'hour',
+            GetTimeZone=lambda: 'Europe/Oslo',
+        )
+        nanoseconds, _ = get_txy_raw(SimpleNamespace(shop_api=shop_api), 'reservoir', 'r', 'inflow')
+        expected = pd.date_range(pd.Timestamp('2021-03-28T00:00:00', tz='Europe/Oslo'), periods=4, freq='h')
+        assert list(nanoseconds) == list(expected.values.astype('datetime64[ns]').view(np.int64))
+
+    def test_attribute_dispatch_tables(self):
+        from core.schemas import registry, attribute_readers, attribute_serializers
+        from core.interface import attribute_writers, set_datatype
+        for object_type, attribute_names in registry.attribute_names.items():
+            assert tuple(attribute_readers[object_type]) == attribute_names
+            assert tuple(attribute_serializers[object_type]) == attribute_names
+            for attribute_name, attribute in registry.attributes[object_type].items():
+                assert attribute_writers[object_type][attribute_name] is set_datatype(attribute.datatype)
+
+    def test_raw_array_reads_match_pyshop(self, client, session_id_manager, monkeypatch):
+        from core import config
+        headers = {"session-id": str(session_id_manager.session_id)}
+        params = {'objectType': 'reservoir', 'objectName': 'test_res_raw', 'isInput': True, 'compressTxy': True}
+        for timeFormat in ('iso', 'start_step', 'implicit'):
+            responses = []
+            for raw in (True, False):
+                monkeypatch.setattr(config, 'RAW_ARRAY_READS', raw)
+                responses.append(client.get('/model', params=dict(params, timeFormat=timeFormat), headers=headers))
+            assert responses[0].status_code == 200
+            assert responses[0].json() == responses[1].json()
+            assert responses[0].json()['model']['reservoir']['test_res_raw']['water_value_input']
+
+    def test_put_model_object_instances(self, client, session_id_manager):
+        headers = {"session-id": str(session_id_manager.session_id)}
+        instances = {
+            'test_res_bulk1': {'attributes': {'vol_head': {'x_values': [10.0, 20.0], 'y_values': [42.0, 43.0]}}},
+            'test_res_bulk2': {'attributes': {'max_vol': 12.0, 'not_an_attribute': 1.0}},
+            'test_res_raw': {'attributes': {'max_vol': 13.0}},
+            'test_res_bad_scalar': {'attributes': {'max_vol': {'x_values': [1.0], 'y_values': [2.0]}}},
+        }
+        response = client.put('/model/reservoir/instances', params={'return': 'minimal'}, headers=headers, json=instances)
+        assert response.status_code == 200
+        status = response.json()
+        assert (status['created'], status['updated'], status['failed']) == (1, 1, 2)
+        assert sorted(status['errors']) == ['test_res_bad_scalar', 'test_res_bulk2']
+        assert 'instances' not in status
+
+        response = client.put('/model/reservoir/instances', headers=headers, json={'test_res_bulk1': {'attributes': {'max_vol': 14.0}}})
+        assert response.status_code == 200
+        status = response.json()
+        assert (status['created'], status['updated'], status['failed']) == (0, 1, 0)
+        attributes = status['instances']['test_res_bulk1']['attributes']
+        assert attributes['max_vol'] == 14.0
+        assert attributes['vol_head']['y_values'] == [42.0, 43.0]
+
     # @pytest.mark.order(16)
     def test_get_connections_nonexistent(self, client, session_id_manager):
         response = client.get(
@@ -356,3 +607,344 @@ class TestMain:
         #         'relation_direction': 'both',
         #         'relation_type': 'de...: 'both', 'relation_type': 'connection_standard', 'to_object': {'object_name': 'r1', 'object_type': 'reservoir'}
 
+    def test_post_session_fork(self, client, session_id_manager):
+        headers = {"session-id": str(session_id_manager.session_id)}
+        response = client.post('/session/fork', headers=headers, json={'session_name': 'what-if'})
+        assert response.status_code == 200
+        fork = Session(**response.json())
+        assert fork.session_id != session_id_manager.session_id
+        assert fork.session_name == 'what-if'
+
+        fork_headers = {"session-id": str(fork.session_id)}
+        assert client.get('/model/reservoir?object_name=test_res', headers=fork_headers).json() == \
+            client.get('/model/reservoir?object_name=test_res', headers=headers).json()
+        assert client.get('/connections', headers=fork_headers).json() == client.get('/connections', headers=headers).json()
+        assert client.delete('/session', params={'session_id': fork.session_id}).status_code == 200
+
+    def test_spilled_session_is_restored(self, client, session_id_manager, tmp_path):
+        from core.spill import SessionSpiller
+        from core.sessions import SessionManager
+        headers = {"session-id": str(session_id_manager.session_id)}
+        fork = client.post('/session/fork', headers=headers).json()
+        fork_headers = {"session-id": str(fork['session_id'])}
+        expected = client.get('/model/reservoir?object_name=test_res', headers=fork_headers).json()
+
+        spiller = SessionSpiller(idle_seconds=0.001, spill_dir=str(tmp_path))
+        worker = SessionManager.get_shop_session('test_user', fork['session_id'])
+        time.sleep(0.01)
+        assert worker.spill(spiller)
+        assert worker.status == 'spilled'
+        assert os.path.exists(worker.spill_file)
+
+        assert client.get('/model/reservoir?object_name=test_res', headers=fork_headers).json() == expected
+        assert worker.status == 'ok'
+        stats = spiller.stats()
+        assert stats['spills'] == 1
+        assert stats['restores'] == 1
+        assert client.delete('/session', params={'session_id': fork['session_id']}).status_code == 200
+
+    def test_session_reaper_evicts_least_recently_used(self, client):
+        from core.reaper import SessionReaper
+        from core.sessions import SessionManager
+        ids = [client.post('/session').json()['session_id'] for _ in range(3)]
+        workers = [SessionManager.get_shop_session('test_user', session_id) for session_id in ids]
+        workers[0].last_used -= 100
+        workers[1].last_used -= 50
+        workers[0].pending_calls = 1 # mid-solve
+
+        reaper = SessionReaper(ttl_seconds=0, max_sessions=2, rss_budget_mb=0)
+        evicted = reaper.reap(lambda: [('test_user', worker) for worker in workers], SessionManager.remove_shop_session)
+        assert evicted == 1
+        sessions = SessionManager.get_shop_sessions('test_user')
+        assert ids[0] in sessions and ids[1] not in sessions and ids[2] in sessions
+        assert reaper.stats()['skipped_busy'] == 1
+
+        workers[0].pending_calls = 0
+        for session_id in (ids[0], ids[2]):
+            assert client.delete('/session', params={'session_id': session_id}).status_code == 200
+
+    # BENCHMARKS
+
+    def test_benchmark_watercourse(self, client):
+        from benchmarks.watercourse import generate_watercourse, object_count
+        body = generate_watercourse(reservoirs=3, steps=24)
+        assert object_count(body) == 3 + 3 + 6 + 1
+        headers = {'session-id': str(client.post('/session').json()['session_id'])}
+        assert client.put('/model', json=body, headers=headers).status_code == 200
+        model = client.get('/model', params={'isInput': True, 'isOutput': False}, headers=headers).json()['model']
+        assert len(model['reservoir']) == 3
+        assert len(model['reservoir']['Reservoir2']['inflow']['values'][0]) == 24
+        assert len(client.get('/connections', headers=headers).json()) >= len(body['connections'])
+        client.delete('/session', params={'session_id': headers['session-id']})
+
+    # TEMPLATES
+
+    def test_post_session_from_template(self, client):
+        response = client.put('/templates/test_template', json={
+            'time': {'start_time': '2021-05-02T00:00:00Z', 'end_time': '2021-05-03T00:00:00Z', 'time_unit': 'hour'},
+            'model': {
+                'reservoir': {'r1': {'max_vol': 12, 'lrl': 90, 'hrl': 100}},
+                'plant': {'p1': {'outlet_line': 40}}
+            },
+            'connections': [{'from': 'r1', 'from_type': 'reservoir', 'to': 'p1', 'to_type': 'plant'}]
+        })
+        assert response.status_code == 200
+        template = Template(**response.json())
+        assert template.object_count >= 2
+        assert template.connection_count == 1
+        assert 'test_template' in [t['template_id'] for t in client.get('/templates').json()]
+
+        response = client.post('/session', json={'session_name': 'from_template', 'template': 'test_template'})
+        assert response.status_code == 200
+        headers = {"session-id": str(response.json()['session_id'])}
+        response = client.get('/model/reservoir?object_name=r1', headers=headers)
+        assert response.status_code == 200
+        assert response.json()['attributes']['max_vol'] == 12
+        assert len(client.get('/connections', headers=headers).json()) > 0
+
+        assert client.post('/session', json={'template': 'missing'}).status_code == 404
+        assert client.delete('/templates/test_template').status_code == 200
+        assert client.delete('/session', params={'session_id': headers['session-id']}).status_code == 200
+
+    # JOBS
+
+    def test_post_simulation_command_asynchronous(self, client, session_id_manager):
+        response = client.post(
+            '/simulation/set_code',
+            params={'asynchronous': True},
+            headers={"session-id": str(session_id_manager.session_id)},
+            json={'options': ['incremental'], 'values': []}
+        )
+        assert response.status_code == 200
+        job = Job(**response.json())
+        assert job.session_id == session_id_manager.session_id
+        assert [c.command for c in job.commands] == ['set_code']
+
+        response = client.get(f'/jobs/{job.job_id}', params={'wait': 10})
+        assert response.status_code == 200
+        job = Job(**response.json())
+        assert job.status == 'finished'
+        assert job.commands[0].duration is not None
+
+    def test_get_jobs(self, client, session_id_manager):
+        response = client.get('/jobs', params={'session_id': session_id_manager.session_id})
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+
+    def test_session_locks_released(self, client, session_id_manager):
+        from core.jobs import JobManager
+        # the job from test_post_simulation_command_asynchronous is finished, nothing should keep its lock alive
+        assert not any(session_id == session_id_manager.session_id for _, session_id in JobManager.session_locks.keys())
+
+    def test_get_job_that_doesnt_exist(self, client, session_id_manager):
+        response = client.get('/jobs/4242')
+        assert response.status_code == 404
+        assert response.json() == {'detail': 'Job with id {4242} not found'}
+
+    def test_get_sessions_info(self, client, session_id_manager):
+        response = client.get('/sessions/info', params={'session_id': session_id_manager.session_id})
+        assert response.status_code == 200
+        info = SessionInfo(**response.json()[0])
+        assert info.session_id == session_id_manager.session_id
+        assert info.object_count > 0 and info.attribute_count > 0
+        assert info.call_count > 0
+        assert info.command_seconds > 0
+        assert info.current_call is None
+        assert client.get('/sessions/info', params={'session_id': 4242}).status_code == 404
+
+    def test_session_command_accounting(self):
+        import asyncio
+        from core import timing
+        from core.workers import ThreadShopSessionWorker
+        worker = ThreadShopSessionWorker(44, 'command_accounting')
+        current_calls = []
+        def upload_and_run(shop):
+            time.sleep(0.05) # like the model upload of set_model, not part of a command
+            with timing.command('start sim'):
+                current_calls.append(worker.current_call)
+        asyncio.run(worker.run(upload_and_run))
+        assert current_calls == ['upload_and_run start_sim']
+        assert worker.current_call is None
+        assert worker.command_seconds < 0.05 <= worker.call_seconds['upload_and_run']
+        worker.close()
+
+    def test_process_worker(self, monkeypatch):
+        import asyncio
+        from fastapi import HTTPException
+        from core import config, interface
+        from core.workers import create_shop_session_worker
+        # a fresh worker process reads its configuration from the environment
+        monkeypatch.setenv('RESTSHOP_SHOP_SESSION_CLASS', 'benchmarks.standin:ShopSession')
+        monkeypatch.setattr(config, 'WORKER_START_METHOD', 'spawn')
+        worker = create_shop_session_worker('process', 45, 'process_worker')
+        try:
+            assert worker.pid is not None and worker.pid != os.getpid()
+            assert asyncio.run(worker.run(type)).__module__ == 'benchmarks.standin'
+            time_resolution = TimeResolution(start_time='2021-01-01T00:00:00', end_time='2021-01-02T00:00:00', time_unit='hour')
+            asyncio.run(worker.run(interface.set_time_resolution, time_resolution))
+            assert asyncio.run(worker.run(interface.get_time_resolution_model)).start_time == time_resolution.start_time
+
+            # exceptions raised in the worker process come back as HTTPException
+            bad_time_resolution = TimeResolution(start_time='2021-01-02T00:00:00', end_time='2021-01-01T00:00:00', time_unit='hour')
+            with pytest.raises(HTTPException) as e:
+                asyncio.run(worker.run(interface.set_time_resolution, bad_time_resolution))
+            assert (e.value.status_code, e.value.detail) == (400, 'end_time must be strictly greater than start_time')
+            with pytest.raises(HTTPException) as e:
+                asyncio.run(worker.run(getattr, 'no_such_attribute'))
+            assert e.value.status_code == 500 and 'Internal Exception: AttributeError' in e.value.detail
+            assert worker.status == 'ok'
+
+            # a worker process that dies is restarted, its model is gone
+            worker._process.kill()
+            assert wait_for(lambda: worker.pid is None)
+            with pytest.raises(HTTPException) as e:
+                asyncio.run(worker.run(interface.get_time_resolution_model))
+            assert e.value.status_code == 500 and 'restarted with an empty model' in e.value.detail
+            assert worker.restarts == 1 and worker.status == 'failed'
+            assert asyncio.run(worker.run(interface.is_time_resolution_set)) is False
+        finally:
+            worker.close()
+
+    # METRICS
+
+    def test_get_metrics(self, client, session_id_manager):
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+        text = response.text
+        assert 'restshop_http_request_duration_seconds_bucket{method="POST",route="/session",status="200",le="+Inf"}' in text
+        assert 'restshop_shop_command_duration_seconds_count{command="set_code"}' in text
+        assert 'restshop_serialize_duration_seconds_count{format="json"}' in text
+        assert 'restshop_sessions{status="ok"}' in text
+
+        # commands run through /jobs are counted per command as well
+        response = client.post(
+            '/jobs',
+            headers={"session-id": str(session_id_manager.session_id)},
+            json=[{'command': 'set method', 'options': ['primal', 'dual'], 'values': []}]
+        )
+        assert response.status_code == 200
+        job = Job(**client.get(f'/jobs/{response.json()["job_id"]}', params={'wait': 10}).json())
+        assert job.status == 'finished'
+        assert 'restshop_shop_command_duration_seconds_count{command="set_method"}' in client.get('/metrics').text
+
+    def test_server_timing(self, client, session_id_manager):
+        headers = {'session-id': str(session_id_manager.session_id)}
+        response = client.get('/model/reservoir?object_name=test_res', headers=headers)
+        assert response.status_code == 200
+        phases = {entry.split(';')[0].strip(): float(entry.split('dur=')[1].split(';')[0]) for entry in response.headers['server-timing'].split(',')}
+        assert {'shop', 'convert', 'encode', 'total'} <= set(phases)
+        assert phases['shop'] + phases['convert'] + phases['encode'] <= phases['total']
+        response = client.put('/model/reservoir?object_name=test_res', headers=headers, json={'attributes': {'max_vol': 12.0}})
+        assert 'parse' in response.headers['server-timing']
+
+    def test_profile_request(self, client, session_id_manager, monkeypatch, tmp_path):
+        from core import config
+        headers = {'session-id': str(session_id_manager.session_id)}
+        assert 'x-restshop-profile-id' not in client.get('/model/reservoir?object_name=test_res&profile=true', headers=headers).headers
+        monkeypatch.setattr(config, 'PROFILING_ENABLED', True)
+        monkeypatch.setattr(config, 'PROFILE_DIR', str(tmp_path))
+        response = client.get('/model/reservoir?object_name=test_res', headers=dict(headers, **{'x-restshop-profile': '1'}))
+        assert response.status_code == 200
+        profile_id = response.headers['x-restshop-profile-id']
+        assert [p['profile_id'] for p in client.get('/profiles').json()] == [profile_id]
+        # the call into the session is part of the profile
+        assert 'get_model_object_instance_dict' in client.get(f'/profiles/{profile_id}', params={'limit': 200}).text
+        assert client.get(f'/profiles/{profile_id}', params={'format': 'pstats'}).content
+        assert client.get('/profiles/000000000000').status_code == 404
+
+    # LOGGING
+
+    def test_get_logging_stats(self, client):
+        response = client.get('/logging/stats')
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats['endpoint'] == ''
+        assert stats['dropped'] == 0
+
+    def test_log_forwarder_batches(self):
+        endpoint = StubLogEndpoint()
+        forwarder = log_forwarder(endpoint, batch=True, batch_size=3, flush_interval=1.0)
+        for i in range(3):
+            forwarder.submit('INFO', f'message {i}', 'log_id')
+        assert wait_for(lambda: forwarder.stats()['sent'] == 3)
+        assert endpoint.payloads == [[{'level': 'INFO', 'message': f'message {i}', 'id': 'log_id'} for i in range(3)]]
+        assert forwarder.stats()['requests'] == 1
+
+        endpoint = StubLogEndpoint()
+        forwarder = log_forwarder(endpoint, batch=False, batch_size=3, flush_interval=0.05)
+        forwarder.submit('INFO', 'message', 'log_id')
+        assert wait_for(lambda: forwarder.stats()['sent'] == 1)
+        assert endpoint.payloads == [{'level': 'INFO', 'message': 'message', 'id': 'log_id'}]
+
+    def test_log_forwarder_retries(self):
+        import requests
+        endpoint = StubLogEndpoint(requests.ConnectionError('connection refused'), 500)
+        forwarder = log_forwarder(endpoint, batch=True, batch_size=1, max_retries=2)
+        forwarder.submit('ERROR', 'message', 'log_id')
+        assert wait_for(lambda: forwarder.stats()['sent'] == 1)
+        stats = forwarder.stats()
+        assert stats['requests'] == 3 and stats['retries'] == 2 and stats['failed'] == 0
+        assert len(endpoint.payloads) == 3
+
+        # a message is given up on after max_retries
+        endpoint = StubLogEndpoint(500, 500)
+        forwarder = log_forwarder(endpoint, batch=True, batch_size=1, max_retries=1)
+        forwarder.submit('ERROR', 'message', 'log_id')
+        assert wait_for(lambda: forwarder.stats()['failed'] == 1)
+        assert forwarder.stats()['sent'] == 0
+
+    def test_log_forwarder_overflow(self):
+        endpoint = StubLogEndpoint()
+        endpoint.release.clear()
+        forwarder = log_forwarder(endpoint, batch=True, batch_size=1, max_queue_size=4, sample_rate=2)
+        forwarder.submit('INFO', 'message 0', 'log_id')
+        # the first message is being sent and the endpoint does not answer, the rest has to wait in the queue
+        assert endpoint.posting.wait(5)
+        for i in range(1, 9):
+            forwarder.submit('INFO', f'message {i}', 'log_id')
+        forwarder.submit('ERROR', 'error', 'log_id')
+        stats = forwarder.stats()
+        assert stats['queued'] == 4
+        assert stats['sampled_out'] > 0 and stats['dropped'] > 0
+        assert stats['enqueued'] + stats['sampled_out'] + stats['dropped'] == 10
+
+        endpoint.release.set()
+        assert wait_for(lambda: forwarder.stats()['sent'] == forwarder.stats()['enqueued'])
+        assert forwarder.stats()['queued'] == 0
+
+    def test_get_session_pool_stats(self, client):
+        response = client.get('/sessions/pool')
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats['hits'] + stats['misses'] >= 2
+
+    def test_session_pool(self):
+        import time
+        from core.pool import SessionPool
+        pool = SessionPool(size=1, backend='thread')
+        pool.start()
+        for _ in range(100):
+            if pool.stats()['available'] == 1:
+                break
+            time.sleep(0.05)
+        worker = pool.acquire(42, 'pooled_session', pool.log_file, backend='thread')
+        assert worker.id == 42
+        assert worker.shop_session._name == 'pooled_session'
+        assert pool.acquire(43, 'other_log_file', 'other.py', backend='thread') is None
+        stats = pool.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        worker.close()
+
+    # METADATA
+
+    def test_metadata_cache(self, tmp_path):
+        from core.metadata import load_metadata
+        probes = []
+        def probe():
+            probes.append(1)
+            return {'object_types': ['reservoir']}
+        assert load_metadata(probe, str(tmp_path)) == {'object_types': ['reservoir']}
+        assert load_metadata(probe, str(tmp_path)) == {'object_types': ['reservoir']}
+        assert len(probes) == 1